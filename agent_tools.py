@@ -0,0 +1,106 @@
+from typing import List, Dict
+from langchain_core.tools import tool
+from calendar_tools import (
+    create_calendar_event,
+    get_all_events,
+    get_recurring_occurrences,
+    get_calendars,
+    get_events_across_calendars,
+    find_event_by_subject,
+    update_calendar_event,
+    delete_calendar_event,
+    delete_multiple_events,
+    bulk_reschedule_events,
+    add_attendees_to_event,
+    remove_attendees_from_event,
+    update_event_location,
+    find_people,
+)
+from meeting_analytics import analyze_meetings
+
+# The agent's tools, shared by both apps and by bench_prompt_tokens.py.
+# Their names, docstrings and argument schemas are sent to the model on every call.
+
+# Static so the provider-side prompt cache stays valid; put per-turn details in the messages
+SYSTEM_PROMPT = (
+    "You manage the signed-in user's Microsoft Outlook calendar with the tools provided. "
+    "Refer to events by the handles (E1, E2, ...) shown in earlier tool results. "
+    "Use ISO 8601 date-times, and ask when a request is ambiguous instead of guessing."
+)
+
+@tool
+def create_event(subject: str, start_time: str, end_time: str, attendees: List[str] = None, body: str = "", calendar: str = None):
+    """Creates a calendar event. Parameters: subject (event title), start_time (ISO format like '2025-09-01T14:00:00'), end_time (ISO format), attendees (optional list of email addresses or people's names), body (optional description), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar)."""
+    return create_calendar_event(subject, start_time, end_time, attendees, body, calendar)
+
+@tool
+def get_events(time_window: Dict[str, str], expand_recurring: bool = True, calendar: str = None):
+    """Gets ALL events in a time period. Use when user asks 'what events do I have today/this week/etc'. Parameters: time_window dict with 'start' and 'end' in ISO format, expand_recurring (optional, default true: list each occurrence of recurring meetings), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar). Example: {'start': '2025-01-23T00:00:00', 'end': '2025-01-23T23:59:59'}"""
+    return get_all_events(time_window, expand_recurring, calendar)
+
+@tool
+def get_recurring(time_window: Dict[str, str], subject: str = None):
+    """Lists occurrences of recurring meetings (e.g. 'when is my weekly 1:1 next month'). Parameters: time_window (dict with 'start' and 'end' in ISO format), subject (optional series title prefix)."""
+    return get_recurring_occurrences(time_window, subject)
+
+@tool
+def list_calendars():
+    """Lists the user's calendars, including shared and delegated ones, with their IDs."""
+    return get_calendars()
+
+@tool
+def get_events_multi(time_window: Dict[str, str], calendars: List[str]):
+    """Gets events from several calendars at once in one time-ordered list. Parameters: time_window (dict with 'start' and 'end' in ISO format), calendars (list of calendar IDs or shared mailbox emails; use '' for your own calendar)."""
+    return get_events_across_calendars(time_window, calendars)
+
+@tool
+def find_event(subject: str, time_window: Dict[str, str], calendar: str = None):
+    """Finds events by subject/title. Use when user mentions a specific event name. Parameters: subject (event title to search), time_window (dict with 'start' and 'end' in ISO format), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar)."""
+    return find_event_by_subject(subject, time_window, calendar)
+
+@tool
+def update_event(event_id: str, new_start_time: str = None, new_end_time: str = None, new_subject: str = None, new_body: str = None, new_location: str = None, calendar: str = None):
+    """Updates event details. Parameters: event_id (handle like 'E3' from any listing, the event's subject, or its ID), new_start_time (optional ISO format), new_end_time (optional), new_subject (optional), new_body (optional), new_location (optional), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar)."""
+    return update_calendar_event(event_id, new_start_time, new_end_time, new_subject, new_body, new_location, calendar)
+
+@tool
+def reschedule_events(time_window: Dict[str, str], offset_minutes: int = None, target_date: str = None, day_mapping: Dict[str, str] = None, subject_filter: str = None, attendee_filter: str = None, dry_run: bool = False, calendar: str = None, timezone: str = None):
+    """Moves many events at once, e.g. 'move all my Friday meetings to Monday' or 'push everything this afternoon by 30 minutes'. Parameters: time_window (dict with 'start' and 'end' in ISO format selecting the events, local time in timezone), offset_minutes (optional shift), target_date (optional 'YYYY-MM-DD' day to move them to), day_mapping (optional {'old day': 'new day'}), subject_filter (optional), attendee_filter (optional email or name), dry_run (true to only show the plan), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar), timezone (optional IANA zone like 'Europe/Berlin' for day boundaries)."""
+    return bulk_reschedule_events(time_window, offset_minutes, target_date, day_mapping, subject_filter, attendee_filter, dry_run, calendar, timezone)
+
+@tool
+def add_attendees(event_id: str, attendee_emails: List[str], calendar: str = None):
+    """Adds attendees to an existing event. Parameters: event_id (handle like 'E3' from any listing, the event's subject, or its ID), attendee_emails (list of email addresses or people's names), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar)."""
+    return add_attendees_to_event(event_id, attendee_emails, calendar)
+
+@tool
+def remove_attendees(event_id: str, attendee_emails: List[str], calendar: str = None):
+    """Removes attendees from an existing event. Parameters: event_id (handle like 'E3' from any listing, the event's subject, or its ID), attendee_emails (list of email addresses or names to remove), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar)."""
+    return remove_attendees_from_event(event_id, attendee_emails, calendar)
+
+@tool
+def set_location(event_id: str, location: str, calendar: str = None):
+    """Sets or updates the location of an event. Parameters: event_id (handle like 'E3' from any listing, the event's subject, or its ID), location (location name/address), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar)."""
+    return update_event_location(event_id, location, calendar)
+
+@tool
+def delete_event(event_id: str, calendar: str = None):
+    """Deletes a single event. Parameters: event_id (handle like 'E3' from any listing, the event's subject, or its ID), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar)."""
+    return delete_calendar_event(event_id, calendar)
+
+@tool
+def delete_multiple(event_ids: List[str]):
+    """Deletes multiple events at once. Parameter: event_ids (list of event handles or IDs from a listing). Example: ["E1", "E2"]"""
+    return delete_multiple_events(event_ids)
+
+@tool
+def lookup_people(name: str):
+    """Finds people's email addresses by (partial) name among contacts and meeting partners. Use when the user names someone and you need their address or must pick between several matches. Parameter: name (e.g. 'Priya' or 'priya sh')."""
+    return find_people(name)
+
+@tool
+def meeting_stats(time_window: Dict[str, str], metrics: List[str] = None, group_by: str = "week", calendar: str = None, timezone: str = None):
+    """Computes meeting statistics over any period, even years: hours of meetings per day/week/month, double-booked time, who the user meets most and free focus-time blocks. Use this instead of get_events for questions like 'how many hours of meetings per week this quarter' or 'who do I meet most'. Parameters: time_window (dict with 'start' and 'end' in ISO format, local time in timezone), metrics (optional subset of ['load', 'overlap', 'attendees', 'focus']), group_by ('day', 'week' or 'month'), calendar (optional calendar ID from list_calendars or shared mailbox email; omit for your own calendar), timezone (optional IANA zone like 'Europe/Berlin' for day boundaries)."""
+    return analyze_meetings(time_window, metrics, group_by, calendar, timezone)
+
+TOOLS = [create_event, get_events, get_recurring, list_calendars, get_events_multi, find_event, update_event, delete_event, delete_multiple, reschedule_events, add_attendees, remove_attendees, set_location, lookup_people, meeting_stats]
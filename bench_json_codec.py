@@ -0,0 +1,110 @@
+"""
+Micro-benchmark of the JSON work done per agent turn: parsing calendarView pages,
+building $batch bodies and listing event IDs, with the stdlib json module and with
+orjson (when installed).
+
+    python bench_json_codec.py [events per page] [pages]
+"""
+import sys
+import json
+import time
+import random
+import string
+import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+import json_codec
+
+def _id():
+    return "AAMkAG" + "".join(random.choices(string.ascii_letters + string.digits, k=146)) + "="
+
+def _person(i):
+    name = f"Person {i} Ünicode-Łast"
+    return {"name": name, "address": f"person{i}@contoso.onmicrosoft.com"}
+
+def make_page(events_per_page):
+    """A calendarView page shaped like Graph's (all default properties, 3-15 attendees)."""
+    start = datetime.datetime(2025, 9, 1, 8, 0)
+    events = []
+    for i in range(events_per_page):
+        begins = start + datetime.timedelta(minutes=30 * i)
+        events.append({
+            "@odata.etag": 'W/"' + _id()[:40] + '"',
+            "id": _id(),
+            "createdDateTime": "2025-08-20T10:21:34.1234567Z",
+            "lastModifiedDateTime": "2025-08-21T08:02:11.7654321Z",
+            "changeKey": _id()[:40],
+            "categories": ["Blue category"],
+            "iCalUId": "040000008200E00074C5B7101A82E008" + "0" * 80,
+            "subject": f"Weekly sync #{i} – planning & review",
+            "bodyPreview": "Agenda: status, risks, next steps. " * 4,
+            "importance": "normal",
+            "sensitivity": "normal",
+            "isAllDay": False,
+            "isCancelled": False,
+            "isOrganizer": i % 3 == 0,
+            "responseRequested": True,
+            "showAs": "busy",
+            "type": "singleInstance",
+            "webLink": "https://outlook.office365.com/owa/?itemid=" + _id() + "&exvsurl=1&path=/calendar/item",
+            "onlineMeetingUrl": None,
+            "isOnlineMeeting": True,
+            "responseStatus": {"response": "accepted", "time": "2025-08-20T10:25:00Z"},
+            "body": {"contentType": "html", "content": "<html><body><p>" + "Meeting notes. " * 40 + "</p></body></html>"},
+            "start": {"dateTime": begins.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": "UTC"},
+            "end": {"dateTime": (begins + datetime.timedelta(minutes=30)).strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": "UTC"},
+            "location": {"displayName": f"Room {300 + i % 20}", "locationType": "default"},
+            "attendees": [
+                {"type": "required", "status": {"response": "none", "time": "0001-01-01T00:00:00Z"}, "emailAddress": _person(j)}
+                for j in range(random.randint(3, 15))
+            ],
+            "organizer": {"emailAddress": _person(0)},
+        })
+    return {"@odata.context": "https://graph.microsoft.com/v1.0/$metadata#users('me')/calendarView", "value": events}
+
+def _time(func, repeat):
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        best = min(best, (time.perf_counter() - started) / repeat)
+    return best * 1e6
+
+def main():
+    events_per_page = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    random.seed(7)
+    page_objects = [make_page(events_per_page) for _ in range(pages)]
+    page_bytes = [json.dumps(page).encode("utf-8") for page in page_objects]
+    event_ids = [event["id"] for page in page_objects for event in page["value"]]
+    batch = {"requests": [
+        {"id": str(i), "method": "PATCH", "url": f"/me/events/{event_id}",
+         "headers": {"Content-Type": "application/json"},
+         "body": {"start": {"dateTime": "2025-09-02T09:00:00", "timeZone": "UTC"},
+                  "end": {"dateTime": "2025-09-02T09:30:00", "timeZone": "UTC"}}}
+        for i, event_id in enumerate(event_ids[:20])
+    ]}
+
+    codecs = {"json (stdlib, via str)": (
+        lambda data: json.loads(data.decode("utf-8")),
+        lambda obj: json.dumps(obj).encode("utf-8"),
+    )}
+    if orjson is not None:
+        codecs["orjson"] = (orjson.loads, orjson.dumps)
+
+    size = sum(len(data) for data in page_bytes) / 1024
+    print(f"{pages} page(s) x {events_per_page} events, {size:.0f} KiB; active codec: {json_codec.NAME}\n")
+    print(f"{'codec':<24}{'parse pages':>14}{'batch body':>14}{'id list':>12}   (µs, best of 5)")
+    for name, (loads, dumps) in codecs.items():
+        parse = _time(lambda: [loads(data) for data in page_bytes], 20)
+        body = _time(lambda: dumps(batch), 500)
+        ids = _time(lambda: dumps(event_ids).decode("utf-8"), 500)
+        print(f"{name:<24}{parse:>14.0f}{body:>14.1f}{ids:>12.1f}")
+
+if __name__ == "__main__":
+    main()
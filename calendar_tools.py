@@ -1,13 +1,120 @@
-import requests
+import os
+import graph_client
+import datetime
+import heapq
+import queue
+import threading
+import contextvars
+import inspect
+import functools
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dotenv import load_dotenv
 from graph_api_auth import get_access_token
-import json
+from tool_executor import serialized, run_parallel
+from response_cache import cached_read, invalidates, mark_changed
+import recurrence
+import prefetch
+import outbox
+import event_handles
+import people_directory
+import json_codec
+
+load_dotenv()
 
 GRAPH_API_ENDPOINT = 'https://graph.microsoft.com/v1.0'
+GRAPH_BATCH_SIZE = 20  # Graph's limit per $batch request
+EVENT_LOOKUP_DAYS = 30
+# Pages of each calendar fetched ahead of the merge in iter_events_across_calendars
+CALENDAR_STREAM_PAGES = int(os.getenv("CALENDAR_STREAM_PAGES", "4"))
+# IANA zone the user's days are counted in when a tool is not given one
+CALENDAR_TIMEZONE = os.getenv("CALENDAR_TIMEZONE", "UTC")
+
+def _format_events(events, calendar=None):
+    event_ids = [event['id'] for event in events if event.get('id')]
+    handles = event_handles.remember(events, calendar)
+    people_directory.observe(events)
+    result = f"Found {len(events)} event(s). Event IDs: {json_codec.dumps_str(event_ids)}\n\n"
+    for event in events:
+        result += f"📅 {event['subject']}\n"
+        if event.get('id'):
+            result += f"   Handle: {handles[event['id']]}\n"
+        if event.get('_calendar'):
+            result += f"   Calendar: {event['_calendar']}\n"
+        if event.get('id'):
+            result += f"   ID: {event['id']}\n"
+        else:
+            result += f"   Series ID: {event['seriesMasterId']} (occurrence of a recurring series)\n"
+        result += f"   Start: {event['start']['dateTime']}\n"
+        result += f"   End: {event['end']['dateTime']}\n"
+        if event.get('location', {}).get('displayName'):
+            result += f"   Location: {event['location']['displayName']}\n"
+        if event.get('attendees'):
+            attendees = [a['emailAddress']['address'] for a in event['attendees']]
+            result += f"   Attendees: {', '.join(attendees)}\n"
+        result += "\n"
+    return result
+
+def _calendar_path(calendar=None):
+    """
+    Graph path of a calendar: the signed-in user's default calendar when empty, another
+    user's or a shared mailbox's default calendar for an email address, else a calendar ID.
+    """
+    if not calendar:
+        return "/me"
+    if "@" in calendar:
+        return f"/users/{calendar}"
+    return f"/me/calendars/{calendar}"
+
+def _events_url(calendar=None, event_id=None):
+    url = f"{GRAPH_API_ENDPOINT}{_calendar_path(calendar)}/events"
+    return f"{url}/{event_id}" if event_id else url
+
+def _iter_pages(url, headers, params=None):
+    """Yields the items of each page of a Graph collection, following @odata.nextLink."""
+    while url:
+        response = graph_client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            raise Exception(f"Failed to get events: {response.text}")
+        page = json_codec.loads(response.content)
+        yield page.get('value', [])
+        # nextLink already carries the query
+        url = page.get('@odata.nextLink')
+        params = None
 
-def create_calendar_event(subject, start_time, end_time, attendees=None, body=""):
+def _fetch_all(url, headers, params=None):
+    """Returns the items of every page of a Graph collection, following @odata.nextLink."""
+    items = []
+    for page in _iter_pages(url, headers, params):
+        items.extend(page)
+    return items
+
+def _calendar_view_request(time_window, access_token, calendar=None):
+    headers = {
+        'Authorization': 'Bearer ' + access_token,
+        'Content-Type': 'application/json',
+        'Prefer': 'outlook.timezone="UTC"'
+    }
+    params = {
+        "startDateTime": time_window['start'],
+        "endDateTime": time_window['end'],
+        "$orderby": "start/dateTime",
+        "$top": 100
+    }
+    return f"{GRAPH_API_ENDPOINT}{_calendar_path(calendar)}/calendarView", headers, params
+
+def _calendar_view(time_window, access_token, calendar=None):
+    """Returns every event instance overlapping the window, with times in UTC."""
+    return _fetch_all(*_calendar_view_request(time_window, access_token, calendar))
+
+@invalidates
+def create_calendar_event(subject, start_time, end_time, attendees=None, body="", calendar=None):
     """
-    Creates a new event in the Outlook Calendar.
+    Creates a new event in the Outlook Calendar. Attendees may be given by name.
     """
+    try:
+        attendees = people_directory.resolve_all(attendees)
+    except people_directory.UnresolvedName as unresolved:
+        return f"{unresolved} The event was not created."
     access_token = get_access_token()
     headers = {
         'Authorization': 'Bearer ' + access_token,
@@ -22,65 +129,63 @@ def create_calendar_event(subject, start_time, end_time, attendees=None, body=""
         "body": {"contentType": "HTML", "content": body or ""}
     }
     
-    response = requests.post(
-        f"{GRAPH_API_ENDPOINT}/me/events",
+    response = graph_client.post(
+        _events_url(calendar),
         headers=headers,
-        data=json.dumps(event_data)
+        data=json_codec.dumps(event_data)
     )
     
     if response.status_code == 201:
-        event = response.json()
+        event = json_codec.loads(response.content)
         return f"✅ Event '{subject}' created successfully from {start_time} to {end_time}. Event ID: {event['id']}"
     else:
         raise Exception(f"Failed to create event: {response.text}")
 
-def get_all_events(time_window):
-    """
-    Gets all events within a given time window.
-    """
+@cached_read
+def _list_events(time_window, expand_recurring=False, calendar=None):
     access_token = get_access_token()
     headers = {
         'Authorization': 'Bearer ' + access_token,
         'Content-Type': 'application/json'
     }
     
+    if expand_recurring:
+        # The upcoming days are usually already warm from the post sign-in prefetch
+        events = None if calendar else prefetch.lookup(time_window)
+        if events is not None:
+            return events
+        return _calendar_view(time_window, access_token, calendar)
+    
     params = {
         "$filter": f"start/dateTime ge '{time_window['start']}' and end/dateTime le '{time_window['end']}'",
         "$orderby": "start/dateTime"
     }
     
-    response = requests.get(
-        f"{GRAPH_API_ENDPOINT}/me/events",
+    response = graph_client.get(
+        _events_url(calendar),
         headers=headers,
         params=params
     )
     
     if response.status_code == 200:
-        events = response.json().get('value', [])
-        if not events:
-            return "No events found for this time period."
-        
-        event_ids = [event['id'] for event in events]
-        result = f"Found {len(events)} event(s). Event IDs: {json.dumps(event_ids)}\n\n"
-        for event in events:
-            result += f"📅 {event['subject']}\n"
-            result += f"   ID: {event['id']}\n"
-            result += f"   Start: {event['start']['dateTime']}\n"
-            result += f"   End: {event['end']['dateTime']}\n"
-            if event.get('location', {}).get('displayName'):
-                result += f"   Location: {event['location']['displayName']}\n"
-            if event.get('attendees'):
-                attendees = [a['emailAddress']['address'] for a in event['attendees']]
-                result += f"   Attendees: {', '.join(attendees)}\n"
-            result += "\n"
-        return result
+        return json_codec.loads(response.content).get('value', [])
     else:
         raise Exception(f"Failed to get events: {response.text}")
 
-def find_event_by_subject(subject, time_window):
+def get_all_events(time_window, expand_recurring=False, calendar=None):
     """
-    Finds an event by its subject within a given time window. Returns event IDs for deletion.
+    Gets all events within a given time window. With expand_recurring, recurring series
+    are returned as their individual occurrences (calendarView) instead of series masters.
     """
+    outbox.flush_pending()
+    # The events are cached rather than the text, so every answer registers its handles
+    events = _list_events(time_window, expand_recurring, calendar)
+    if not events:
+        return "No events found for this time period."
+    return _format_events(events, calendar)
+
+@cached_read
+def _find_events(subject, time_window, calendar=None):
     access_token = get_access_token()
     headers = {
         'Authorization': 'Bearer ' + access_token,
@@ -91,44 +196,284 @@ def find_event_by_subject(subject, time_window):
         "$filter": f"startsWith(subject, '{subject}') and start/dateTime ge '{time_window['start']}' and end/dateTime le '{time_window['end']}'"
     }
     
-    response = requests.get(
-        f"{GRAPH_API_ENDPOINT}/me/events",
+    response = graph_client.get(
+        _events_url(calendar),
         headers=headers,
         params=params
     )
     
     if response.status_code == 200:
-        events = response.json().get('value', [])
-        if not events:
-            return "No events found matching your criteria."
-        
-        event_ids = [event['id'] for event in events]
-        result = f"Found {len(events)} event(s). Event IDs: {json.dumps(event_ids)}\n\n"
-        for event in events:
-            result += f"📅 {event['subject']}\n"
-            result += f"   ID: {event['id']}\n"
-            result += f"   Start: {event['start']['dateTime']}\n"
-            result += f"   End: {event['end']['dateTime']}\n"
-            if event.get('location', {}).get('displayName'):
-                result += f"   Location: {event['location']['displayName']}\n"
-            if event.get('attendees'):
-                attendees = [a['emailAddress']['address'] for a in event['attendees']]
-                result += f"   Attendees: {', '.join(attendees)}\n"
-            result += "\n"
-        return result
+        return json_codec.loads(response.content).get('value', [])
     else:
         raise Exception(f"Failed to find event: {response.text}")
 
-def update_calendar_event(event_id, new_start_time=None, new_end_time=None, new_subject=None, new_body=None, new_location=None):
+def find_event_by_subject(subject, time_window, calendar=None):
     """
-    Updates an existing event in the Outlook Calendar.
+    Finds an event by its subject within a given time window. Returns event IDs for deletion.
+    """
+    outbox.flush_pending()
+    events = _find_events(subject, time_window, calendar)
+    if not events:
+        return "No events found matching your criteria."
+    return _format_events(events, calendar)
+
+def get_calendars():
+    """
+    Lists the calendars the user can see, including ones shared with or delegated to them.
     """
     access_token = get_access_token()
     headers = {
         'Authorization': 'Bearer ' + access_token,
         'Content-Type': 'application/json'
     }
+    calendars = _fetch_all(f"{GRAPH_API_ENDPOINT}/me/calendars", headers, {"$top": 100})
+    if not calendars:
+        return "No calendars found."
+    result = f"Found {len(calendars)} calendar(s).\n\n"
+    for calendar in calendars:
+        owner = (calendar.get('owner') or {}).get('address', '')
+        result += f"🗓️ {calendar['name']}{' (default)' if calendar.get('isDefaultCalendar') else ''}\n"
+        result += f"   ID: {calendar['id']}\n"
+        if owner:
+            result += f"   Owner: {owner}\n"
+        result += "\n"
+    return result
+
+def _offer(pages, item, stop):
+    """Puts an item on a stream's bounded queue; False once the consumer has stopped reading."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _stream_calendar(time_window, access_token, calendar, pages, errors, stop):
+    try:
+        for page in _iter_pages(*_calendar_view_request(time_window, access_token, calendar)):
+            for event in page:
+                event['_calendar'] = calendar
+            if not _offer(pages, page, stop):
+                return
+    except Exception as e:
+        errors[calendar] = str(e)
+    _offer(pages, None, stop)
+
+def _drain(pages):
+    while True:
+        page = pages.get()
+        if page is None:
+            return
+        yield from page
+
+def iter_events_across_calendars(time_window, calendars, errors=None):
+    """
+    Yields the event instances of several calendars or mailboxes in one start-time order.
+    Every calendar is paged concurrently and the per-calendar streams, already sorted by
+    Graph, are k-way merged, so events are yielded while slower calendars are still paging.
+    Calendars that fail are skipped and their error is stored in errors. Each stream buffers
+    at most CALENDAR_STREAM_PAGES pages, and paging stops when the caller stops iterating.
+    """
+    access_token = get_access_token()
+    errors = {} if errors is None else errors
+    stop = threading.Event()
+    streams = []
+    for calendar in calendars:
+        pages = queue.Queue(maxsize=CALENDAR_STREAM_PAGES)
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run,
+            args=(_stream_calendar, time_window, access_token, calendar, pages, errors, stop),
+            name="calendar-stream",
+            daemon=True
+        ).start()
+        streams.append(_drain(pages))
+    try:
+        yield from heapq.merge(*streams, key=lambda event: event['start']['dateTime'])
+    finally:
+        stop.set()
+
+@cached_read
+def _merge_calendars(time_window, calendars):
+    errors = {}
+    events = list(iter_events_across_calendars(time_window, calendars, errors))
+    return events, errors
+
+def get_events_across_calendars(time_window, calendars):
+    """
+    Gets the events of several calendars in one time-ordered list. calendars holds calendar IDs
+    or email addresses of shared/delegated mailboxes; an empty string is the user's own calendar.
+    """
+    outbox.flush_pending()
+    events, errors = _merge_calendars(time_window, [calendar or "" for calendar in calendars])
+    result = _format_events(events) if events else "No events found for this time period.\n"
+    for calendar, error in errors.items():
+        result += f"\n❌ {calendar or 'primary'}: {error}"
+    return result
+
+def _fetch_series_masters():
+    access_token = get_access_token()
+    headers = {
+        'Authorization': 'Bearer ' + access_token,
+        'Content-Type': 'application/json'
+    }
+    params = {"$filter": "type eq 'seriesMaster'", "$top": 100}
+    return _fetch_all(f"{GRAPH_API_ENDPOINT}/me/events", headers, params)
+
+def get_recurring_occurrences(time_window, subject=None):
+    """
+    Lists occurrences of recurring series in a time window. Series masters are cached,
+    so any window is expanded locally without another Graph call.
+    """
+    outbox.flush_pending()
+    masters = recurrence.get_series_masters(_fetch_series_masters)
+    if subject:
+        masters = [m for m in masters if m.get('subject', '').lower().startswith(subject.lower())]
+    occurrences = recurrence.expand_window(
+        masters,
+        recurrence.parse_datetime(time_window['start']),
+        recurrence.parse_datetime(time_window['end'])
+    )
+    if not occurrences:
+        return "No recurring events found for this time period."
+    return _format_events(occurrences)
+
+def _looks_like_event_id(reference):
+    # Graph event IDs are long opaque base64 strings
+    return len(reference) >= 40 and " " not in reference
+
+def _resolve_event(reference, calendar=None):
+    """
+    Turns an event handle (E3), subject or raw ID into (Graph event ID, calendar). Handles
+    and subjects of listed events resolve locally, to the calendar they were listed from
+    unless one is given; Graph is asked only when the reference is unknown or matches
+    several remembered events.
+    """
+    reference = reference.strip()
+    local_ambiguity = None
+    try:
+        resolved = event_handles.resolve(reference)
+        if resolved:
+            return resolved[0], calendar or resolved[1]
+    except event_handles.AmbiguousReference as ambiguous:
+        local_ambiguity = ambiguous
+    if _looks_like_event_id(reference):
+        return reference, calendar
+    if event_handles.is_handle(reference):
+        raise Exception(f"Unknown event handle '{reference}'. List the events again to get current handles.")
     
+    # Look the subject up among upcoming events
+    now = datetime.datetime.now(datetime.timezone.utc)
+    time_window = {
+        "start": (now - datetime.timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "end": (now + datetime.timedelta(days=EVENT_LOOKUP_DAYS)).strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    needle = reference.lower()
+    matches = [
+        event for event in _calendar_view(time_window, get_access_token(), calendar)
+        if needle in event.get('subject', '').lower()
+    ]
+    matches = [event for event in matches if event['subject'].lower() == needle] or matches
+    handles = event_handles.remember(matches, calendar)
+    if len(matches) == 1:
+        return matches[0]['id'], calendar
+    if not matches:
+        if local_ambiguity:
+            raise local_ambiguity
+        raise Exception(f"No event matching '{reference}' was found in the next {EVENT_LOOKUP_DAYS} days.")
+    raise event_handles.AmbiguousReference(reference, [
+        {"handle": handles[event['id']], "subject": event['subject'], "start": event['start']['dateTime'][:16]}
+        for event in matches
+    ])
+
+def _resolves_event(func):
+    """
+    Lets a mutation take an event handle or subject in place of its event_id. A reference
+    matching several events is answered with the candidates, so the model can ask the user.
+    """
+    signature = inspect.signature(func)
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        try:
+            event_id, calendar = _resolve_event(bound.arguments['event_id'], bound.arguments.get('calendar'))
+        except event_handles.AmbiguousReference as ambiguous:
+            return f"{ambiguous} Nothing was changed."
+        bound.arguments['event_id'] = event_id
+        if calendar:
+            bound.arguments['calendar'] = calendar
+        return func(*bound.args, **bound.kwargs)
+    return wrapper
+
+def _apply_event_changes(event_id, fields, add_attendees=None, remove_attendees=None, calendar=None):
+    """
+    Sends field changes and attendee additions/removals for one event as a single PATCH
+    and returns the updated event.
+    """
+    access_token = get_access_token()
+    headers = {
+        'Authorization': 'Bearer ' + access_token,
+        'Content-Type': 'application/json'
+    }
+    
+    event_data = dict(fields)
+    try:
+        if add_attendees or remove_attendees:
+            # Attendees are replaced as a whole, so start from the current list
+            response = graph_client.get(
+                _events_url(calendar, event_id),
+                headers=headers,
+                params={"$select": "attendees"}
+            )
+            if response.status_code != 200:
+                raise Exception(f"Failed to get event: {response.text}")
+            removed = {email.lower() for email in remove_attendees or []}
+            attendees = [
+                a for a in json_codec.loads(response.content).get('attendees', [])
+                if a['emailAddress']['address'].lower() not in removed
+            ]
+            existing = {a['emailAddress']['address'].lower() for a in attendees}
+            for email in add_attendees or []:
+                if email.lower() not in existing:
+                    attendees.append({"emailAddress": {"address": email}, "type": "required"})
+                    existing.add(email.lower())
+            event_data["attendees"] = attendees
+        
+        response = graph_client.patch(
+            _events_url(calendar, event_id),
+            headers=headers,
+            data=json_codec.dumps(event_data)
+        )
+        if response.status_code != 200:
+            raise Exception(f"Failed to update event: {response.text}")
+        return json_codec.loads(response.content)
+    finally:
+        mark_changed()
+
+def _stage_or_apply(event_id, description, fields=None, add_attendees=None, remove_attendees=None, calendar=None):
+    """
+    Queues the change in the turn's outbox when there is one, otherwise applies it right away.
+    A change contradicting one already queued is not queued; the conflict is the tool's result.
+    """
+    pending = outbox.current()
+    if pending is None:
+        _apply_event_changes(event_id, fields or {}, add_attendees, remove_attendees, calendar)
+        return None
+    try:
+        ticket = pending.stage(event_id, fields, add_attendees, remove_attendees, calendar)
+    except outbox.ConflictingChange as conflict:
+        return f"❌ {conflict}. {description} was not queued; the earlier change is still sent."
+    return outbox.queued_message(ticket, description)
+
+@_resolves_event
+@serialized("event_id")
+@invalidates
+def update_calendar_event(event_id, new_start_time=None, new_end_time=None, new_subject=None, new_body=None, new_location=None, calendar=None):
+    """
+    Updates an existing event in the Outlook Calendar.
+    """
     event_data = {}
     if new_start_time:
         event_data["start"] = {"dateTime": new_start_time, "timeZone": "UTC"}
@@ -141,41 +486,50 @@ def update_calendar_event(event_id, new_start_time=None, new_end_time=None, new_
     if new_location:
         event_data["location"] = {"displayName": new_location}
     
-    response = requests.patch(
-        f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
-        headers=headers,
-        data=json.dumps(event_data)
-    )
-    
-    if response.status_code == 200:
-        return f"✅ Event updated successfully."
-    else:
-        raise Exception(f"Failed to update event: {response.text}")
+    queued = _stage_or_apply(event_id, "Event update", fields=event_data, calendar=calendar)
+    return queued or "✅ Event updated successfully."
 
-def delete_calendar_event(event_id):
+@_resolves_event
+@serialized("event_id")
+@invalidates
+def delete_calendar_event(event_id, calendar=None):
     """
     Deletes an event from the Outlook Calendar.
     """
+    if outbox.current() is not None:
+        outbox.current().discard(event_id, "Event was deleted, so this change was not sent.")
     access_token = get_access_token()
     headers = {
         'Authorization': 'Bearer ' + access_token
     }
     
-    response = requests.delete(
-        f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
+    response = graph_client.delete(
+        _events_url(calendar, event_id),
         headers=headers
     )
     
     if response.status_code == 204:
+        event_handles.forget(event_id)
         return "✅ Event deleted successfully."
     else:
         raise Exception(f"Failed to delete event: {response.text}")
 
-def delete_multiple_events(event_ids_json):
+@invalidates
+def delete_multiple_events(event_ids, calendar=None):
     """
-    Deletes multiple events from the Outlook Calendar.
+    Deletes multiple events from the Outlook Calendar. event_ids is a list of references
+    (a JSON array string is still accepted).
     """
-    event_ids = json.loads(event_ids_json)
+    if isinstance(event_ids, (str, bytes)):
+        event_ids = json_codec.loads(event_ids)
+    try:
+        targets = [_resolve_event(reference, calendar) for reference in event_ids]
+    except event_handles.AmbiguousReference as ambiguous:
+        return f"{ambiguous} Nothing was deleted."
+    event_ids = [event_id for event_id, _ in targets]
+    if outbox.current() is not None:
+        for event_id in event_ids:
+            outbox.current().discard(event_id, "Event was deleted, so this change was not sent.")
     access_token = get_access_token()
     headers = {
         'Authorization': 'Bearer ' + access_token
@@ -184,113 +538,194 @@ def delete_multiple_events(event_ids_json):
     deleted_count = 0
     failed_count = 0
     
-    for event_id in event_ids:
-        response = requests.delete(
-            f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
+    for event_id, event_calendar in targets:
+        response = graph_client.delete(
+            _events_url(event_calendar, event_id),
             headers=headers
         )
         if response.status_code == 204:
+            event_handles.forget(event_id)
             deleted_count += 1
         else:
             failed_count += 1
     
     return f"✅ Deleted {deleted_count} event(s) successfully. Failed: {failed_count}"
 
-def add_attendees_to_event(event_id, attendee_emails):
+def _matches_filters(event, subject_filter=None, attendee_filter=None):
+    if subject_filter and subject_filter.lower() not in event.get('subject', '').lower():
+        return False
+    if attendee_filter:
+        needle = attendee_filter.lower()
+        return any(
+            needle in a['emailAddress'].get('address', '').lower() or needle in a['emailAddress'].get('name', '').lower()
+            for a in event.get('attendees', [])
+        )
+    return True
+
+def _zone(timezone=None):
+    """ZoneInfo for an IANA zone name (CALENDAR_TIMEZONE when empty), or None if it is unknown."""
+    try:
+        return ZoneInfo(timezone or CALENDAR_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def _utc_window(time_window, zone):
+    """The window as UTC bounds for calendarView; bounds without an offset are local times in zone."""
+    window = {}
+    for name in ("start", "end"):
+        value = time_window[name]
+        bound = recurrence.parse_datetime(value, datetime.timezone.utc if value.endswith("Z") else zone)
+        window[name] = bound.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    return window
+
+def plan_reschedule(time_window, offset_minutes=None, target_date=None, day_mapping=None, subject_filter=None, attendee_filter=None, calendar=None, timezone=None):
     """
-    Adds attendees to an existing event.
+    Selects the events in a time window (optionally by subject or attendee) and computes
+    their new times without changing anything. target_date moves every selected event to
+    that day, day_mapping moves events per day ({'2025-01-24': '2025-01-27'}), and
+    offset_minutes shifts them; a day move and an offset can be combined. Days and the
+    window are the user's local ones in timezone, so an event keeps its local time of day.
     """
-    access_token = get_access_token()
+    outbox.flush_pending()
+    if offset_minutes is None and not target_date and not day_mapping:
+        raise Exception("Provide offset_minutes, target_date or day_mapping to reschedule events")
+    zone = _zone(timezone)
+    if zone is None:
+        raise Exception(f"Unknown time zone '{timezone}'. Use an IANA name like 'Europe/Berlin'.")
+    
+    events = _calendar_view(_utc_window(time_window, zone), get_access_token(), calendar)
+    plan = []
+    for event in events:
+        if event.get('isCancelled') or not _matches_filters(event, subject_filter, attendee_filter):
+            continue
+        start = recurrence.parse_datetime(event['start']['dateTime']).astimezone(zone)
+        end = recurrence.parse_datetime(event['end']['dateTime']).astimezone(zone)
+        new_start = start
+        if target_date or day_mapping:
+            new_day = (day_mapping or {}).get(start.date().isoformat(), target_date)
+            if not new_day:
+                continue
+            new_start = datetime.datetime.combine(datetime.date.fromisoformat(new_day), start.timetz())
+        # Wall-clock arithmetic in the zone, so a move across a DST change keeps the local time
+        new_start += datetime.timedelta(minutes=offset_minutes or 0)
+        new_end = new_start + (end - start)
+        plan.append({
+            "event_id": event['id'],
+            "subject": event.get('subject', ''),
+            "old_start": recurrence.format_datetime(start)[:19],
+            "old_end": recurrence.format_datetime(end)[:19],
+            "new_start": recurrence.format_datetime(new_start)[:19],
+            "new_end": recurrence.format_datetime(new_end)[:19],
+            "local_old_start": start.strftime("%Y-%m-%d %H:%M"),
+            "local_new_start": new_start.strftime("%Y-%m-%d %H:%M"),
+        })
+    return plan
+
+def _patch_batch(access_token, items, calendar=None):
+    """Sends up to GRAPH_BATCH_SIZE time changes as one $batch request; returns [(item, error)] for failures."""
     headers = {
         'Authorization': 'Bearer ' + access_token,
         'Content-Type': 'application/json'
     }
-    
-    # First get current event
-    response = requests.get(
-        f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
-        headers=headers
-    )
-    
+    batch = {"requests": [
+        {
+            "id": str(index),
+            "method": "PATCH",
+            # $batch URLs are relative to the endpoint
+            "url": _events_url(calendar, item['event_id'])[len(GRAPH_API_ENDPOINT):],
+            "headers": {"Content-Type": "application/json"},
+            "body": {
+                "start": {"dateTime": item['new_start'], "timeZone": "UTC"},
+                "end": {"dateTime": item['new_end'], "timeZone": "UTC"}
+            }
+        }
+        for index, item in enumerate(items)
+    ]}
+    response = graph_client.post(f"{GRAPH_API_ENDPOINT}/$batch", headers=headers, data=json_codec.dumps(batch))
     if response.status_code != 200:
-        raise Exception(f"Failed to get event: {response.text}")
-    
-    event = response.json()
-    current_attendees = event.get('attendees', [])
-    
-    # Add new attendees
-    for email in attendee_emails:
-        current_attendees.append({"emailAddress": {"address": email}, "type": "required"})
-    
-    # Update event
-    event_data = {"attendees": current_attendees}
-    response = requests.patch(
-        f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
-        headers=headers,
-        data=json.dumps(event_data)
-    )
-    
-    if response.status_code == 200:
-        return f"✅ Added {len(attendee_emails)} attendee(s) successfully."
-    else:
-        raise Exception(f"Failed to add attendees: {response.text}")
+        raise Exception(f"Failed to reschedule events: {response.text}")
+    failures = []
+    for result in json_codec.loads(response.content).get('responses', []):
+        if result.get('status') != 200:
+            error = (result.get('body') or {}).get('error', {}).get('message', f"HTTP {result.get('status')}")
+            failures.append((items[int(result['id'])], error))
+    return failures
 
-def remove_attendees_from_event(event_id, attendee_emails):
+def bulk_reschedule_events(time_window, offset_minutes=None, target_date=None, day_mapping=None, subject_filter=None, attendee_filter=None, dry_run=False, calendar=None, timezone=None):
     """
-    Removes attendees from an existing event.
+    Moves every matching event in a time window at once, sending batches of GRAPH_BATCH_SIZE
+    PATCHes concurrently. With dry_run, returns the plan without changing anything.
     """
-    access_token = get_access_token()
-    headers = {
-        'Authorization': 'Bearer ' + access_token,
-        'Content-Type': 'application/json'
-    }
-    
-    # First get current event
-    response = requests.get(
-        f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
-        headers=headers
-    )
-    
-    if response.status_code != 200:
-        raise Exception(f"Failed to get event: {response.text}")
-    
-    event = response.json()
-    current_attendees = event.get('attendees', [])
-    
-    # Remove specified attendees
-    updated_attendees = [a for a in current_attendees if a['emailAddress']['address'] not in attendee_emails]
+    if _zone(timezone) is None:
+        return f"Unknown time zone '{timezone}'. Use an IANA name like 'Europe/Berlin'."
+    plan = plan_reschedule(time_window, offset_minutes, target_date, day_mapping, subject_filter, attendee_filter, calendar, timezone)
+    if not plan:
+        return "No events found matching your criteria."
+    lines = [f"   {item['subject']}: {item['local_old_start']} → {item['local_new_start']}" for item in plan]
+    if dry_run:
+        return f"📝 Reschedule plan for {len(plan)} event(s) (dry run, nothing changed):\n" + "\n".join(lines)
     
-    # Update event
-    event_data = {"attendees": updated_attendees}
-    response = requests.patch(
-        f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
-        headers=headers,
-        data=json.dumps(event_data)
-    )
+    access_token = get_access_token()
+    batches = [plan[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(plan), GRAPH_BATCH_SIZE)]
+    failures = []
+    try:
+        results = run_parallel([(_patch_batch, (access_token, batch, calendar), {}) for batch in batches], return_exceptions=True)
+    finally:
+        mark_changed()
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            failures.extend((item, str(result)) for item in batch)
+        else:
+            failures.extend(result)
     
-    if response.status_code == 200:
-        return f"✅ Removed {len(attendee_emails)} attendee(s) successfully."
-    else:
-        raise Exception(f"Failed to remove attendees: {response.text}")
+    result = f"✅ Rescheduled {len(plan) - len(failures)} of {len(plan)} event(s).\n" + "\n".join(lines)
+    for item, error in failures:
+        result += f"\n❌ {item['subject']} ({item['event_id']}): {error}"
+    return result
+
+@_resolves_event
+@serialized("event_id")
+@invalidates
+def add_attendees_to_event(event_id, attendee_emails, calendar=None):
+    """
+    Adds attendees (email addresses or names) to an existing event.
+    """
+    try:
+        attendee_emails = people_directory.resolve_all(attendee_emails)
+    except people_directory.UnresolvedName as unresolved:
+        return f"{unresolved} No attendees were added."
+    queued = _stage_or_apply(event_id, f"Adding {len(attendee_emails)} attendee(s)", add_attendees=attendee_emails, calendar=calendar)
+    return queued or f"✅ Added {len(attendee_emails)} attendee(s) successfully."
 
-def update_event_location(event_id, location):
+@_resolves_event
+@serialized("event_id")
+@invalidates
+def remove_attendees_from_event(event_id, attendee_emails, calendar=None):
+    """
+    Removes attendees (email addresses or names) from an existing event.
+    """
+    try:
+        attendee_emails = people_directory.resolve_all(attendee_emails)
+    except people_directory.UnresolvedName as unresolved:
+        return f"{unresolved} No attendees were removed."
+    queued = _stage_or_apply(event_id, f"Removing {len(attendee_emails)} attendee(s)", remove_attendees=attendee_emails, calendar=calendar)
+    return queued or f"✅ Removed {len(attendee_emails)} attendee(s) successfully."
+
+@_resolves_event
+@serialized("event_id")
+@invalidates
+def update_event_location(event_id, location, calendar=None):
     """
     Updates the location of an existing event.
     """
-    access_token = get_access_token()
-    headers = {
-        'Authorization': 'Bearer ' + access_token,
-        'Content-Type': 'application/json'
-    }
-    
-    event_data = {"location": {"displayName": location}}
-    response = requests.patch(
-        f"{GRAPH_API_ENDPOINT}/me/events/{event_id}",
-        headers=headers,
-        data=json.dumps(event_data)
-    )
-    
-    if response.status_code == 200:
-        return f"✅ Event location updated to '{location}'."
-    else:
-        raise Exception(f"Failed to update location: {response.text}")
\ No newline at end of file
+    queued = _stage_or_apply(event_id, f"Location change to '{location}'", fields={"location": {"displayName": location}}, calendar=calendar)
+    return queued or f"✅ Event location updated to '{location}'."
+
+def find_people(name):
+    """
+    Looks up people by (partial) name in the user's directory of contacts and meeting partners.
+    """
+    matches = people_directory.lookup(name)
+    if not matches:
+        return f"No one matching '{name}' was found."
+    return "\n".join(f"👤 {person['name'] or person['email']} <{person['email']}>" for person in matches)
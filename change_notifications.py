@@ -0,0 +1,271 @@
+import os
+import atexit
+import json_codec
+import time
+import secrets
+import datetime
+import threading
+import graph_client
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from graph_api_auth import get_cached_token, get_current_user, on_logout, on_token_acquired
+from response_cache import mark_changed
+
+load_dotenv()
+
+GRAPH_API_ENDPOINT = 'https://graph.microsoft.com/v1.0'
+NOTIFICATIONS_ENABLED = os.getenv("NOTIFICATIONS_ENABLED", "false").lower() == "true"
+# Public HTTPS address Graph posts to; it must reach the receiver below
+NOTIFICATION_URL = os.getenv("NOTIFICATION_URL", "")
+NOTIFICATION_HOST = os.getenv("NOTIFICATION_HOST", "0.0.0.0")
+NOTIFICATION_PORT = int(os.getenv("NOTIFICATION_PORT", "8502"))
+SUBSCRIPTION_MINUTES = int(os.getenv("SUBSCRIPTION_MINUTES", "4200"))
+SUBSCRIPTION_RENEW_BEFORE = int(os.getenv("SUBSCRIPTION_RENEW_BEFORE", "3600"))
+# After a failed subscribe the user's next attempt waits this long, doubling per failure up to SUBSCRIBE_RETRY_MAX
+SUBSCRIBE_RETRY = int(os.getenv("SUBSCRIBE_RETRY", "60"))
+SUBSCRIBE_RETRY_MAX = int(os.getenv("SUBSCRIBE_RETRY_MAX", "3600"))
+
+_lock = threading.Lock()
+# Subscriptions, their renewal and the receiver belong to the process that signed the user in,
+# unlike the auth and chat state in state_backend. With several replicas, each needs its own
+# NOTIFICATION_URL routed to it; a notification reaching another replica is rejected, and the
+# cache invalidation it triggers only applies to the process that receives it.
+# subscription id -> {"user_key", "client_id", "tenant_id", "client_state", "expires"}
+_subscriptions = {}
+_by_user = {}
+_subscribing = set()
+# user_key -> (consecutive failures, time before which no new attempt is made)
+_retry_after = {}
+_server = None
+_renewer = None
+_stats = {"notifications": 0, "rejected": 0, "renewals": 0, "subscribe_errors": 0}
+
+def _expiration():
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=SUBSCRIPTION_MINUTES)
+    return expires, expires.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+def _headers(access_token):
+    return {
+        'Authorization': 'Bearer ' + access_token,
+        'Content-Type': 'application/json'
+    }
+
+def subscribe(client_id, tenant_id, user_key):
+    """Creates a change subscription on the user's events unless one is already active."""
+    with _lock:
+        if user_key in _by_user:
+            return _by_user[user_key]
+    access_token = get_cached_token(client_id, tenant_id, user_key)
+    if access_token is None:
+        return None
+    client_state = secrets.token_urlsafe(24)
+    expires, expiration = _expiration()
+    response = graph_client.post(
+        f"{GRAPH_API_ENDPOINT}/subscriptions",
+        headers=_headers(access_token),
+        data=json_codec.dumps({
+            "changeType": "created,updated,deleted",
+            "notificationUrl": NOTIFICATION_URL,
+            "lifecycleNotificationUrl": NOTIFICATION_URL,
+            "resource": "me/events",
+            "expirationDateTime": expiration,
+            "clientState": client_state
+        })
+    )
+    if response.status_code != 201:
+        raise Exception(f"Failed to subscribe to calendar changes: {response.text}")
+    subscription_id = json_codec.loads(response.content)['id']
+    with _lock:
+        _subscriptions[subscription_id] = {
+            "user_key": user_key,
+            "client_id": client_id,
+            "tenant_id": tenant_id,
+            "client_state": client_state,
+            "expires": expires.timestamp()
+        }
+        _by_user[user_key] = subscription_id
+    return subscription_id
+
+def renew(subscription_id):
+    """Extends a subscription; it is recreated if Graph no longer knows it."""
+    with _lock:
+        subscription = dict(_subscriptions.get(subscription_id) or {})
+    if not subscription:
+        return
+    access_token = get_cached_token(subscription["client_id"], subscription["tenant_id"], subscription["user_key"])
+    if access_token is None:
+        _forget(subscription_id)
+        return
+    expires, expiration = _expiration()
+    response = graph_client.patch(
+        f"{GRAPH_API_ENDPOINT}/subscriptions/{subscription_id}",
+        headers=_headers(access_token),
+        data=json_codec.dumps({"expirationDateTime": expiration})
+    )
+    if response.status_code == 200:
+        with _lock:
+            if subscription_id in _subscriptions:
+                _subscriptions[subscription_id]["expires"] = expires.timestamp()
+            _stats["renewals"] += 1
+    elif response.status_code == 404:
+        _forget(subscription_id)
+        # Changes may have been missed while the subscription was gone
+        mark_changed(subscription["user_key"])
+        subscribe(subscription["client_id"], subscription["tenant_id"], subscription["user_key"])
+    else:
+        raise Exception(f"Failed to renew calendar subscription: {response.text}")
+
+def unsubscribe(user_key=None):
+    """Deletes the user's subscription, e.g. on logout."""
+    user_key = user_key or get_current_user()
+    with _lock:
+        subscription_id = _by_user.get(user_key)
+        subscription = dict(_subscriptions.get(subscription_id) or {})
+    if not subscription_id:
+        return
+    _forget(subscription_id)
+    access_token = get_cached_token(subscription["client_id"], subscription["tenant_id"], user_key)
+    if access_token is not None:
+        graph_client.delete(f"{GRAPH_API_ENDPOINT}/subscriptions/{subscription_id}", headers=_headers(access_token))
+
+@on_logout
+def _unsubscribe_on_logout(client_id, user_key):
+    unsubscribe(user_key)
+
+def _unsubscribe_all():
+    """Deletes every subscription of this process when it shuts down, instead of leaving them to expire."""
+    with _lock:
+        user_keys = list(_by_user)
+    for user_key in user_keys:
+        try:
+            unsubscribe(user_key)
+        except Exception:
+            pass
+
+def _forget(subscription_id):
+    with _lock:
+        subscription = _subscriptions.pop(subscription_id, None)
+        if subscription and _by_user.get(subscription["user_key"]) == subscription_id:
+            del _by_user[subscription["user_key"]]
+
+def handle_notifications(payload):
+    """
+    Applies a notification payload from Graph: every change to a known subscription
+    invalidates the cached calendar data of its user. Returns the number accepted.
+    """
+    accepted = 0
+    for notification in payload.get("value", []):
+        subscription_id = notification.get("subscriptionId")
+        with _lock:
+            subscription = _subscriptions.get(subscription_id)
+            if subscription is None or notification.get("clientState") != subscription["client_state"]:
+                _stats["rejected"] += 1
+                continue
+            _stats["notifications"] += 1
+            user_key = subscription["user_key"]
+        lifecycle_event = notification.get("lifecycleEvent")
+        if lifecycle_event == "reauthorizationRequired":
+            threading.Thread(target=renew, args=(subscription_id,), daemon=True).start()
+        elif lifecycle_event == "subscriptionRemoved":
+            _forget(subscription_id)
+            mark_changed(user_key)
+            threading.Thread(
+                target=subscribe,
+                args=(subscription["client_id"], subscription["tenant_id"], user_key),
+                daemon=True
+            ).start()
+        else:
+            # Plain changes and "missed" both mean our copy may be out of date
+            event_id = (notification.get("resourceData") or {}).get("id")
+            mark_changed(user_key, event_id)
+        accepted += 1
+    return accepted
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        query = parse_qs(urlparse(self.path).query)
+        if "validationToken" in query:
+            # Graph checks the endpoint by expecting the token echoed back as plain text
+            token = query["validationToken"][0].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(token)))
+            self.end_headers()
+            self.wfile.write(token)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json_codec.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+        # Acknowledge fast; Graph retries and eventually drops slow endpoints
+        self.send_response(202)
+        self.end_headers()
+        handle_notifications(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def _renew_loop():
+    while True:
+        time.sleep(60)
+        with _lock:
+            due = [
+                subscription_id for subscription_id, subscription in _subscriptions.items()
+                if subscription["expires"] - time.time() < SUBSCRIPTION_RENEW_BEFORE
+            ]
+        for subscription_id in due:
+            try:
+                renew(subscription_id)
+            except Exception:
+                pass
+
+def start_receiver(host=None, port=None):
+    """Starts the webhook receiver and the renewal thread once per process; returns the server."""
+    global _server, _renewer
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host or NOTIFICATION_HOST, NOTIFICATION_PORT if port is None else port), _NotificationHandler)
+            threading.Thread(target=_server.serve_forever, name="graph-notifications", daemon=True).start()
+            atexit.register(_unsubscribe_all)
+        if _renewer is None:
+            _renewer = threading.Thread(target=_renew_loop, name="graph-subscription-renewal", daemon=True)
+            _renewer.start()
+        return _server
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result["subscriptions"] = len(_subscriptions)
+    return result
+
+@on_token_acquired
+def _subscribe_after_sign_in(client_id, tenant_id, user_key):
+    if not NOTIFICATIONS_ENABLED or not NOTIFICATION_URL:
+        return
+    with _lock:
+        if user_key in _by_user or user_key in _subscribing:
+            return
+        if _retry_after.get(user_key, (0, 0))[1] > time.time():
+            return
+        _subscribing.add(user_key)
+    start_receiver()
+    # Graph validates the notification URL synchronously, so don't hold up sign-in
+    def run():
+        try:
+            subscribe(client_id, tenant_id, user_key)
+            with _lock:
+                _retry_after.pop(user_key, None)
+        except Exception:
+            with _lock:
+                _stats["subscribe_errors"] += 1
+                failures = _retry_after.get(user_key, (0, 0))[0] + 1
+                delay = min(SUBSCRIBE_RETRY * 2 ** (failures - 1), SUBSCRIBE_RETRY_MAX)
+                _retry_after[user_key] = (failures, time.time() + delay)
+        finally:
+            with _lock:
+                _subscribing.discard(user_key)
+    threading.Thread(target=run, daemon=True).start()
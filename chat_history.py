@@ -0,0 +1,40 @@
+import os
+import hashlib
+from dotenv import load_dotenv
+from graph_api_auth import get_current_user
+from state_backend import get_backend
+
+load_dotenv()
+
+CHAT_HISTORY_ENABLED = os.getenv("CHAT_HISTORY_ENABLED", "true").lower() == "true"
+CHAT_RENDER_WINDOW = int(os.getenv("CHAT_RENDER_WINDOW", "30"))
+
+def _key(user_key=None):
+    user_key = user_key or get_current_user()
+    return hashlib.sha256(user_key.encode("utf-8")).hexdigest()[:16]
+
+def append(role, content, user_key=None):
+    """Appends one message to the user's conversation log."""
+    if not CHAT_HISTORY_ENABLED:
+        return
+    get_backend().append("chat", _key(user_key), {"role": role, "content": content})
+
+def count(user_key=None):
+    if not CHAT_HISTORY_ENABLED:
+        return 0
+    return get_backend().length("chat", _key(user_key))
+
+def read(start, stop, user_key=None):
+    """Returns messages start..stop-1."""
+    if not CHAT_HISTORY_ENABLED or stop <= start:
+        return []
+    return get_backend().range("chat", _key(user_key), max(0, start), stop)
+
+def tail(n=None, user_key=None):
+    """Returns the last n messages (CHAT_RENDER_WINDOW by default)."""
+    total = count(user_key)
+    return read(total - (n or CHAT_RENDER_WINDOW), total, user_key)
+
+def clear(user_key=None):
+    """Deletes the user's conversation, e.g. on "Clear Chat" or logout."""
+    get_backend().delete("chat", _key(user_key))
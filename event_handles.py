@@ -0,0 +1,125 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from graph_api_auth import get_current_user
+from state_backend import get_backend
+import json_codec
+
+load_dotenv()
+
+HANDLE_MAX_PER_USER = int(os.getenv("HANDLE_MAX_PER_USER", "500"))
+# A user's handles are dropped this many seconds after they were last assigned
+HANDLE_TTL = int(os.getenv("HANDLE_TTL", "86400"))
+
+_HANDLE = re.compile(r"^E(\d+)$", re.IGNORECASE)
+
+# Read-modify-write of a user's map within this process; the map itself lives in the state
+# backend, so a handle listed on one replica resolves on any other
+_lock = threading.Lock()
+
+class AmbiguousReference(Exception):
+    def __init__(self, reference, candidates):
+        self.reference = reference
+        self.candidates = candidates
+        listing = "; ".join(f"{c['handle']} '{c['subject']}' at {c['start']}" for c in candidates)
+        super().__init__(f"'{reference}' matches several events: {listing}. Use one of these handles.")
+
+def is_handle(reference):
+    return bool(_HANDLE.match(reference.strip()))
+
+def _key():
+    return hashlib.sha256(get_current_user().encode("utf-8")).hexdigest()[:16]
+
+def _user_map():
+    """The current user's handles: {"next": int, "by_handle": OrderedDict(handle -> event info), "by_id": {event_id: handle}}."""
+    text = get_backend().get("handles", _key())
+    stored = json_codec.loads(text) if text else None
+    if not stored or stored.get("expires_at", 0) < time.time():
+        return {"next": 1, "by_handle": OrderedDict(), "by_id": {}}
+    by_handle = OrderedDict((info["handle"], info) for info in stored["events"])
+    return {"next": stored["next"], "by_handle": by_handle, "by_id": {info["id"]: handle for handle, info in by_handle.items()}}
+
+def _save(handles):
+    stored = {"next": handles["next"], "events": list(handles["by_handle"].values()), "expires_at": time.time() + HANDLE_TTL}
+    get_backend().put("handles", _key(), json_codec.dumps_str(stored), ttl=HANDLE_TTL)
+
+def remember(events, calendar=None):
+    """
+    Gives every listed event a short session handle (E1, E2, ...) and returns {event_id: handle}.
+    calendar is where the events were listed from, unless an event carries its own _calendar.
+    """
+    assigned = {}
+    with _lock:
+        handles = _user_map()
+        for event in events:
+            event_id = event.get('id')
+            if not event_id:
+                continue
+            handle = handles["by_id"].get(event_id)
+            if handle is None:
+                handle = f"E{handles['next']}"
+                handles["next"] += 1
+                handles["by_id"][event_id] = handle
+            handles["by_handle"][handle] = {
+                "handle": handle,
+                "id": event_id,
+                "subject": event.get('subject', ''),
+                "start": event.get('start', {}).get('dateTime', '')[:16],
+                "calendar": event.get('_calendar') or calendar or None,
+            }
+            handles["by_handle"].move_to_end(handle)
+            assigned[event_id] = handle
+        while len(handles["by_handle"]) > HANDLE_MAX_PER_USER:
+            _, info = handles["by_handle"].popitem(last=False)
+            handles["by_id"].pop(info["id"], None)
+        _save(handles)
+    return assigned
+
+def forget(event_id):
+    with _lock:
+        handles = _user_map()
+        handle = handles["by_id"].pop(event_id, None)
+        if handle:
+            handles["by_handle"].pop(handle, None)
+            _save(handles)
+
+def candidates(reference):
+    """Remembered events matching a subject reference: exact matches if any, else prefix, else substring."""
+    needle = reference.strip().lower()
+    with _lock:
+        known = list(_user_map()["by_handle"].values())
+    for match in (
+        lambda subject: subject == needle,
+        lambda subject: subject.startswith(needle),
+        lambda subject: needle in subject,
+    ):
+        found = [info for info in known if match(info["subject"].lower())]
+        if found:
+            return found
+    return []
+
+def resolve(reference):
+    """
+    Turns a handle, a remembered event ID or a subject into (event ID, calendar the event
+    was listed from) using only the session map. Returns None when the reference is
+    unknown and raises AmbiguousReference when a subject matches several remembered events.
+    """
+    reference = reference.strip()
+    with _lock:
+        handles = _user_map()
+        if is_handle(reference):
+            info = handles["by_handle"].get(reference.upper())
+            return (info["id"], info["calendar"]) if info else None
+        if reference in handles["by_id"]:
+            info = handles["by_handle"][handles["by_id"][reference]]
+            return info["id"], info["calendar"]
+    found = candidates(reference)
+    if len(found) == 1:
+        return found[0]["id"], found[0]["calendar"]
+    if found:
+        raise AmbiguousReference(reference, found)
+    return None
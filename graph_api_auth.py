@@ -2,7 +2,14 @@ import msal
 import os
 import webbrowser
 import json
+import hashlib
+import threading
+import time
+import contextvars
+from collections import OrderedDict
 from dotenv import load_dotenv
+from state_backend import get_backend, is_shared
+import json_codec
 
 load_dotenv()
 
@@ -10,51 +17,222 @@ CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 TENANT_ID = os.getenv("TENANT_ID", "common")
 USER_EMAIL = os.getenv("USER_EMAIL")
-SCOPE = ["Calendars.ReadWrite", "User.Read"]
+SCOPE = ["Calendars.ReadWrite", "Calendars.ReadWrite.Shared", "User.Read", "People.Read", "Contacts.Read"]
 AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-_app = None
-_token_caches = {}
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "1000"))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "3600"))
+# With a shared state backend, how often a cache held in memory is compared with the stored one
+TOKEN_CACHE_REVALIDATE = float(os.getenv("TOKEN_CACHE_REVALIDATE", "5"))
+# A new session or CLI run picks up the account that last signed in here. Turn this off when
+# several people share one deployment: anyone opening the app would act as that account.
+REMEMBER_ACCOUNT = os.getenv("REMEMBER_ACCOUNT", "true").lower() == "true"
+# (client_id, user_key) -> [SerializableTokenCache, last_used, last_checked, stored text]; oldest first.
+# user_key is a random server-side session id until sign-in finishes, then "account:<home_account_id>"
+_token_caches = OrderedDict()
+_token_caches_lock = threading.RLock()
+_current_user = contextvars.ContextVar("current_user", default=None)
+_token_listeners = []
+_logout_listeners = []
+_default_user_key = None
 
-def _get_cache_file(client_id):
-    return f"token_cache_{client_id[:8]}.json"
+def set_current_user(user_key):
+    """Binds the current context (and tool threads started from it) to a user's token cache."""
+    _current_user.set(user_key)
 
-def _load_cache(client_id):
-    if client_id not in _token_caches:
-        _token_caches[client_id] = msal.SerializableTokenCache()
-        cache_file = _get_cache_file(client_id)
-        if os.path.exists(cache_file):
-            with open(cache_file, "r") as f:
-                _token_caches[client_id].deserialize(f.read())
-    return _token_caches[client_id]
+def get_current_user():
+    """Returns the key identifying whose calendar this context is working on."""
+    user_key = _current_user.get()
+    if user_key is None:
+        try:
+            import streamlit as st
+            user_key = st.session_state.get("user_key")
+        except Exception:
+            user_key = None
+    return user_key or _default_user()
+
+def _default_user():
+    # Outside a session (CLI runs, scripts) this process acts as the remembered account; looked up once
+    global _default_user_key
+    if _default_user_key is None:
+        _default_user_key = remembered_account() or "default"
+    return _default_user_key
+
+def _forget_default_user():
+    global _default_user_key
+    _default_user_key = None
+
+def remembered_account(client_id=None):
+    """The user key of the account that last signed in with this client, if its tokens are still stored."""
+    client_id = client_id or CLIENT_ID
+    if not REMEMBER_ACCOUNT or not client_id:
+        return None
+    account_key = get_backend().get("last_account", client_id[:8])
+    if not account_key or get_backend().get("token_cache", _cache_key(client_id, account_key)) is None:
+        return None
+    return account_key
 
-def _save_cache(client_id):
-    if client_id in _token_caches and _token_caches[client_id].has_state_changed:
+def _user_digest(user_key):
+    return hashlib.sha256(user_key.encode("utf-8")).hexdigest()[:16]
+
+def _cache_key(client_id, user_key=None):
+    return f"{client_id[:8]}_{_user_digest(user_key or get_current_user())}"
+
+def _write_cache(client_id, user_key, entry):
+    cache = entry[0]
+    if cache.has_state_changed:
         try:
-            cache_file = _get_cache_file(client_id)
-            with open(cache_file, "w") as f:
-                f.write(_token_caches[client_id].serialize())
+            text = cache.serialize()
+            get_backend().put("token_cache", _cache_key(client_id, user_key), text)
+            cache.has_state_changed = False
+            entry[3] = text
         except Exception:
             pass
 
+def _evict_expired(now):
+    # Entries are kept in last-used order, so expired ones are always at the front
+    while _token_caches:
+        key, entry = next(iter(_token_caches.items()))
+        if now - entry[1] < TOKEN_CACHE_TTL and len(_token_caches) <= TOKEN_CACHE_MAX_ENTRIES:
+            break
+        _token_caches.popitem(last=False)
+        _write_cache(key[0], key[1], entry)
+
+def _load_cache(client_id, user_key=None):
+    """Returns the token cache of one user, loading it from the state backend if it is not in memory."""
+    key = (client_id, user_key or get_current_user())
+    now = time.time()
+    with _token_caches_lock:
+        entry = _token_caches.get(key)
+        if entry is not None:
+            entry[1] = now
+            _token_caches.move_to_end(key)
+            # Another replica may have refreshed the tokens or logged the user out
+            if not is_shared() or entry[0].has_state_changed or now - entry[2] < TOKEN_CACHE_REVALIDATE:
+                return entry[0]
+            entry[2] = now
+            text = get_backend().get("token_cache", _cache_key(*key))
+            if text == entry[3]:
+                return entry[0]
+        else:
+            text = get_backend().get("token_cache", _cache_key(*key))
+        cache = msal.SerializableTokenCache()
+        if text:
+            cache.deserialize(text)
+        _token_caches[key] = [cache, now, now, text]
+        _evict_expired(now)
+        return cache
+
+def _save_cache(client_id, user_key=None):
+    key = (client_id, user_key or get_current_user())
+    with _token_caches_lock:
+        entry = _token_caches.get(key)
+        if entry is not None:
+            _write_cache(key[0], key[1], entry)
+
+def _keep_only_account(app, home_account_id):
+    # A re-login replaces whoever was signed in before in this user's cache
+    for account in app.get_accounts():
+        if account.get("home_account_id") != home_account_id:
+            app.remove_account(account)
+
+def _account_id_from_result(result, app=None):
+    claims = result.get("id_token_claims") or {}
+    if claims.get("oid") and claims.get("tid"):
+        return f"{claims['oid']}.{claims['tid']}"
+    accounts = app.get_accounts() if app is not None else []
+    return accounts[0].get("home_account_id") if accounts else None
+
+def _bind_account(client_id, session_key, home_account_id):
+    """
+    Moves a freshly signed-in token cache from the browser session's key to the account's
+    (client_id, home_account_id) key and points the session at it. Session keys are random
+    and server-side; only finishing a sign-in leads a session to an account's tokens.
+    """
+    account_key = f"account:{home_account_id}"
+    with _token_caches_lock:
+        entry = _token_caches.pop((client_id, session_key), None)
+        if entry is not None:
+            entry[0].has_state_changed = True
+            _token_caches[(client_id, account_key)] = entry
+    get_backend().delete("token_cache", _cache_key(client_id, session_key))
+    get_backend().put("last_account", client_id[:8], account_key)
+    _forget_default_user()
+    set_current_user(account_key)
+    try:
+        import streamlit as st
+        st.session_state.user_key = account_key
+    except Exception:
+        pass
+    return account_key
+
 def _get_msal_app():
-    global _app
-    if _app is None:
-        cache = _load_cache()
-        _app = msal.PublicClientApplication(
-            client_id=CLIENT_ID,
-            authority=AUTHORITY,
-            token_cache=cache
-        )
-    return _app
+    # One app per user cache; a shared global app would mix accounts of different users
+    return msal.PublicClientApplication(
+        client_id=CLIENT_ID,
+        authority=AUTHORITY,
+        token_cache=_load_cache(CLIENT_ID)
+    )
+
+def _load_pending(user_key):
+    """Returns the user's unfinished device flow, from whichever replica started it."""
+    text = get_backend().get("pending_auth", _user_digest(user_key))
+    if text is None:
+        return None
+    pending = json_codec.loads(text)
+    if pending['flow'].get('expires_at', 0) < time.time():
+        _clear_pending(user_key)
+        return None
+    return pending
+
+def _save_pending(user_key, pending):
+    ttl = max(1, int(pending['flow'].get('expires_at', 0) - time.time()))
+    get_backend().put("pending_auth", _user_digest(user_key), json_codec.dumps_str(pending), ttl=ttl)
+
+def _clear_pending(user_key):
+    get_backend().delete("pending_auth", _user_digest(user_key))
+
+def on_token_acquired(listener):
+    """Registers listener(client_id, tenant_id, user_key) to be called after every successful sign-in or token lookup."""
+    _token_listeners.append(listener)
+    return listener
+
+def on_logout(listener):
+    """Registers listener(client_id, user_key) to be called before a user's tokens are deleted on logout."""
+    _logout_listeners.append(listener)
+    return listener
+
+def _notify_token(client_id, tenant_id, user_key):
+    for listener in _token_listeners:
+        try:
+            listener(client_id, tenant_id, user_key)
+        except Exception:
+            pass
+
+def get_cached_token(client_id, tenant_id, user_key):
+    """Returns an access token from the user's cache without ever prompting, or None."""
+    app = msal.PublicClientApplication(
+        client_id=client_id,
+        authority=f"https://login.microsoftonline.com/{tenant_id}",
+        token_cache=_load_cache(client_id, user_key)
+    )
+    accounts = app.get_accounts()
+    if not accounts:
+        return None
+    result = app.acquire_token_silent(SCOPE, account=accounts[0])
+    if result and "access_token" in result:
+        _save_cache(client_id, user_key)
+        return result["access_token"]
+    return None
 
 def get_access_token(client_id=None, tenant_id=None, force_new_login=False):
     use_client_id = client_id or CLIENT_ID
     use_tenant_id = tenant_id or TENANT_ID
+    user_key = get_current_user()
     
     if not use_client_id:
         raise Exception("CLIENT_ID is required")
     
-    cache = _load_cache(use_client_id)
+    cache = _load_cache(use_client_id, user_key)
     authority = f"https://login.microsoftonline.com/{use_tenant_id}"
     app = msal.PublicClientApplication(
         client_id=use_client_id,
@@ -68,14 +246,16 @@ def get_access_token(client_id=None, tenant_id=None, force_new_login=False):
         if accounts:
             result = app.acquire_token_silent(SCOPE, account=accounts[0])
             if result and "access_token" in result:
+                _notify_token(use_client_id, use_tenant_id, user_key)
                 return result["access_token"]
     
     # Need authentication
     try:
         import streamlit as st
         
-        # Check if we have a pending device flow
-        if 'pending_auth' not in st.session_state:
+        # Check if we have a pending device flow; it is kept in the state backend so any replica can finish it
+        pending = _load_pending(user_key)
+        if pending is None:
             try:
                 flow = app.initiate_device_flow(scopes=SCOPE)
                 if 'device_code' not in flow:
@@ -86,8 +266,7 @@ def get_access_token(client_id=None, tenant_id=None, force_new_login=False):
                     st.markdown("- Check API permissions are granted")
                     raise Exception("Device flow not supported. Check Azure app configuration.")
                     
-                import time
-                st.session_state.pending_auth = {'flow': flow, 'app': app, 'client_id': use_client_id, 'last_attempt': time.time()}
+                _save_pending(user_key, {'flow': flow, 'client_id': use_client_id, 'tenant_id': use_tenant_id, 'last_attempt': time.time()})
                 
                 auth_url = f"{flow['verification_uri']}?otc={flow['user_code']}"
                 device_code = flow['user_code']
@@ -153,9 +332,6 @@ def get_access_token(client_id=None, tenant_id=None, force_new_login=False):
                 raise Exception("Authentication failed. Use the form to create events.")
         else:
             # Try to complete the pending authentication
-            import time
-            pending = st.session_state.pending_auth
-            
             # Respect polling interval
             time_since_last = time.time() - pending.get('last_attempt', 0)
             interval = pending['flow'].get('interval', 5)
@@ -165,13 +341,24 @@ def get_access_token(client_id=None, tenant_id=None, force_new_login=False):
             
             # Update last attempt time
             pending['last_attempt'] = time.time()
-            st.session_state.pending_auth = pending
+            _save_pending(user_key, pending)
             
-            result = pending['app'].acquire_token_by_device_flow(pending['flow'])
+            # The MSAL app isn't serializable, so it is rebuilt around the user's token cache
+            pending_app = msal.PublicClientApplication(
+                client_id=pending['client_id'],
+                authority=f"https://login.microsoftonline.com/{pending['tenant_id']}",
+                token_cache=_load_cache(pending['client_id'], user_key)
+            )
+            result = pending_app.acquire_token_by_device_flow(pending['flow'])
             
             if result and "access_token" in result:
-                _save_cache(pending.get('client_id', use_client_id))
-                del st.session_state.pending_auth
+                _clear_pending(user_key)
+                home_account_id = _account_id_from_result(result, pending_app)
+                if home_account_id:
+                    _keep_only_account(pending_app, home_account_id)
+                    user_key = _bind_account(pending['client_id'], user_key, home_account_id)
+                _save_cache(pending['client_id'], user_key)
+                _notify_token(use_client_id, use_tenant_id, user_key)
                 return result["access_token"]
             else:
                 # Still pending or failed
@@ -244,21 +431,36 @@ def get_access_token(client_id=None, tenant_id=None, force_new_login=False):
     except ImportError:
         result = app.acquire_token_interactive(scopes=SCOPE)
         if result and "access_token" in result:
-            _save_cache(use_client_id)
+            home_account_id = _account_id_from_result(result, app)
+            if home_account_id:
+                _keep_only_account(app, home_account_id)
+                user_key = _bind_account(use_client_id, user_key, home_account_id)
+            _save_cache(use_client_id, user_key)
+            _notify_token(use_client_id, use_tenant_id, user_key)
             return result["access_token"]
         raise Exception("Authentication failed")
 
-def logout(client_id=None):
-    """Clears the token cache to log out the user."""
+def logout(client_id=None, user_key=None):
+    """Clears the current user's token cache to log them out."""
     use_client_id = client_id or CLIENT_ID
-    cache_file = _get_cache_file(use_client_id)
+    use_user_key = user_key or get_current_user()
+    
+    # Listeners may still need the tokens, e.g. to delete a subscription
+    for listener in _logout_listeners:
+        try:
+            listener(use_client_id, use_user_key)
+        except Exception:
+            pass
     
     # Clear in-memory cache
-    if use_client_id in _token_caches:
-        del _token_caches[use_client_id]
+    with _token_caches_lock:
+        _token_caches.pop((use_client_id, use_user_key), None)
     
-    # Delete cache file
-    if os.path.exists(cache_file):
-        os.remove(cache_file)
+    # Delete the stored cache and any sign-in still in progress
+    get_backend().delete("token_cache", _cache_key(use_client_id, use_user_key))
+    _clear_pending(use_user_key)
+    if get_backend().get("last_account", use_client_id[:8]) == use_user_key:
+        get_backend().delete("last_account", use_client_id[:8])
+    _forget_default_user()
     
     return True
\ No newline at end of file
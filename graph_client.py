@@ -0,0 +1,190 @@
+import os
+import time
+import threading
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from graph_api_auth import get_current_user
+
+load_dotenv()
+
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5"))
+GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", "20"))
+GRAPH_HEDGE_ENABLED = os.getenv("GRAPH_HEDGE_ENABLED", "true").lower() == "true"
+# A GET still running after this latency percentile of recent GETs gets a second, parallel attempt
+GRAPH_HEDGE_PERCENTILE = float(os.getenv("GRAPH_HEDGE_PERCENTILE", "95"))
+GRAPH_HEDGE_MIN_DELAY = float(os.getenv("GRAPH_HEDGE_MIN_DELAY", "0.2"))
+GRAPH_HEDGE_MIN_SAMPLES = int(os.getenv("GRAPH_HEDGE_MIN_SAMPLES", "20"))
+GRAPH_BREAKER_FAILURES = int(os.getenv("GRAPH_BREAKER_FAILURES", "5"))
+GRAPH_BREAKER_COOLDOWN = float(os.getenv("GRAPH_BREAKER_COOLDOWN", "30"))
+# A 429 is retried once after its Retry-After when that is at most this many seconds
+GRAPH_RETRY_AFTER_MAX = float(os.getenv("GRAPH_RETRY_AFTER_MAX", "10"))
+
+_lock = threading.Lock()
+_latencies = deque(maxlen=200)
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="graph-request")
+# One breaker per signed-in user: Graph degrades per tenant and mailbox as often as globally,
+# so one user's failing mailbox must not cut everyone else off. Only users with recent failures have an entry.
+_breakers = {}
+_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "rejected": 0, "throttled": 0}
+
+class GraphUnavailable(Exception):
+    pass
+
+def _hedge_delay():
+    with _lock:
+        samples = sorted(_latencies)
+    if len(samples) < GRAPH_HEDGE_MIN_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(len(samples) * GRAPH_HEDGE_PERCENTILE / 100))
+    return max(GRAPH_HEDGE_MIN_DELAY, samples[index])
+
+def _admit(user_key):
+    """Raises GraphUnavailable while the user's breaker is open; after the cooldown one probe call is let through."""
+    with _lock:
+        _stats["requests"] += 1
+        breaker = _breakers.get(user_key)
+        if breaker is None or breaker["opened_at"] is None:
+            return
+        remaining = GRAPH_BREAKER_COOLDOWN - (time.time() - breaker["opened_at"])
+        if remaining <= 0 and not breaker["probing"]:
+            breaker["probing"] = True
+            return
+        _stats["rejected"] += 1
+        failures = breaker["failures"]
+    raise GraphUnavailable(
+        f"Microsoft Graph is not responding reliably right now ({failures} failed calls in a row). "
+        f"Please try again in {max(1, int(remaining))}s."
+    )
+
+def _record(user_key, ok):
+    with _lock:
+        if ok:
+            _breakers.pop(user_key, None)
+            return
+        breaker = _breakers.setdefault(user_key, {"failures": 0, "opened_at": None, "probing": False})
+        breaker["failures"] += 1
+        if breaker["probing"] or breaker["failures"] >= GRAPH_BREAKER_FAILURES:
+            breaker.update(opened_at=time.time(), probing=False)
+
+def _send(method, url, kwargs):
+    started = time.time()
+    response = requests.request(method, url, **kwargs)
+    return response, time.time() - started
+
+def _retry_after(response):
+    """Seconds Graph asked to wait before retrying a throttled call, or None."""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+def request(method, url, hedge=None, **kwargs):
+    """
+    requests.request for Graph with a deadline on every call, a hedged second attempt for
+    slow idempotent reads (GETs by default) and a circuit breaker that fails fast while
+    Graph keeps timing out or returning 5xx. A 429 only throttles one mailbox, so it does
+    not count towards the breaker; it is retried once after its Retry-After instead.
+    """
+    user_key = get_current_user()
+    _admit(user_key)
+    kwargs.setdefault("timeout", (GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT))
+    if hedge is None:
+        hedge = method.upper() == "GET"
+    response = _attempt(user_key, method, url, hedge, kwargs)
+    if response.status_code == 429:
+        wait_seconds = _retry_after(response)
+        if wait_seconds is not None and wait_seconds <= GRAPH_RETRY_AFTER_MAX:
+            with _lock:
+                _stats["throttled"] += 1
+            time.sleep(wait_seconds)
+            response = _attempt(user_key, method, url, hedge, kwargs)
+    return response
+
+def _attempt(user_key, method, url, hedge, kwargs):
+    delay = _hedge_delay() if hedge and GRAPH_HEDGE_ENABLED else None
+    try:
+        if delay is None:
+            response, elapsed = _send(method, url, kwargs)
+        else:
+            first = _executor.submit(_send, method, url, kwargs)
+            done, _ = wait([first], timeout=delay)
+            attempts = [first]
+            if not done:
+                with _lock:
+                    _stats["hedged"] += 1
+                attempts.append(_executor.submit(_send, method, url, kwargs))
+            # The first attempt to succeed wins; the other is left to finish on its own
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        response, elapsed = future.result()
+                        if future is not first:
+                            with _lock:
+                                _stats["hedge_wins"] += 1
+                        pending = set()
+                        error = None
+                        break
+                    error = future.exception()
+            if error is not None:
+                raise error
+    except (requests.Timeout, requests.ConnectionError) as e:
+        with _lock:
+            _stats["timeouts"] += isinstance(e, requests.Timeout)
+        _record(user_key, False)
+        raise Exception(f"Microsoft Graph did not respond in time ({method} {url.split('?')[0]}): {e}")
+    except Exception:
+        _record(user_key, False)
+        raise
+    failed = response.status_code >= 500
+    _record(user_key, not failed)
+    if method.upper() == "GET" and not failed and response.status_code != 429:
+        with _lock:
+            _latencies.append(elapsed)
+    return response
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        breaker = _breakers.get(get_current_user())
+        result["breaker_open"] = breaker is not None and breaker["opened_at"] is not None
+    result["hedge_delay"] = _hedge_delay()
+    return result
+
+def breaker_middleware():
+    """
+    Agent middleware that hands a GraphUnavailable from a tool back to the model as that
+    tool's result, so the turn and the other calls of its step carry on.
+    """
+    from langchain.agents.middleware import AgentMiddleware
+    from langchain_core.messages import ToolMessage
+
+    class BreakerMiddleware(AgentMiddleware):
+        def wrap_tool_call(self, request, handler):
+            try:
+                return handler(request)
+            except GraphUnavailable as e:
+                return ToolMessage(
+                    content=f"❌ {e}",
+                    tool_call_id=request.tool_call["id"],
+                    name=request.tool_call["name"],
+                    status="error",
+                )
+
+    return BreakerMiddleware()
@@ -0,0 +1,39 @@
+import os
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "auto" uses orjson when it is installed, "stdlib" forces the json module
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None and JSON_CODEC != "stdlib":
+    NAME = "orjson"
+
+    def dumps(obj):
+        """Serializes to compact UTF-8 bytes, ready to send as a request body."""
+        return orjson.dumps(obj)
+
+    def loads(data):
+        """Parses bytes or str; pass response.content to skip decoding the body to text first."""
+        return orjson.loads(data)
+else:
+    NAME = "json"
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj):
+        """Serializes to compact UTF-8 bytes, ready to send as a request body."""
+        return _encoder.encode(obj).encode("utf-8")
+
+    def loads(data):
+        """Parses bytes or str; pass response.content to skip decoding the body to text first."""
+        return json.loads(data)
+
+def dumps_str(obj):
+    """Serializes to a compact str for embedding in tool results."""
+    return dumps(obj).decode("utf-8")
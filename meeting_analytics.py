@@ -0,0 +1,289 @@
+import os
+import threading
+import datetime
+from collections import OrderedDict
+from dotenv import load_dotenv
+from graph_api_auth import get_access_token, get_current_user
+from response_cache import cached_read, snapshot_version
+from calendar_tools import _calendar_view_request, _iter_pages, _zone, CALENDAR_TIMEZONE
+import graph_client
+import json_codec
+import outbox
+import prefetch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+load_dotenv()
+
+ANALYTICS_TIMEZONE = os.getenv("ANALYTICS_TIMEZONE") or CALENDAR_TIMEZONE
+# Working hours (local time, Monday-Friday) within which focus-time gaps are looked for
+ANALYTICS_WORKDAY = os.getenv("ANALYTICS_WORKDAY", "09:00-17:00")
+ANALYTICS_FOCUS_MINUTES = int(os.getenv("ANALYTICS_FOCUS_MINUTES", "120"))
+ANALYTICS_MAX_TABLES = int(os.getenv("ANALYTICS_MAX_TABLES", "8"))
+ANALYTICS_MAX_ROWS = 60
+
+_lock = threading.Lock()
+# (user_key, snapshot version, start, end, calendar) -> EventTable; most recent last
+_tables = OrderedDict()
+
+class EventTable:
+    """
+    Events of one window as columns: start/end in UTC epoch seconds, the organizer's index
+    in people, and attendees in CSR form (attendee_ids[attendee_ptr[i]:attendee_ptr[i+1]]
+    are event i's). Cancelled, all-day and "free" events are left out.
+    """
+
+    def __init__(self, start, end, organizer, attendee_ptr, attendee_ids, people, owners):
+        self.start = start
+        self.end = end
+        self.organizer = organizer
+        self.attendee_ptr = attendee_ptr
+        self.attendee_ids = attendee_ids
+        self.people = people
+        # Indexes in people of the calendar's own addresses, left out of "top attendees"
+        self.owners = owners
+
+    def __len__(self):
+        return len(self.start)
+
+    @classmethod
+    def from_pages(cls, pages, owner_addresses=()):
+        starts, ends, organizers, attendee_counts, attendee_ids = [], [], [], [], []
+        index = {}
+
+        def person(address):
+            address = address.lower()
+            if address not in index:
+                index[address] = len(index)
+            return index[address]
+
+        for page in pages:
+            for event in page:
+                if event.get('isCancelled') or event.get('isAllDay') or event.get('showAs') == 'free':
+                    continue
+                starts.append(event['start']['dateTime'][:19])
+                ends.append(event['end']['dateTime'][:19])
+                organizers.append(person((event.get('organizer') or {}).get('emailAddress', {}).get('address', '')))
+                addresses = {
+                    a['emailAddress'].get('address', '').lower() for a in event.get('attendees', [])
+                } - {''}
+                attendee_counts.append(len(addresses))
+                attendee_ids.extend(person(address) for address in addresses)
+
+        # numpy parses ISO timestamps in one pass
+        start = np.array(starts, dtype='datetime64[s]').astype(np.int64)
+        end = np.array(ends, dtype='datetime64[s]').astype(np.int64)
+        attendee_ptr = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(np.array(attendee_counts, dtype=np.int64), out=attendee_ptr[1:])
+        people = [None] * len(index)
+        for address, i in index.items():
+            people[i] = address
+        owners = [index[a.lower()] for a in owner_addresses if a and a.lower() in index]
+        return cls(
+            start, end,
+            np.array(organizers, dtype=np.int32),
+            attendee_ptr,
+            np.array(attendee_ids, dtype=np.int32),
+            people,
+            np.array(owners, dtype=np.int32)
+        )
+
+    def local(self, seconds, zone):
+        """
+        Shifts UTC epoch seconds to local wall-clock seconds. Offsets are looked up once per
+        distinct day, and per hour only on days where the offset changes (DST switches).
+        """
+        if zone.key == "UTC" or not len(seconds):
+            return seconds
+
+        def offsets(points):
+            return np.array([
+                datetime.datetime.fromtimestamp(int(point), zone).utcoffset().total_seconds() for point in points
+            ], dtype=np.int64)
+
+        days, position = np.unique(seconds // 86400, return_inverse=True)
+        position = position.ravel()
+        at_midnight, next_midnight = offsets(days * 86400), offsets((days + 1) * 86400)
+        shift = at_midnight[position]
+        switching = (at_midnight != next_midnight)[position]
+        if switching.any():
+            hours, hour_position = np.unique(seconds[switching] // 3600, return_inverse=True)
+            shift[switching] = offsets(hours * 3600)[hour_position.ravel()]
+        return seconds + shift
+
+def _merge(start, end):
+    """Union of intervals as sorted, non-overlapping (start, end) arrays."""
+    if not len(start):
+        return start, end
+    order = np.argsort(start, kind="stable")
+    start, end = start[order], end[order]
+    reach = np.maximum.accumulate(end)
+    first = np.ones(len(start), dtype=bool)
+    first[1:] = start[1:] > reach[:-1]
+    block_start = start[first]
+    block_end = np.maximum.reduceat(end, np.flatnonzero(first))
+    return block_start, block_end
+
+def load(table, local_start, group_by):
+    """Meeting hours and counts per day, week or month of the local start time."""
+    days = (local_start // 86400).astype('datetime64[D]')
+    if group_by == "month":
+        buckets = days.astype('datetime64[M]').astype('datetime64[D]')
+    elif group_by == "week":
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday
+        buckets = days - ((days.astype(np.int64) + 3) % 7)
+    else:
+        buckets = days
+    labels, position = np.unique(buckets, return_inverse=True)
+    hours = np.bincount(position.ravel(), weights=(table.end - table.start) / 3600, minlength=len(labels))
+    counts = np.bincount(position.ravel(), minlength=len(labels))
+    return labels, hours, counts
+
+def overlap(table):
+    """Total meeting hours, hours actually blocked, and hours double-booked."""
+    total = float((table.end - table.start).sum()) / 3600
+    block_start, block_end = _merge(table.start, table.end)
+    busy = float((block_end - block_start).sum()) / 3600
+    return total, busy, total - busy
+
+def top_attendees(table, limit=10):
+    """People met most often, with shared meeting hours, the calendar's owners excluded."""
+    counts = np.bincount(table.attendee_ids, minlength=len(table.people))
+    durations = np.repeat(table.end - table.start, np.diff(table.attendee_ptr))
+    hours = np.bincount(table.attendee_ids, weights=durations / 3600, minlength=len(table.people))
+    counts[table.owners] = 0
+    ranked = np.argsort(-counts, kind="stable")[:limit]
+    return [(table.people[i], int(counts[i]), float(hours[i])) for i in ranked if counts[i] > 0]
+
+def focus_gaps(local_start, local_end, window_start, window_end, minutes):
+    """
+    Free stretches of at least `minutes` inside working hours. Non-working time is added
+    as busy blocks, so every gap left between merged blocks lies within a workday.
+    """
+    begin, finish = ANALYTICS_WORKDAY.split("-")
+    day_begin = int(begin[:2]) * 3600 + int(begin[3:5]) * 60
+    day_finish = int(finish[:2]) * 3600 + int(finish[3:5]) * 60
+    days = np.arange(window_start // 86400, (window_end - 1) // 86400 + 1, dtype=np.int64)
+    workdays = days[((days + 3) % 7) < 5]
+    work_start = np.clip(workdays * 86400 + day_begin, window_start, window_end)
+    work_end = np.clip(workdays * 86400 + day_finish, window_start, window_end)
+    # A workday the window only touches outside working hours doesn't count
+    worked = work_end > work_start
+    workdays, work_start, work_end = workdays[worked], work_start[worked], work_end[worked]
+    off_start = np.concatenate(([window_start - 1], work_end))
+    off_end = np.concatenate((work_start, [window_end + 1]))
+    block_start, block_end = _merge(
+        np.concatenate((local_start, off_start)),
+        np.concatenate((local_end, off_end))
+    )
+    gap_start, gap_end = block_end[:-1], block_start[1:]
+    keep = (gap_end - gap_start) >= minutes * 60
+    return gap_start[keep], gap_end[keep], len(workdays)
+
+def _owner_addresses(access_token, calendar):
+    if calendar and "@" in calendar:
+        return [calendar]
+    response = graph_client.get(
+        "https://graph.microsoft.com/v1.0/me",
+        headers={'Authorization': 'Bearer ' + access_token},
+        params={"$select": "mail,userPrincipalName"}
+    )
+    if response.status_code != 200:
+        return []
+    me = json_codec.loads(response.content)
+    return [me.get('mail'), me.get('userPrincipalName')]
+
+def load_table(time_window, calendar=None):
+    """
+    Columns for the window, from the prefetched week when it covers it, otherwise streamed
+    page by page from calendarView. Tables are reused until the calendar changes.
+    """
+    user_key = get_current_user()
+    key = (user_key, snapshot_version(user_key), time_window['start'], time_window['end'], calendar)
+    with _lock:
+        table = _tables.get(key)
+        if table is not None:
+            _tables.move_to_end(key)
+            return table
+    access_token = get_access_token()
+    events = None if calendar else prefetch.lookup(time_window)
+    if events is not None:
+        pages = [events]
+    else:
+        url, headers, params = _calendar_view_request(time_window, access_token, calendar)
+        params.update({"$select": "start,end,organizer,attendees,isCancelled,isAllDay,showAs", "$top": 500})
+        pages = _iter_pages(url, headers, params)
+    table = EventTable.from_pages(pages, _owner_addresses(access_token, calendar))
+    with _lock:
+        _tables[key] = table
+        while len(_tables) > ANALYTICS_MAX_TABLES:
+            _tables.popitem(last=False)
+    return table
+
+def _local_bounds(time_window, zone):
+    """
+    The window as local wall-clock seconds and as the UTC window to query. Bounds without
+    an offset are local times in zone, so "Monday to Wednesday" means the user's days.
+    """
+    local, utc = [], {}
+    for name in ("start", "end"):
+        parsed = datetime.datetime.fromisoformat(time_window[name].replace("Z", "+00:00"))
+        parsed = parsed.astimezone(zone) if parsed.tzinfo else parsed.replace(tzinfo=zone)
+        local.append(int(np.datetime64(parsed.replace(tzinfo=None), 's').astype(np.int64)))
+        utc[name] = parsed.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    return local[0], local[1], utc
+
+@cached_read
+def analyze_meetings(time_window, metrics=None, group_by="week", calendar=None, timezone=None):
+    """
+    Meeting statistics for a time window: load per day/week/month, double-booked time,
+    most frequent attendees and focus-time gaps.
+    """
+    if np is None:
+        raise Exception("Meeting analytics needs NumPy. Install it with: pip install numpy")
+    zone = _zone(timezone or ANALYTICS_TIMEZONE)
+    if zone is None:
+        return f"Unknown time zone '{timezone or ANALYTICS_TIMEZONE}'. Use an IANA name like 'Europe/Berlin'."
+    metrics = set(metrics or ["load", "overlap", "attendees", "focus"])
+    outbox.flush_pending()
+    window_start, window_end, utc_window = _local_bounds(time_window, zone)
+    table = load_table(utc_window, calendar)
+    if not len(table):
+        return "No meetings found for this time period."
+    local_start, local_end = table.local(table.start, zone), table.local(table.end, zone)
+    lines = [f"📊 {len(table)} meeting(s) from {time_window['start'][:10]} to {time_window['end'][:10]} ({zone.key})"]
+
+    if "load" in metrics:
+        labels, hours, counts = load(table, local_start, group_by)
+        lines.append(f"\nMeeting load per {group_by} (average {hours.mean():.1f}h, busiest {hours.max():.1f}h):")
+        rows = [f"   {str(label)[:7] if group_by == 'month' else label}: {h:.1f}h in {c} meeting(s)"
+                for label, h, c in zip(labels, hours, counts)]
+        if len(rows) > ANALYTICS_MAX_ROWS:
+            rows = rows[:ANALYTICS_MAX_ROWS // 2] + [f"   ... {len(rows) - ANALYTICS_MAX_ROWS} more ..."] + rows[-ANALYTICS_MAX_ROWS // 2:]
+        lines.extend(rows)
+
+    if "overlap" in metrics:
+        total, busy, double_booked = overlap(table)
+        lines.append(f"\nTime in meetings: {total:.1f}h scheduled, {busy:.1f}h blocked, {double_booked:.1f}h double-booked")
+
+    if "attendees" in metrics:
+        lines.append("\nMet most often:")
+        for address, count, hours in top_attendees(table):
+            lines.append(f"   👤 {address}: {count} meeting(s), {hours:.1f}h")
+
+    if "focus" in metrics:
+        gap_start, gap_end, workdays = focus_gaps(local_start, local_end, window_start, window_end, ANALYTICS_FOCUS_MINUTES)
+        focus_hours = float((gap_end - gap_start).sum()) / 3600
+        lines.append(
+            f"\nFocus time ({ANALYTICS_FOCUS_MINUTES}+ min free within {ANALYTICS_WORKDAY} on weekdays): "
+            f"{len(gap_start)} block(s), {focus_hours:.1f}h total, {focus_hours / max(workdays, 1):.1f}h per workday"
+        )
+        if len(gap_start):
+            longest = int(np.argmax(gap_end - gap_start))
+            begin = np.datetime64(int(gap_start[longest]), 's').astype(datetime.datetime)
+            end = np.datetime64(int(gap_end[longest]), 's').astype(datetime.datetime)
+            lines.append(f"   Longest: {begin:%a %Y-%m-%d %H:%M}-{end:%H:%M}")
+    return "\n".join(lines)
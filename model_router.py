@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import threading
+from dotenv import load_dotenv
+import prompt_cache
+
+load_dotenv()
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+# Picks tools and fills in their arguments
+FAST_MODEL = os.getenv("FAST_MODEL", "gemini-2.0-flash-lite")
+# Writes answers from large tool results and takes over when the fast model is unsure
+STRONG_MODEL = os.getenv("STRONG_MODEL", "gemini-2.0-flash")
+# Tool results at least this long (characters), or this many at once, are summarized by the strong model
+ROUTER_SYNTHESIS_CHARS = int(os.getenv("ROUTER_SYNTHESIS_CHARS", "2000"))
+ROUTER_SYNTHESIS_RESULTS = int(os.getenv("ROUTER_SYNTHESIS_RESULTS", "3"))
+# Gemini's average token log-probability below which a fast answer counts as unsure
+ROUTER_MIN_AVG_LOGPROB = float(os.getenv("ROUTER_MIN_AVG_LOGPROB", "-0.6"))
+
+TIERS = ("fast", "strong")
+
+_HEDGE = re.compile(r"\b(i'?m not sure|i am not sure|i don'?t know|not certain|unable to determine|cannot determine)\b", re.IGNORECASE)
+_FINISHED = {"STOP", "stop", "end_turn", "tool_calls", None}
+
+_lock = threading.Lock()
+_stats = {
+    tier: {"calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0}
+    for tier in TIERS
+}
+_escalations = {}
+
+def models(temperature=0):
+    """The fast and strong chat models from FAST_MODEL and STRONG_MODEL."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    strong = ChatGoogleGenerativeAI(model=STRONG_MODEL, temperature=temperature)
+    if not MODEL_ROUTING or FAST_MODEL == STRONG_MODEL:
+        return strong, strong
+    return ChatGoogleGenerativeAI(model=FAST_MODEL, temperature=temperature), strong
+
+def _tool_results(messages):
+    """The tool results at the end of the conversation, i.e. what the next call has to act on."""
+    results = []
+    for message in reversed(messages):
+        if getattr(message, "type", None) != "tool":
+            break
+        results.append(message)
+    return results
+
+def route(messages):
+    """
+    Returns (tier, reason) for the next model call. Choosing a tool for a new request, or
+    the next tool after a short result, goes to the fast model; answering from long or many
+    tool results, or after a tool error, goes to the strong one.
+    """
+    results = _tool_results(messages)
+    if not results:
+        return "fast", "tool selection"
+    contents = [str(message.content) for message in results]
+    if any(getattr(message, "status", None) == "error" or content.startswith(("Error", "❌")) for message, content in zip(results, contents)):
+        return "strong", "tool error"
+    if len(results) >= ROUTER_SYNTHESIS_RESULTS or sum(len(content) for content in contents) >= ROUTER_SYNTHESIS_CHARS:
+        return "strong", "synthesis"
+    return "fast", "follow-up"
+
+def low_confidence(message, tools):
+    """The reason a fast model's reply should be redone by the strong model, or None."""
+    if message is None:
+        return "no reply"
+    metadata = getattr(message, "response_metadata", None) or {}
+    if metadata.get("finish_reason") not in _FINISHED:
+        return "unfinished reply"
+    if getattr(message, "invalid_tool_calls", None):
+        return "malformed tool call"
+    tool_calls = getattr(message, "tool_calls", None) or []
+    if tool_calls:
+        schemas = {declaration["name"]: declaration.get("parameters", {}) for declaration in prompt_cache.declarations(tools)}
+        for call in tool_calls:
+            if call["name"] not in schemas:
+                return "unknown tool"
+            if set(schemas[call["name"]].get("required", [])) - set(call.get("args") or {}):
+                return "missing arguments"
+    else:
+        text = message.text if isinstance(getattr(message, "text", None), str) else str(message.content or "")
+        if not text.strip():
+            return "empty reply"
+        if _HEDGE.search(text):
+            return "hedged answer"
+    logprob = metadata.get("avg_logprobs")
+    if logprob is not None and logprob < ROUTER_MIN_AVG_LOGPROB:
+        return "low logprob"
+    return None
+
+def record(tier, seconds, messages):
+    """Counts one call to a tier with its latency and the token usage of the messages it returned."""
+    with _lock:
+        tier_stats = _stats[tier]
+        tier_stats["calls"] += 1
+        tier_stats["seconds"] += seconds
+        for message in messages:
+            usage = getattr(message, "usage_metadata", None) or {}
+            tier_stats["input_tokens"] += usage.get("input_tokens", 0)
+            tier_stats["output_tokens"] += usage.get("output_tokens", 0)
+
+def escalated(reason):
+    with _lock:
+        _escalations[reason] = _escalations.get(reason, 0) + 1
+
+def stats():
+    """Calls, average latency and tokens per tier, and why calls were escalated."""
+    with _lock:
+        result = {tier: dict(values) for tier, values in _stats.items()}
+        escalations = dict(_escalations)
+    for values in result.values():
+        values["avg_seconds"] = values["seconds"] / values["calls"] if values["calls"] else 0.0
+    result["escalations"] = escalations
+    return result
+
+def model_router_middleware(fast, strong, decide=None):
+    """
+    Agent middleware that sends each model call to the fast or strong model (see route) and
+    redoes a fast call with the strong model when its reply looks unsure (see low_confidence).
+    decide(messages) can replace route for experiments; it returns (tier, reason).
+    """
+    from langchain.agents.middleware import AgentMiddleware
+
+    decide = decide or route
+
+    def call(tier, request, handler):
+        started = time.perf_counter()
+        response = None
+        try:
+            response = handler(request.override(model=fast if tier == "fast" else strong))
+            return response
+        finally:
+            # Failed calls count too: their latency was paid
+            record(tier, time.perf_counter() - started, response.result if response is not None else [])
+
+    class ModelRouterMiddleware(AgentMiddleware):
+        def wrap_model_call(self, request, handler):
+            if not MODEL_ROUTING or fast is strong:
+                return call("strong", request, handler)
+            tier, _ = decide(request.messages)
+            if tier == "strong":
+                return call("strong", request, handler)
+            try:
+                response = call("fast", request, handler)
+            except Exception:
+                # An outage or quota error on the small model shouldn't fail the turn
+                escalated("fast model error")
+                return call("strong", request, handler)
+            reply = next((m for m in reversed(response.result) if getattr(m, "type", None) == "ai"), None)
+            reason = low_confidence(reply, request.tools)
+            if reason is None:
+                return response
+            escalated(reason)
+            return call("strong", request, handler)
+
+    return ModelRouterMiddleware()
@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+import contextvars
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COALESCE_WRITES = os.getenv("COALESCE_WRITES", "true").lower() == "true"
+
+_TICKET = re.compile(r"\[outbox:(\d+)\]")
+_current_outbox = contextvars.ContextVar("current_outbox", default=None)
+
+class ConflictingChange(Exception):
+    pass
+
+class Outbox:
+    """
+    Pending changes of one agent turn, merged per event ID so that several tool calls on
+    the same event are sent as a single PATCH when the outbox is flushed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._results = {}
+        self._next_ticket = 1
+
+    def stage(self, event_id, fields=None, add_attendees=None, remove_attendees=None, calendar=None):
+        """Queues a change and returns its ticket; raises ConflictingChange if it contradicts a change already queued this turn."""
+        with self._lock:
+            pending = self._pending.setdefault(
+                event_id, {"fields": {}, "add_attendees": [], "remove_attendees": [], "tickets": [], "calendar": calendar}
+            )
+            for field, value in (fields or {}).items():
+                if field in pending["fields"] and pending["fields"][field] != value:
+                    raise ConflictingChange(
+                        f"Conflicting changes to event {event_id}: '{field}' was already changed to "
+                        f"{pending['fields'][field]!r} in this request"
+                    )
+            added = {email.lower() for email in pending["add_attendees"]} | {email.lower() for email in add_attendees or []}
+            removed = {email.lower() for email in pending["remove_attendees"]} | {email.lower() for email in remove_attendees or []}
+            if added & removed:
+                raise ConflictingChange(
+                    f"Conflicting changes to event {event_id}: {', '.join(sorted(added & removed))} "
+                    f"would be both added and removed in this request"
+                )
+            pending["fields"].update(fields or {})
+            pending["add_attendees"].extend(add_attendees or [])
+            pending["remove_attendees"].extend(remove_attendees or [])
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            pending["tickets"].append(ticket)
+            return ticket
+
+    def discard(self, event_id, reason):
+        """Drops the queued changes of an event, e.g. because it is being deleted."""
+        with self._lock:
+            pending = self._pending.pop(event_id, None)
+            if pending:
+                for ticket in pending["tickets"]:
+                    self._results[ticket] = reason
+
+    def flush(self):
+        """Sends every queued change, one PATCH per event, and records the outcome for each ticket."""
+        # Imported here because calendar_tools stages its changes in this module
+        from calendar_tools import _apply_event_changes
+        from tool_executor import run_parallel
+
+        with self._lock:
+            pending = list(self._pending.items())
+            self._pending.clear()
+        if not pending:
+            return {}
+        outcomes = run_parallel(
+            [
+                (_apply_event_changes, (event_id, p["fields"], p["add_attendees"], p["remove_attendees"], p["calendar"]), {})
+                for event_id, p in pending
+            ],
+            return_exceptions=True
+        )
+        flushed = {}
+        for (event_id, p), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                message = f"❌ {outcome}"
+            else:
+                changes = sorted(set(p["fields"]) | ({"attendees"} if p["add_attendees"] or p["remove_attendees"] else set()))
+                message = (
+                    f"✅ Event updated successfully ({', '.join(changes)}; "
+                    f"{len(p['tickets'])} change(s) sent as one update)."
+                )
+            for ticket in p["tickets"]:
+                flushed[ticket] = message
+        with self._lock:
+            self._results.update(flushed)
+        return flushed
+
+    def result(self, ticket):
+        with self._lock:
+            return self._results.pop(ticket, None)
+
+def current():
+    return _current_outbox.get()
+
+def begin_turn():
+    """Starts collecting the writes of an agent turn; does nothing when COALESCE_WRITES is off."""
+    if not COALESCE_WRITES:
+        return None
+    outbox = Outbox()
+    _current_outbox.set(outbox)
+    return outbox
+
+def end_turn():
+    """Flushes whatever is still queued and stops collecting writes."""
+    outbox = _current_outbox.get()
+    _current_outbox.set(None)
+    if outbox is not None:
+        outbox.flush()
+
+def flush_pending():
+    """Sends queued writes before a read so it sees them (read-after-write)."""
+    outbox = _current_outbox.get()
+    if outbox is not None:
+        outbox.flush()
+
+def queued_message(ticket, description):
+    return f"⏳ {description} queued [outbox:{ticket}]; it is sent together with the other changes to this event."
+
+def outbox_middleware():
+    """
+    Agent middleware that flushes the outbox at the end of every tool step (before the next
+    model call) and rewrites each queued tool result with the merged outcome.
+    """
+    from langchain.agents.middleware import AgentMiddleware
+    from langchain_core.messages import ToolMessage
+
+    class OutboxMiddleware(AgentMiddleware):
+        def before_model(self, state, runtime):
+            outbox = current()
+            if outbox is None:
+                return None
+            outbox.flush()
+            updates = []
+            for message in state["messages"]:
+                if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+                    continue
+                match = _TICKET.search(message.content)
+                outcome = match and outbox.result(int(match.group(1)))
+                if outcome:
+                    updates.append(ToolMessage(
+                        content=outcome,
+                        tool_call_id=message.tool_call_id,
+                        name=message.name,
+                        id=message.id
+                    ))
+            return {"messages": updates} if updates else None
+
+    return OutboxMiddleware()
@@ -0,0 +1,230 @@
+import os
+import re
+import time
+import threading
+import graph_client
+import json_codec
+from collections import OrderedDict
+from dotenv import load_dotenv
+from graph_api_auth import get_access_token, get_cached_token, get_current_user, on_token_acquired
+import prefetch
+
+load_dotenv()
+
+GRAPH_API_ENDPOINT = 'https://graph.microsoft.com/v1.0'
+DIRECTORY_REFRESH = int(os.getenv("DIRECTORY_REFRESH", "3600"))
+DIRECTORY_MAX_USERS = int(os.getenv("DIRECTORY_MAX_USERS", "200"))
+MAX_PREFIX = 12
+
+_WORDS = re.compile(r"[a-z0-9]+")
+
+class UnresolvedName(Exception):
+    """A name that did not resolve to exactly one person; candidates are the people it might mean."""
+
+    def __init__(self, message, candidates):
+        self.candidates = candidates
+        super().__init__(message)
+
+def _tokens(text):
+    return _WORDS.findall(text.lower())
+
+def _trigrams(text):
+    text = f"  {' '.join(_tokens(text))} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class Directory:
+    """
+    People one user deals with, indexed by name/address prefixes and trigrams so that a
+    name resolves to an address without a Graph call. Entries rank by how often the user
+    meets or mails them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.people = {}
+        self.prefixes = {}
+        self.trigrams = {}
+        self.loaded_at = 0.0
+        self.contacts_delta = None
+        self.loading = False
+
+    def add(self, email, name="", weight=1.0):
+        """Adds a person or raises the rank of a known one; only new words are indexed."""
+        email = (email or "").strip()
+        if "@" not in email:
+            return
+        key = email.lower()
+        with self.lock:
+            person = self.people.get(key)
+            if person is None:
+                person = {"email": email, "name": name or "", "score": 0.0}
+                self.people[key] = person
+                self._index(key, email)
+            if name and not person["name"]:
+                person["name"] = name
+            if name:
+                self._index(key, name)
+            person["score"] += weight
+
+    def _index(self, key, text):
+        for token in _tokens(text):
+            for length in range(1, min(len(token), MAX_PREFIX) + 1):
+                self.prefixes.setdefault(token[:length], set()).add(key)
+        for trigram in _trigrams(text):
+            self.trigrams.setdefault(trigram, set()).add(key)
+
+    def lookup(self, query, limit=5):
+        """Returns the best matching people for a name or partial name, highest rank first."""
+        tokens = [token[:MAX_PREFIX] for token in _tokens(query)]
+        if not tokens:
+            return []
+        with self.lock:
+            matches = None
+            for token in tokens:
+                keys = self.prefixes.get(token, set())
+                matches = set(keys) if matches is None else matches & keys
+            if matches:
+                ranked = sorted(matches, key=lambda key: -self.people[key]["score"])
+            else:
+                # Nothing shares a prefix: fall back to trigram similarity for typos
+                wanted = _trigrams(query)
+                overlap = {}
+                for trigram in wanted:
+                    for key in self.trigrams.get(trigram, ()):
+                        overlap[key] = overlap.get(key, 0) + 1
+                similar = [key for key, count in overlap.items() if count / len(wanted) >= 0.5]
+                ranked = sorted(similar, key=lambda key: (-overlap[key], -self.people[key]["score"]))
+            return [dict(self.people[key]) for key in ranked[:limit]]
+
+_lock = threading.Lock()
+_directories = OrderedDict()
+
+def _directory(user_key=None):
+    user_key = user_key or get_current_user()
+    with _lock:
+        directory = _directories.get(user_key)
+        if directory is None:
+            directory = Directory()
+            _directories[user_key] = directory
+            while len(_directories) > DIRECTORY_MAX_USERS:
+                _directories.popitem(last=False)
+        _directories.move_to_end(user_key)
+        return directory
+
+def _load(directory, access_token):
+    """Merges /me/people and changed contacts into the directory; repeated calls are incremental."""
+    headers = {'Authorization': 'Bearer ' + access_token}
+    response = graph_client.get(f"{GRAPH_API_ENDPOINT}/me/people", headers=headers, params={"$top": 100})
+    if response.status_code == 200:
+        people = json_codec.loads(response.content).get('value', [])
+        for rank, person in enumerate(people):
+            for address in person.get('scoredEmailAddresses', []):
+                # /me/people is already ordered by relevance
+                directory.add(address.get('address'), person.get('displayName', ''), weight=(len(people) - rank) / len(people))
+
+    url = directory.contacts_delta or f"{GRAPH_API_ENDPOINT}/me/contacts/delta"
+    params = None if directory.contacts_delta else {"$select": "displayName,emailAddresses"}
+    while url:
+        response = graph_client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            break
+        page = json_codec.loads(response.content)
+        for contact in page.get('value', []):
+            for address in contact.get('emailAddresses', []):
+                directory.add(address.get('address'), contact.get('displayName', ''), weight=0.5)
+        url = page.get('@odata.nextLink')
+        params = None
+        if page.get('@odata.deltaLink'):
+            directory.contacts_delta = page['@odata.deltaLink']
+    directory.loaded_at = time.time()
+
+def _refresh_in_background(directory, token_provider):
+    with directory.lock:
+        if directory.loading:
+            return
+        directory.loading = True
+
+    def run():
+        try:
+            access_token = token_provider()
+            if access_token:
+                _load(directory, access_token)
+        except Exception:
+            pass
+        finally:
+            with directory.lock:
+                directory.loading = False
+    threading.Thread(target=run, name="people-directory", daemon=True).start()
+
+@on_token_acquired
+def _warm_after_sign_in(client_id, tenant_id, user_key):
+    directory = _directory(user_key)
+    if time.time() - directory.loaded_at > DIRECTORY_REFRESH:
+        _refresh_in_background(directory, lambda: get_cached_token(client_id, tenant_id, user_key))
+
+def observe(events):
+    """Ranks up everyone attending the listed events."""
+    directory = _directory()
+    for event in events:
+        for attendee in event.get('attendees', []):
+            address = attendee.get('emailAddress', {})
+            directory.add(address.get('address'), address.get('name', ''))
+
+def lookup(query, limit=5):
+    """Matching people for a (partial) name; loads the directory on first use if sign-in didn't."""
+    directory = _directory()
+    if not directory.loaded_at and not directory.loading:
+        _load(directory, get_access_token())
+    elif time.time() - directory.loaded_at > DIRECTORY_REFRESH:
+        access_token = get_access_token()
+        _refresh_in_background(directory, lambda: access_token)
+    # The prefetched week knows who the user meets right now
+    for email, person in prefetch.attendees().items():
+        if email.lower() not in directory.people:
+            directory.add(email, person["name"], weight=person["meetings"])
+    return directory.lookup(query, limit)
+
+def _whole_word_match(person, words):
+    """True when every word of the reference is a whole word of the person's name or address."""
+    known = set(_tokens(person["name"])) | set(_tokens(person["email"].split("@")[0]))
+    return set(words) <= known
+
+def resolve(reference):
+    """
+    Turns a name into an email address. Addresses pass through unchanged; a name resolves
+    only when exactly one person has it as their full name or as whole words of their name
+    ("Jon", "Jon Smith"). Partial words ("J") and typos raise UnresolvedName with the candidates.
+    """
+    reference = reference.strip()
+    if "@" in reference:
+        return reference
+    # Every match, not just the top few, so a second person with the same name is not missed
+    candidates = lookup(reference, limit=None)
+    words = _tokens(reference)
+    for match in (
+        lambda person: _tokens(person["name"]) == words,
+        lambda person: _whole_word_match(person, words),
+    ):
+        found = [person for person in candidates if match(person)]
+        if len(found) == 1:
+            return found[0]["email"]
+        if found:
+            break
+    if not candidates:
+        raise UnresolvedName(f"No email address known for '{reference}'. Please give their email address.", [])
+    listing = ", ".join(f"{person['name']} <{person['email']}>" for person in candidates[:5])
+    if len(candidates) == 1:
+        raise UnresolvedName(f"'{reference}' only partly matches {listing}. Please confirm or give their email address.", candidates)
+    raise UnresolvedName(f"'{reference}' could be several people: {listing}. Please say which one.", candidates[:5])
+
+def resolve_all(references):
+    """Resolves every reference; raises one UnresolvedName covering all names that did not resolve."""
+    addresses, unresolved = [], []
+    for reference in references or []:
+        try:
+            addresses.append(resolve(reference))
+        except UnresolvedName as e:
+            unresolved.append(e)
+    if unresolved:
+        raise UnresolvedName(" ".join(str(e) for e in unresolved), [person for e in unresolved for person in e.candidates])
+    return addresses
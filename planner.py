@@ -0,0 +1,294 @@
+import os
+import re
+import time
+import datetime
+import threading
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from langchain_core.messages import AIMessage
+from dotenv import load_dotenv
+from tool_executor import run_parallel, PARALLEL_TOOLS
+import json_codec
+import outbox
+import prompt_cache
+import model_router
+
+load_dotenv()
+
+# "auto" plans requests that name several calendar actions, "always" plans every request
+# (the model can still hand simple questions to the agent), "off" always uses the agent
+PLANNER_MODE = os.getenv("PLANNER_MODE", "auto")
+PLANNER_MAX_REPLANS = int(os.getenv("PLANNER_MAX_REPLANS", "2"))
+PLANNER_HISTORY = int(os.getenv("PLANNER_HISTORY", "6"))
+
+_lock = threading.Lock()
+# mode -> [requests, LLM round trips]
+_stats = {"planner": [0, 0], "agent": [0, 0]}
+
+_ACTIONS = re.compile(
+    r"\b(find|look up|add|invite|remove|move|push|pull|shift|reschedule|delete|cancel|create|schedule|book|"
+    r"set|rename|change|update|list|show)\b",
+    re.IGNORECASE
+)
+_REFERENCE = re.compile(r"\{(\w+)\.(events|event|start|end)([+-]\d+[mhd])?\}")
+_HANDLE_LINE = re.compile(r"^\s*Handle: (E\d+)\s*$", re.MULTILINE)
+_TIME_LINE = re.compile(r"^\s*(Start|End): (\S+)\s*$", re.MULTILINE)
+_TICKET = re.compile(r"⏳ .*?\[outbox:(\d+)\][^\n]*")
+_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+PLANNER_PROMPT = """You turn a calendar request into a plan of tool calls that a program runs without asking you again.
+Today is {today}. Use absolute ISO 8601 date-times.
+
+Each step has an id (s1, s2, ...), a tool name, its arguments as a JSON object string, and the ids of the steps it needs first.
+To use what an earlier step found, put one of these in an argument:
+- "{{s1.event}}": the handle of the single event s1 listed (e.g. E3)
+- "{{s1.events}}": the list of handles of every event s1 listed (as the whole argument value)
+- "{{s1.start}}" / "{{s1.end}}": that event's start or end, optionally shifted, e.g. "{{s1.start+30m}}" or "{{s1.end-1h}}"
+Steps that don't depend on each other run at the same time; changes to the same event are sent as one update.
+Set use_agent to true (and no steps) when the request needs judgement about the results, e.g. finding a free slot or answering a question.
+Set question when you must ask the user something before anything can be done.
+
+Tools:
+{tools}"""
+
+REPLAN_PROMPT = """Steps run so far and what they returned:
+{results}
+
+{problem}
+Plan only the remaining work. Earlier results can be referenced by their ids; number new steps from s{next_id}.
+If several events or people match and the request doesn't say which one, set question instead of guessing."""
+
+class PlanStep(BaseModel):
+    id: str = Field(description="Step id like s1")
+    tool: str = Field(description="Tool name")
+    arguments: str = Field(description="Tool arguments as a JSON object")
+    depends_on: List[str] = Field(default_factory=list, description="Ids of steps that must finish first")
+
+class Plan(BaseModel):
+    steps: List[PlanStep] = Field(default_factory=list)
+    use_agent: bool = Field(default=False, description="True when the request should be handled step by step instead")
+    question: Optional[str] = Field(default=None, description="A question for the user when the request is ambiguous")
+
+class StepFailed(Exception):
+    pass
+
+def looks_compound(text):
+    """True when a request names at least two calendar actions, e.g. 'find X, add Y and move it'."""
+    return len({match.lower() for match in _ACTIONS.findall(text or "")}) >= 2
+
+def _shift(value, offset):
+    if not offset:
+        return value
+    moved = datetime.datetime.fromisoformat(value[:19]) + datetime.timedelta(
+        seconds=int(offset[:-1]) * _UNITS[offset[-1]]
+    )
+    return moved.isoformat()
+
+def _resolve(value, results):
+    """Replaces {sN.event}-style references with what step sN found."""
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    if not isinstance(value, str):
+        return value
+
+    def lookup(match):
+        step_id, field, offset = match.groups()
+        output = results.get(step_id)
+        if output is None:
+            raise StepFailed(f"refers to {step_id}, which has no result")
+        handles = _HANDLE_LINE.findall(output)
+        if field == "events":
+            return handles
+        if not handles:
+            raise StepFailed(f"{step_id} found no event to use")
+        if len(handles) > 1:
+            raise StepFailed(f"{step_id} found {len(handles)} events ({', '.join(handles)}); which one is meant is ambiguous")
+        if field == "event":
+            return handles[0]
+        times = dict(_TIME_LINE.findall(output))
+        return _shift(times[field.capitalize()], offset)
+
+    whole = _REFERENCE.fullmatch(value)
+    if whole:
+        return lookup(whole)
+    return _REFERENCE.sub(lambda match: str(lookup(match)), value)
+
+def _dependencies(step):
+    return set(step.depends_on) | {match.group(1) for match in _REFERENCE.finditer(step.arguments)}
+
+class PlanningAgent:
+    """
+    Wraps the tool-calling agent. Requests naming several actions are planned in one model
+    call and run locally: steps whose inputs are ready run in parallel, writes collect in the
+    turn's outbox, and the model is asked again only when a step fails or is ambiguous.
+    invoke() returns the agent's result shape plus "llm_calls" and "mode".
+    """
+
+    def __init__(self, llm, tools, agent, system_prompt=None, mode=None, replan_llm=None):
+        self.tools = {tool.name: tool for tool in tools}
+        self.agent = agent
+        self.mode = mode or PLANNER_MODE
+        tool_schemas, notes = prompt_cache.trim(prompt_cache.declarations(tools), system_prompt)
+        listing = "\n".join(
+            f"- {t['function']['name']}: {t['function']['description']} "
+            f"Arguments: {json_codec.dumps_str(t['function']['parameters'].get('properties', {}))}"
+            for t in tool_schemas
+        )
+        self.tool_listing = (notes + "\n\n" if notes else "") + listing
+        # Plans come from the fast model; replans, and plans it could not produce, from the strong one
+        replan_llm = replan_llm or llm
+        self.planners = {"strong": replan_llm.with_structured_output(Plan, include_raw=True)}
+        self.planners["fast"] = self.planners["strong"] if llm is replan_llm else llm.with_structured_output(Plan, include_raw=True)
+
+    def invoke(self, input, config=None):
+        messages = input["messages"]
+        request = _content(messages[-1]) if messages else ""
+        if self.mode == "always" or (self.mode == "auto" and looks_compound(request)):
+            answer, llm_calls = self._plan_and_run(messages)
+            if answer is not None:
+                _record("planner", llm_calls)
+                return {"messages": list(messages) + [AIMessage(content=answer)], "llm_calls": llm_calls, "mode": "planner"}
+            # The planner handed the request over; its call still counts
+            result = self.agent.invoke({"messages": messages}, config=config)
+            llm_calls += _model_calls(result, messages)
+        else:
+            result = self.agent.invoke({"messages": messages}, config=config)
+            llm_calls = _model_calls(result, messages)
+        _record("agent", llm_calls)
+        return dict(result, llm_calls=llm_calls, mode="agent")
+
+    def _ask(self, prompt_messages, tier="fast"):
+        """Returns (plan, LLM calls)."""
+        if self.planners["fast"] is self.planners["strong"]:
+            tier = "strong"
+        started = time.perf_counter()
+        output = self.planners[tier].invoke(prompt_messages)
+        model_router.record(tier, time.perf_counter() - started, [output["raw"]] if output.get("raw") is not None else [])
+        plan = output.get("parsed")
+        if plan is None:
+            if tier == "fast":
+                model_router.escalated("unreadable plan")
+                plan, calls = self._ask(prompt_messages, "strong")
+                return plan, calls + 1
+            raise Exception(f"The model's plan could not be read: {output.get('parsing_error')}")
+        return (plan if isinstance(plan, Plan) else Plan.model_validate(plan)), 1
+
+    def _plan_and_run(self, messages):
+        """Returns (answer, LLM calls); the answer is None when the agent should take over."""
+        today = datetime.date.today()
+        history = "\n".join(f"{_role(m)}: {_content(m)}" for m in messages[-PLANNER_HISTORY:])
+        prompt = [
+            ("system", PLANNER_PROMPT.format(today=f"{today:%A} {today.isoformat()}", tools=self.tool_listing)),
+            ("user", history)
+        ]
+        try:
+            plan, llm_calls = self._ask(prompt)
+        except Exception:
+            # Nothing has run yet, so the agent can safely take the request instead
+            return None, 1
+        results, shown, done = {}, [], []
+        step_ids = set()
+        for attempt in range(PLANNER_MAX_REPLANS + 1):
+            if plan.question:
+                return "\n\n".join(shown + [plan.question]), llm_calls
+            if plan.use_agent or not plan.steps:
+                return (None if not done else "\n\n".join(shown)), llm_calls
+            step_ids |= {step.id for step in plan.steps}
+            problems = self._execute(plan, results, shown, done)
+            if not problems:
+                return "\n\n".join(shown) or "✅ Done.", llm_calls
+            if attempt == PLANNER_MAX_REPLANS:
+                break
+            replan = REPLAN_PROMPT.format(
+                results="\n".join(done) or "(nothing yet)",
+                problem="Problems:\n" + "\n".join(problems),
+                next_id=1 + max((int(i[1:]) for i in step_ids if i[1:].isdigit()), default=0)
+            )
+            try:
+                plan, calls = self._ask(prompt + [("user", replan)], "strong")
+                llm_calls += calls
+            except Exception as e:
+                llm_calls += 1
+                problems.append(f"Replanning failed: {e}")
+                break
+        return "\n\n".join(shown + [f"❌ {problem}" for problem in problems]), llm_calls
+
+    def _execute(self, plan, results, shown, done):
+        """Runs a plan wave by wave; returns the problems that stopped it (empty on success)."""
+        pending = {step.id: step for step in plan.steps}
+        referenced = set().union(*(_dependencies(step) for step in plan.steps))
+        outputs = {}
+        problems = []
+        while pending and not problems:
+            ready = [step for step in pending.values() if _dependencies(step) <= set(results)]
+            if not ready:
+                problems.append("Steps " + ", ".join(pending) + " depend on steps that don't exist or failed")
+                break
+            calls = []
+            for step in ready:
+                del pending[step.id]
+                try:
+                    tool = self.tools.get(step.tool)
+                    if tool is None:
+                        raise StepFailed(f"there is no tool named {step.tool}")
+                    arguments = _resolve(json_codec.loads(step.arguments or "{}"), results)
+                    calls.append((step, (tool.invoke, (arguments,), {})))
+                except Exception as e:
+                    problems.append(f"{step.id} ({step.tool}) {e}")
+            outcomes = run_parallel(
+                [call for _, call in calls],
+                max_workers=None if PARALLEL_TOOLS else 1,
+                return_exceptions=True
+            )
+            for (step, _), outcome in zip(calls, outcomes):
+                if isinstance(outcome, Exception):
+                    problems.append(f"{step.id} ({step.tool}) failed: {outcome}")
+                    continue
+                results[step.id] = str(outcome)
+                outputs[step.id] = step
+        if problems and pending:
+            problems.append("Not run: " + ", ".join(f"{step.id} ({step.tool})" for step in pending.values()))
+        # Queued writes are sent now, so their outcome replaces the "queued" note
+        outbox.flush_pending()
+        current = outbox.current()
+        for step_id, step in outputs.items():
+            if current is not None:
+                results[step_id] = _TICKET.sub(lambda m: current.result(int(m.group(1))) or m.group(0), results[step_id])
+            done.append(f"{step_id} {step.tool}({step.arguments}) → {results[step_id][:1500]}")
+            # Changes merged into one update report the same outcome; show it once
+            if step_id not in referenced and results[step_id] not in shown:
+                shown.append(results[step_id])
+        return problems
+
+def _content(message):
+    if isinstance(message, tuple):
+        return message[1]
+    if isinstance(message, dict):
+        return message.get("content", "")
+    return message.content
+
+def _role(message):
+    if isinstance(message, tuple):
+        return message[0]
+    if isinstance(message, dict):
+        return message.get("role", "user")
+    return message.type
+
+def _model_calls(result, messages):
+    """Model responses the agent added to the conversation, i.e. its LLM round trips."""
+    return sum(1 for message in result["messages"][len(messages):] if getattr(message, "type", None) == "ai")
+
+def _record(mode, llm_calls):
+    with _lock:
+        _stats[mode][0] += 1
+        _stats[mode][1] += llm_calls
+
+def stats():
+    """Requests and average LLM round trips per request, by mode."""
+    with _lock:
+        return {
+            mode: {"requests": requests, "round_trips": (calls / requests) if requests else 0.0}
+            for mode, (requests, calls) in _stats.items()
+        }
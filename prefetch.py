@@ -0,0 +1,141 @@
+import os
+import time
+import datetime
+import threading
+from dotenv import load_dotenv
+from graph_api_auth import get_current_user, get_cached_token, on_token_acquired, set_current_user
+from response_cache import on_change, snapshot_version
+import recurrence
+
+load_dotenv()
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_DAYS = int(os.getenv("PREFETCH_DAYS", "7"))
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", "300"))
+PREFETCH_MAX_STALENESS = int(os.getenv("PREFETCH_MAX_STALENESS", "600"))
+PREFETCH_IDLE_STOP = int(os.getenv("PREFETCH_IDLE_STOP", "1800"))
+PREFETCH_MAX_USERS = int(os.getenv("PREFETCH_MAX_USERS", "200"))
+
+_lock = threading.Lock()
+# user_key -> warm window: events, attendees, fetched_at, last_used, refresh event, thread
+_windows = {}
+_stats = {"fetches": 0, "fetch_seconds": 0.0, "fetch_errors": 0, "hits": 0, "misses": 0}
+
+def _fetch_window(client_id, tenant_id, user_key):
+    # Imported here because calendar_tools reads from this module's cache
+    from calendar_tools import _calendar_view
+
+    access_token = get_cached_token(client_id, tenant_id, user_key)
+    if access_token is None:
+        return None
+    start = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = start + datetime.timedelta(days=PREFETCH_DAYS + 1)
+    time_window = {"start": start.strftime("%Y-%m-%dT%H:%M:%S"), "end": end.strftime("%Y-%m-%dT%H:%M:%S")}
+    events = _calendar_view(time_window, access_token)
+    attendees = {}
+    for event in events:
+        for attendee in event.get('attendees', []):
+            address = attendee['emailAddress'].get('address', '').lower()
+            if address:
+                entry = attendees.setdefault(address, {"name": attendee['emailAddress'].get('name', ''), "meetings": 0})
+                entry["meetings"] += 1
+    return {"start": start, "end": end, "events": events, "attendees": attendees}
+
+def _refresh_loop(client_id, tenant_id, user_key, window):
+    set_current_user(user_key)
+    while True:
+        with _lock:
+            if _windows.get(user_key) is not window:
+                return
+            if time.time() - window["last_used"] > PREFETCH_IDLE_STOP:
+                del _windows[user_key]
+                return
+        # Cleared before fetching so a change notified mid-fetch triggers another refresh
+        window["refresh"].clear()
+        version = snapshot_version(user_key)
+        started = time.time()
+        try:
+            snapshot = _fetch_window(client_id, tenant_id, user_key)
+        except Exception:
+            snapshot = None
+            with _lock:
+                _stats["fetch_errors"] += 1
+        with _lock:
+            _stats["fetches"] += 1
+            _stats["fetch_seconds"] += time.time() - started
+            if snapshot is None:
+                # Signed out or Graph unavailable; reads fall back to live queries
+                window["snapshot"] = None
+            elif snapshot_version(user_key) == version:
+                snapshot["fetched_at"] = time.time()
+                window["snapshot"] = snapshot
+        window["refresh"].wait(PREFETCH_INTERVAL)
+
+@on_token_acquired
+def start(client_id, tenant_id, user_key):
+    """Starts warming the next PREFETCH_DAYS of the user's calendar in the background, once per user."""
+    if not PREFETCH_ENABLED:
+        return
+    with _lock:
+        window = _windows.get(user_key)
+        if window is not None and window["thread"].is_alive():
+            return
+        while len(_windows) >= PREFETCH_MAX_USERS:
+            oldest = min(_windows, key=lambda key: _windows[key]["last_used"])
+            _windows.pop(oldest)["refresh"].set()
+        window = {"snapshot": None, "last_used": time.time(), "refresh": threading.Event()}
+        window["thread"] = threading.Thread(
+            target=_refresh_loop,
+            args=(client_id, tenant_id, user_key, window),
+            name=f"prefetch-{user_key[:8]}",
+            daemon=True
+        )
+        _windows[user_key] = window
+        window["thread"].start()
+
+def lookup(time_window):
+    """
+    Returns the warm events overlapping time_window, or None when the window is not
+    covered by the current user's prefetched range or the data is too stale.
+    """
+    window_start = recurrence.parse_datetime(time_window['start'])
+    window_end = recurrence.parse_datetime(time_window['end'])
+    with _lock:
+        window = _windows.get(get_current_user())
+        snapshot = window and window["snapshot"]
+        if window is not None:
+            window["last_used"] = time.time()
+        if (
+            not snapshot
+            or time.time() - snapshot["fetched_at"] > PREFETCH_MAX_STALENESS
+            or window_start < snapshot["start"]
+            or window_end > snapshot["end"]
+        ):
+            _stats["misses"] += 1
+            return None
+        _stats["hits"] += 1
+        events = snapshot["events"]
+    return recurrence.expand_window(events, window_start, window_end)
+
+def attendees():
+    """Returns {email: {"name", "meetings"}} for everyone in the current user's warm window."""
+    with _lock:
+        window = _windows.get(get_current_user())
+        snapshot = window and window["snapshot"]
+        return dict(snapshot["attendees"]) if snapshot else {}
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result["warm_users"] = sum(1 for w in _windows.values() if w["snapshot"])
+    total = result["hits"] + result["misses"]
+    result["hit_rate"] = result["hits"] / total if total else 0.0
+    return result
+
+@on_change
+def _refresh_after_change(user_key, event_id):
+    with _lock:
+        window = _windows.get(user_key)
+        if window is not None:
+            window["snapshot"] = None
+            window["refresh"].set()
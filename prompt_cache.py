@@ -0,0 +1,305 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+from state_backend import get_backend
+import json_codec
+
+load_dotenv()
+
+# "auto" caches the prefix with Gemini and falls back to trimmed tool schemas when that is
+# not possible; "trim" only trims, "off" sends the prefix unchanged
+PROMPT_CACHE_MODE = os.getenv("PROMPT_CACHE_MODE", "auto")
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+# A cache expiring within this many seconds gets its TTL extended on the next call
+PROMPT_CACHE_RENEW_BEFORE = int(os.getenv("PROMPT_CACHE_RENEW_BEFORE", "300"))
+# After a failed create (e.g. the prefix is under the model's minimum cache size) trim for this long
+PROMPT_CACHE_RETRY = int(os.getenv("PROMPT_CACHE_RETRY", "900"))
+# Explicit caches need a model that supports them; defaults to the agent's model. Ignored with
+# model tiers (see model_router): a routed call is always answered by its own tier's model
+PROMPT_CACHE_MODEL = os.getenv("PROMPT_CACHE_MODEL", "")
+# A parameter explained the same way in at least this many tools is explained once instead
+PROMPT_CACHE_SHARED_HINTS = int(os.getenv("PROMPT_CACHE_SHARED_HINTS", "3"))
+
+_lock = threading.Lock()
+_stats = {"calls": 0, "cached": 0, "trimmed": 0, "full": 0, "input_tokens": 0, "cache_read_tokens": 0}
+
+_PARAMETERS = re.compile(r"\s*Parameters?:\s*")
+_EXAMPLE = re.compile(r"\s*Example:.*$", re.S)
+_HINT = re.compile(r"^(\w+) \((.+)\)$", re.S)
+
+def declarations(tools):
+    """Tools as function declarations: name, description and JSON schema parameters."""
+    from langchain_core.utils.function_calling import convert_to_openai_tool
+    return [convert_to_openai_tool(tool)["function"] for tool in tools]
+
+def prefix_key(model, system_prompt, tool_declarations):
+    text = json_codec.dumps_str([model, system_prompt or "", tool_declarations])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def _split_clauses(text):
+    """Splits a parameter list on commas outside parentheses, brackets and quotes."""
+    clauses, depth, quote, current = [], 0, None, ""
+    for char in text:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"" and not current[-1:].isalnum():
+            # An apostrophe inside a word ("event's") does not open a quote
+            quote = char
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            clauses.append(current.strip())
+            current = ""
+            continue
+        current += char
+    if current.strip():
+        clauses.append(current.strip().rstrip("."))
+    return clauses
+
+def _parse(description):
+    """Splits a tool docstring into its usage text and its (name, hint) parameter clauses."""
+    description = _EXAMPLE.sub("", description)
+    parts = _PARAMETERS.split(description, maxsplit=1)
+    if len(parts) == 1:
+        return description.strip(), []
+    clauses = []
+    for clause in _split_clauses(parts[1]):
+        match = _HINT.match(clause)
+        if not match:
+            clauses.append((None, clause))
+            continue
+        name, hint = match.groups()
+        # The schema's "required" list already says which arguments are optional
+        hint = re.sub(r"^optional\b[,:;]?\s*", "", hint)
+        clauses.append((name, hint) if hint else (None, None))
+    clauses = [clause for clause in clauses if clause != (None, None)]
+    return parts[0].strip(), clauses
+
+def _clean_schema(schema):
+    """Drops titles and null defaults, which the model does not need to call the tool."""
+    if isinstance(schema, dict):
+        return {
+            key: _clean_schema(value) for key, value in schema.items()
+            if key != "title" and not (key == "default" and value is None)
+        }
+    if isinstance(schema, list):
+        return [_clean_schema(value) for value in schema]
+    return schema
+
+def trim(tool_declarations, system_prompt=None):
+    """
+    The local fallback: example payloads, "optional" notes and null defaults are dropped, and
+    parameter hints repeated across tools (like the shared `calendar` argument) are stated once in the
+    system prompt instead of in every tool. Returns (tool dicts, system prompt).
+    """
+    parsed = [_parse(declaration.get("description", "")) for declaration in tool_declarations]
+    repeats = Counter(clause for _, clauses in parsed for clause in clauses if clause[0])
+    shared = {clause for clause, count in repeats.items() if count >= PROMPT_CACHE_SHARED_HINTS}
+    tools = []
+    for declaration, (usage, clauses) in zip(tool_declarations, parsed):
+        hints = [name if (name, hint) in shared else (f"{name} ({hint})" if name else hint) for name, hint in clauses]
+        description = usage + (" Parameters: " + ", ".join(hints) + "." if hints else "")
+        tools.append({"type": "function", "function": {
+            "name": declaration["name"],
+            "description": description,
+            "parameters": _clean_schema(declaration.get("parameters", {"type": "object", "properties": {}}))
+        }})
+    if shared:
+        notes = "Tool parameters used by several tools:\n" + "\n".join(f"- {name}: {hint}" for name, hint in sorted(shared))
+        system_prompt = f"{system_prompt}\n\n{notes}" if system_prompt else notes
+    return tools, system_prompt
+
+def _genai_client():
+    from google import genai
+    return genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+
+def _gemini_create(model, system_prompt, tool_declarations, ttl):
+    from google.genai import types
+    cache = _genai_client().caches.create(model=model, config=types.CreateCachedContentConfig(
+        display_name="calendar-agent-prefix",
+        system_instruction=system_prompt or None,
+        tools=[types.Tool(function_declarations=[
+            types.FunctionDeclaration(
+                name=declaration["name"],
+                description=declaration.get("description", ""),
+                parameters_json_schema=declaration.get("parameters")
+            ) for declaration in tool_declarations
+        ])],
+        ttl=f"{ttl}s"
+    ))
+    return cache.name
+
+def _gemini_extend(name, ttl):
+    from google.genai import types
+    _genai_client().caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"))
+
+def _gemini_delete(name):
+    _genai_client().caches.delete(name=name)
+
+class ContextCache:
+    """
+    Keeps one provider-side cache of the static prefix (system prompt and tool definitions)
+    per model and prefix. It is created on first use, its TTL is extended shortly before it
+    expires, it is recreated when the provider no longer has it, and a cache created here is
+    deleted once the prefix changes. Cache names are shared through the state backend, so
+    replicas reuse one cache instead of each paying for their own.
+    """
+
+    def __init__(self, create=_gemini_create, extend=_gemini_extend, delete=_gemini_delete):
+        self.create = create
+        self.extend = extend
+        self.delete = delete
+        self.lock = threading.Lock()
+        self.entries = {}
+        # model -> (key, name) of the cache this process created
+        self.created = {}
+        self.failed_until = {}
+        # key -> Event set once the thread creating or extending that cache is done
+        self.pending = {}
+
+    def _load(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            stored = get_backend().get("prompt_cache", key)
+            entry = json_codec.loads(stored) if stored else None
+        return entry
+
+    def name(self, model, system_prompt, tool_declarations):
+        """The cache name to send with the call, or None when the prefix has to be sent itself."""
+        key = prefix_key(model, system_prompt, tool_declarations)
+        while True:
+            now = time.time()
+            with self.lock:
+                if self.failed_until.get(key, 0) > now:
+                    return None
+                entry = self._load(key)
+                if entry and entry["expires"] - now > PROMPT_CACHE_RENEW_BEFORE:
+                    self.entries[key] = entry
+                    return entry["name"]
+                refreshing = self.pending.get(key)
+                if refreshing is None:
+                    self.pending[key] = threading.Event()
+                    break
+                # Another thread is creating or extending this cache; an unexpired one still serves
+                if entry and entry["expires"] > now:
+                    return entry["name"]
+            refreshing.wait()
+        # The provider calls run outside the lock, so other prefixes and models are not held up
+        previous = None
+        try:
+            try:
+                if entry and entry["expires"] > now:
+                    try:
+                        self.extend(entry["name"], PROMPT_CACHE_TTL)
+                    except Exception:
+                        entry = None
+                if not entry or entry["expires"] <= now:
+                    entry = {"name": self.create(model, system_prompt, tool_declarations, PROMPT_CACHE_TTL)}
+                    with self.lock:
+                        previous = self._replace(model, key, entry["name"])
+            except Exception:
+                with self.lock:
+                    self.entries.pop(key, None)
+                    self.failed_until[key] = now + PROMPT_CACHE_RETRY
+                return None
+            entry["expires"] = now + PROMPT_CACHE_TTL
+            with self.lock:
+                self.entries[key] = entry
+            get_backend().put("prompt_cache", key, json_codec.dumps_str(entry), ttl=PROMPT_CACHE_TTL)
+        finally:
+            with self.lock:
+                self.pending.pop(key).set()
+        if previous:
+            try:
+                self.delete(previous)
+            except Exception:
+                pass
+        return entry["name"]
+
+    def _replace(self, model, key, name):
+        """Records the cache this process created for model; returns the name of the one it replaces, if any."""
+        previous = self.created.get(model)
+        self.created[model] = (key, name)
+        if previous and previous[0] != key:
+            self.entries.pop(previous[0], None)
+            get_backend().delete("prompt_cache", previous[0])
+            return previous[1]
+        return None
+
+    def invalidate(self, model, system_prompt, tool_declarations):
+        """Forgets the cache after the provider rejected it; the next call recreates it."""
+        key = prefix_key(model, system_prompt, tool_declarations)
+        with self.lock:
+            self.entries.pop(key, None)
+            get_backend().delete("prompt_cache", key)
+
+_context_cache = ContextCache()
+
+def _is_cache_error(error):
+    text = str(error).lower()
+    return "cachedcontent" in text or "cached content" in text or "cached_content" in text
+
+def _record(path, response):
+    with _lock:
+        _stats["calls"] += 1
+        _stats[path] += 1
+        for message in getattr(response, "result", None) or []:
+            usage = getattr(message, "usage_metadata", None) or {}
+            _stats["input_tokens"] += usage.get("input_tokens", 0)
+            _stats["cache_read_tokens"] += (usage.get("input_token_details") or {}).get("cache_read", 0)
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+def _cache_model(request):
+    """The model whose context cache serves this call: the call's own, unless PROMPT_CACHE_MODEL applies."""
+    import model_router
+    tiered = model_router.MODEL_ROUTING and model_router.FAST_MODEL != model_router.STRONG_MODEL
+    return (not tiered and PROMPT_CACHE_MODEL) or getattr(request.model, "model", "")
+
+def prompt_cache_middleware(context_cache=None, mode=None):
+    """
+    Agent middleware that stops resending the static prefix on every model call. The prefix
+    is served from a Gemini context cache when one can be kept; otherwise the tool schemas
+    and system prompt are sent trimmed.
+    """
+    from langchain.agents.middleware import AgentMiddleware
+
+    context_cache = context_cache or _context_cache
+    mode = mode or PROMPT_CACHE_MODE
+
+    class PromptCacheMiddleware(AgentMiddleware):
+        def wrap_model_call(self, request, handler):
+            if mode == "off" or not request.tools:
+                response = handler(request)
+                _record("full", response)
+                return response
+            tool_declarations = declarations(request.tools)
+            if mode == "auto":
+                # Each tier keeps its own cache, since a cache only serves the model it was made for
+                model = _cache_model(request)
+                name = context_cache.name(model, request.system_prompt, tool_declarations)
+                if name:
+                    cached_model = request.model.model_copy(update={"cached_content": name, "model": model})
+                    try:
+                        # The cache already holds the system prompt and tools; sending them again is an error
+                        response = handler(request.override(model=cached_model, tools=[], system_prompt=None))
+                        _record("cached", response)
+                        return response
+                    except Exception as e:
+                        if not _is_cache_error(e):
+                            raise
+                        context_cache.invalidate(model, request.system_prompt, tool_declarations)
+            tools, system_prompt = trim(tool_declarations, request.system_prompt)
+            response = handler(request.override(tools=tools, system_prompt=system_prompt))
+            _record("trimmed", response)
+            return response
+
+    return PromptCacheMiddleware()
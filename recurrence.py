@@ -0,0 +1,182 @@
+import os
+import time
+import datetime
+import calendar
+import threading
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+from graph_api_auth import get_current_user
+from response_cache import on_change
+
+load_dotenv()
+
+SERIES_CACHE_TTL = int(os.getenv("SERIES_CACHE_TTL", "900"))
+SERIES_CACHE_MAX_USERS = int(os.getenv("SERIES_CACHE_MAX_USERS", "1000"))
+
+# Graph reports Windows zone names; the common ones are mapped to IANA names
+_WINDOWS_ZONES = {
+    "UTC": "UTC",
+    "Coordinated Universal Time": "UTC",
+    "Pacific Standard Time": "America/Los_Angeles",
+    "Mountain Standard Time": "America/Denver",
+    "Central Standard Time": "America/Chicago",
+    "Eastern Standard Time": "America/New_York",
+    "GMT Standard Time": "Europe/London",
+    "W. Europe Standard Time": "Europe/Berlin",
+    "Romance Standard Time": "Europe/Paris",
+    "Central Europe Standard Time": "Europe/Budapest",
+    "E. Europe Standard Time": "Europe/Chisinau",
+    "India Standard Time": "Asia/Kolkata",
+    "China Standard Time": "Asia/Shanghai",
+    "Singapore Standard Time": "Asia/Singapore",
+    "Tokyo Standard Time": "Asia/Tokyo",
+    "AUS Eastern Standard Time": "Australia/Sydney",
+}
+_DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_INDEX = {"first": 0, "second": 1, "third": 2, "fourth": 3, "last": -1}
+_UTC = datetime.timezone.utc
+
+_series_masters = {}
+_series_lock = threading.Lock()
+
+def _zone(name):
+    name = _WINDOWS_ZONES.get(name, name or "UTC")
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return _UTC
+
+def parse_datetime(value, tz=_UTC):
+    """Parses a Graph or ISO date-time; naive values are taken to be in tz."""
+    value = value.rstrip("Z")
+    if "." in value:
+        value = value.split(".")[0]
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz)
+    return parsed
+
+def format_datetime(value):
+    """Formats an aware date-time the way calendarView does with a UTC Prefer header."""
+    return value.astimezone(_UTC).strftime("%Y-%m-%dT%H:%M:%S.0000000")
+
+def _month_date(pattern, year, month):
+    if pattern["type"].startswith("absolute"):
+        day = min(pattern.get("dayOfMonth", 1), calendar.monthrange(year, month)[1])
+        return datetime.date(year, month, day)
+    days = {_DAYS.index(d.lower()) for d in pattern.get("daysOfWeek", [])}
+    matches = [
+        datetime.date(year, month, day)
+        for day in range(1, calendar.monthrange(year, month)[1] + 1)
+        if datetime.date(year, month, day).weekday() in days
+    ]
+    index = _INDEX[pattern.get("index", "first")]
+    if index >= len(matches):
+        return None
+    return matches[index]
+
+def _pattern_dates(pattern, start_date):
+    """Yields the dates of a recurrence pattern in order, beginning at the range start date."""
+    kind = pattern["type"]
+    interval = pattern.get("interval") or 1
+    if kind in ("weekly", "relativeMonthly", "relativeYearly") and not pattern.get("daysOfWeek"):
+        return
+    if kind == "daily":
+        current = start_date
+        while True:
+            yield current
+            current += datetime.timedelta(days=interval)
+    elif kind == "weekly":
+        first_day = _DAYS.index(pattern.get("firstDayOfWeek", "sunday").lower())
+        offsets = sorted((_DAYS.index(d.lower()) - first_day) % 7 for d in pattern.get("daysOfWeek", []))
+        week_start = start_date - datetime.timedelta(days=(start_date.weekday() - first_day) % 7)
+        while True:
+            for offset in offsets:
+                current = week_start + datetime.timedelta(days=offset)
+                if current >= start_date:
+                    yield current
+            week_start += datetime.timedelta(weeks=interval)
+    else:
+        yearly = kind.endswith("Yearly")
+        step = interval * 12 if yearly else interval
+        months = start_date.year * 12 + (pattern.get("month", 1) if yearly else start_date.month) - 1
+        while True:
+            current = _month_date(pattern, months // 12, months % 12 + 1)
+            if current is not None and current >= start_date:
+                yield current
+            months += step
+
+def expand_series(master, window_start, window_end):
+    """
+    Materializes the occurrences of a series master that overlap [window_start, window_end),
+    shaped like the instances calendarView returns with a UTC Prefer header. Modified or
+    cancelled single occurrences are not known to the master and are not reflected.
+    """
+    recurrence = master.get("recurrence") or {}
+    pattern = recurrence.get("pattern")
+    series_range = recurrence.get("range") or {}
+    if not pattern:
+        return []
+    tz = _zone(series_range.get("recurrenceTimeZone") or master["start"].get("timeZone"))
+    first_start = parse_datetime(master["start"]["dateTime"], _zone(master["start"].get("timeZone")))
+    first_end = parse_datetime(master["end"]["dateTime"], _zone(master["end"].get("timeZone")))
+    duration = first_end - first_start
+    time_of_day = first_start.astimezone(tz).time()
+
+    range_start = datetime.date.fromisoformat(series_range.get("startDate") or first_start.astimezone(tz).date().isoformat())
+    range_end = None
+    if series_range.get("type") == "endDate" and series_range.get("endDate"):
+        range_end = datetime.date.fromisoformat(series_range["endDate"])
+    count = series_range.get("numberOfOccurrences") if series_range.get("type") == "numbered" else None
+    last_date = window_end.astimezone(tz).date() + datetime.timedelta(days=1)
+
+    occurrences = []
+    for n, day in enumerate(_pattern_dates(pattern, range_start)):
+        if (count is not None and n >= count) or (range_end and day > range_end) or day > last_date:
+            break
+        start = datetime.datetime.combine(day, time_of_day, tzinfo=tz)
+        end = start + duration
+        if end > window_start and start < window_end:
+            occurrence = dict(master)
+            occurrence.pop("recurrence", None)
+            occurrence["id"] = None
+            occurrence["type"] = "occurrence"
+            occurrence["seriesMasterId"] = master["id"]
+            occurrence["start"] = {"dateTime": format_datetime(start), "timeZone": "UTC"}
+            occurrence["end"] = {"dateTime": format_datetime(end), "timeZone": "UTC"}
+            occurrences.append(occurrence)
+    return occurrences
+
+def expand_window(events, window_start, window_end):
+    """Expands every series master in events and returns all occurrences in the window sorted by start."""
+    occurrences = []
+    for event in events:
+        if event.get("type") == "seriesMaster":
+            occurrences.extend(expand_series(event, window_start, window_end))
+        else:
+            start = parse_datetime(event["start"]["dateTime"], _zone(event["start"].get("timeZone")))
+            end = parse_datetime(event["end"]["dateTime"], _zone(event["end"].get("timeZone")))
+            if end > window_start and start < window_end:
+                occurrences.append(event)
+    occurrences.sort(key=lambda e: parse_datetime(e["start"]["dateTime"], _zone(e["start"].get("timeZone"))))
+    return occurrences
+
+def get_series_masters(fetch):
+    """Returns the current user's series masters, calling fetch() only when the cache is cold or stale."""
+    user_key = get_current_user()
+    with _series_lock:
+        entry = _series_masters.get(user_key)
+    if entry is not None and time.time() - entry[0] < SERIES_CACHE_TTL:
+        return entry[1]
+    masters = fetch()
+    with _series_lock:
+        _series_masters.pop(user_key, None)
+        _series_masters[user_key] = (time.time(), masters)
+        while len(_series_masters) > SERIES_CACHE_MAX_USERS:
+            del _series_masters[next(iter(_series_masters))]
+    return masters
+
+@on_change
+def _drop_series(user_key, event_id):
+    with _series_lock:
+        _series_masters.pop(user_key, None)
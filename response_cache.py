@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import hashlib
+import datetime
+import threading
+import functools
+from collections import OrderedDict
+from dotenv import load_dotenv
+from graph_api_auth import get_current_user
+
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+# How many earlier messages a follow-up's answer depends on ("yes", "what about tomorrow?")
+RESPONSE_CACHE_CONTEXT = int(os.getenv("RESPONSE_CACHE_CONTEXT", "4"))
+
+# Prompts that ask for a change are never answered from the cache
+_MUTATION_WORDS = re.compile(
+    r"\b(create|book|schedule|add|invite|remove|delete|cancel|move|reschedule|push|shift|update|change|set|rename|clear)\b"
+)
+
+# Prompts that lean on the conversation before them; anything else is answered from the prompt alone
+_FOLLOW_UP_WORDS = re.compile(
+    r"^(and|also|so|then|yes|yeah|no|nope|ok|okay|sure|what about|how about)\b"
+    r"|\b(it|its|them|they|their|that|those|these|this one|same|instead|else|again|other|first|second|third|last one)\b"
+)
+
+_lock = threading.RLock()
+# user_key -> snapshot version. This is a local counter, not a Graph delta token or ETag set:
+# asking Graph for one before every answer would cost the round trip the cache saves. It is
+# bumped by mutations through calendar_tools and by change notifications; without a
+# notification receiver, edits made in Outlook or on another replica show after RESPONSE_CACHE_TTL.
+_versions = {}
+_listeners = []
+_stats = {
+    "answer_hits": 0, "answer_misses": 0, "answer_seconds_saved": 0.0,
+    "tool_hits": 0, "tool_misses": 0, "tool_seconds_saved": 0.0,
+}
+
+class _LRUCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value, cost):
+        self._entries[key] = (value, time.time(), cost)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+_answers = _LRUCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+_tool_results = _LRUCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL)
+
+def snapshot_version(user_key=None):
+    """Version of the user's calendar as seen by this process; bumped by every known change."""
+    with _lock:
+        return _versions.get(user_key or get_current_user(), 0)
+
+def mark_changed(user_key=None, event_id=None):
+    """Records that the user's calendar changed, which invalidates every cached answer for it."""
+    user_key = user_key or get_current_user()
+    with _lock:
+        _versions[user_key] = _versions.get(user_key, 0) + 1
+        listeners = list(_listeners)
+    for listener in listeners:
+        listener(user_key, event_id)
+
+def on_change(listener):
+    """Registers listener(user_key, event_id) to be called whenever a calendar changes."""
+    with _lock:
+        _listeners.append(listener)
+    return listener
+
+def invalidates(func):
+    """Marks a calendar mutation; the snapshot version is bumped even if it fails half way."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            mark_changed()
+    return wrapper
+
+def cached_read(func):
+    """Caches the result of a read-only calendar function per user and snapshot version."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not RESPONSE_CACHE_ENABLED:
+            return func(*args, **kwargs)
+        user_key = get_current_user()
+        key = (user_key, snapshot_version(user_key), func.__name__, repr(args), repr(sorted(kwargs.items())))
+        with _lock:
+            entry = _tool_results.get(key)
+            if entry is not None:
+                _stats["tool_hits"] += 1
+                _stats["tool_seconds_saved"] += entry[2]
+                return entry[0]
+            _stats["tool_misses"] += 1
+        started = time.time()
+        result = func(*args, **kwargs)
+        with _lock:
+            _tool_results.put(key, result, time.time() - started)
+        return result
+    return wrapper
+
+def normalize_prompt(prompt):
+    text = re.sub(r"[^\w\s@.:-]", " ", prompt.lower())
+    return " ".join(text.split())
+
+def is_read_only(prompt):
+    return not _MUTATION_WORDS.search(normalize_prompt(prompt))
+
+def is_follow_up(prompt):
+    return bool(_FOLLOW_UP_WORDS.search(normalize_prompt(prompt)))
+
+def _context_digest(prompt, history):
+    """
+    Digest of the last RESPONSE_CACHE_CONTEXT (role, content) messages before a follow-up;
+    None for a self-contained prompt, so asking it again later in the chat still hits.
+    """
+    if not is_follow_up(prompt):
+        return None
+    recent = list(history)[-RESPONSE_CACHE_CONTEXT:] if RESPONSE_CACHE_CONTEXT > 0 else []
+    text = "\n".join(f"{role}: {content}" for role, content in recent)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def _answer_key(prompt, version, history):
+    # Relative dates ("today") make answers valid for one calendar day at most
+    return (get_current_user(), version, datetime.date.today().isoformat(), _context_digest(prompt, history), normalize_prompt(prompt))
+
+def get_answer(prompt, history=()):
+    """
+    Returns a cached final answer for a read-only prompt, or None. A follow-up only hits
+    after the same recent messages (history: the (role, content) pairs before the prompt).
+    """
+    if not RESPONSE_CACHE_ENABLED or not is_read_only(prompt):
+        return None
+    with _lock:
+        entry = _answers.get(_answer_key(prompt, snapshot_version(), history))
+        if entry is None:
+            _stats["answer_misses"] += 1
+            return None
+        _stats["answer_hits"] += 1
+        _stats["answer_seconds_saved"] += entry[2]
+        return entry[0]
+
+def put_answer(prompt, answer, seconds, version, history=()):
+    """
+    Caches the final answer of a turn that started at snapshot `version`. Nothing is
+    stored if the prompt asked for a change or the calendar changed during the turn.
+    """
+    if not RESPONSE_CACHE_ENABLED or not is_read_only(prompt):
+        return
+    with _lock:
+        if snapshot_version() != version:
+            return
+        _answers.put(_answer_key(prompt, version, history), answer, seconds)
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+    for kind in ("answer", "tool"):
+        total = result[f"{kind}_hits"] + result[f"{kind}_misses"]
+        result[f"{kind}_hit_rate"] = result[f"{kind}_hits"] / total if total else 0.0
+    return result
+
+def clear():
+    with _lock:
+        _answers.clear()
+        _tool_results.clear()
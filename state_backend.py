@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import sqlite3
+import abc
+import hashlib
+import importlib
+import threading
+from dotenv import load_dotenv
+import json_codec
+
+load_dotenv()
+
+# "file" (one process), "sqlite" (several processes/replicas sharing STATE_DB) or "module:Class"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "file")
+STATE_DIR = os.getenv("STATE_DIR", os.getenv("TOKEN_CACHE_DIR", "."))
+STATE_DB = os.getenv("STATE_DB", os.path.join(STATE_DIR, "state.db"))
+
+_SAFE_KEY = re.compile(r"^[\w.-]{1,100}$")
+
+class StateBackend(abc.ABC):
+    """
+    Where auth and session state lives between requests. Values are strings; lists hold
+    JSON-serializable items in append order. A networked store (Redis, a database) is
+    plugged in by subclassing this, implementing every method, and setting
+    STATE_BACKEND=module:Class; a missing method fails when the backend is created.
+    """
+
+    @abc.abstractmethod
+    def get(self, namespace, key):
+        """Returns the stored string, or None if missing or expired."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put(self, namespace, key, value, ttl=None):
+        """Stores a string; with ttl the value may be dropped after that many seconds."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, namespace, key):
+        """Removes both the value and the list stored under the key."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append(self, namespace, key, item):
+        """Appends an item to a list and returns its position."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def length(self, namespace, key):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def range(self, namespace, key, start, stop):
+        """Returns list items start..stop-1."""
+        raise NotImplementedError
+
+class FileBackend(StateBackend):
+    """
+    Files in STATE_DIR: values as {namespace}_{key}.json, lists as JSONL with an offset
+    index so any range is read with one seek. Safe within one process only; ttl is not
+    enforced, so callers check expiry themselves.
+    """
+
+    # One little-endian 8-byte offset per item, so item i starts at index[8*i]
+    _OFFSET = 8
+
+    def __init__(self, root=None):
+        self.root = root or STATE_DIR
+        self.lock = threading.Lock()
+
+    def _path(self, namespace, key, extension):
+        if not _SAFE_KEY.match(key):
+            key = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, f"{namespace}_{key}{extension}")
+
+    def get(self, namespace, key):
+        path = self._path(namespace, key, ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, namespace, key, value, ttl=None):
+        path = self._path(namespace, key, ".json")
+        os.makedirs(self.root, exist_ok=True)
+        # Readers never see a half-written file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(temp_path, path)
+
+    def delete(self, namespace, key):
+        with self.lock:
+            for extension in (".json", ".jsonl", ".idx"):
+                path = self._path(namespace, key, extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _sync_index(self, log_path, index_path):
+        """
+        Indexes items appended to the log but missing from the index (e.g. after a crash
+        between the two writes) and returns the number of items.
+        """
+        log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        indexed = os.path.getsize(index_path) // self._OFFSET if os.path.exists(index_path) else 0
+        if indexed:
+            with open(index_path, "rb") as index:
+                index.seek((indexed - 1) * self._OFFSET)
+                last = int.from_bytes(index.read(self._OFFSET), "little")
+            with open(log_path, "rb") as log:
+                log.seek(last)
+                position = last + len(log.readline())
+        else:
+            position = 0
+        if position >= log_size:
+            return indexed
+        with open(log_path, "rb") as log, open(index_path, "ab") as index:
+            log.seek(position)
+            for line in log:
+                if line.endswith(b"\n"):
+                    index.write(position.to_bytes(self._OFFSET, "little"))
+                    indexed += 1
+                position += len(line)
+        return indexed
+
+    def append(self, namespace, key, item):
+        log_path, index_path = self._path(namespace, key, ".jsonl"), self._path(namespace, key, ".idx")
+        line = json_codec.dumps(item) + b"\n"
+        with self.lock:
+            os.makedirs(self.root, exist_ok=True)
+            position = self._sync_index(log_path, index_path)
+            with open(log_path, "ab") as log:
+                offset = log.tell()
+                log.write(line)
+            with open(index_path, "ab") as index:
+                index.write(offset.to_bytes(self._OFFSET, "little"))
+            return position
+
+    def length(self, namespace, key):
+        with self.lock:
+            return self._sync_index(self._path(namespace, key, ".jsonl"), self._path(namespace, key, ".idx"))
+
+    def range(self, namespace, key, start, stop):
+        log_path, index_path = self._path(namespace, key, ".jsonl"), self._path(namespace, key, ".idx")
+        with self.lock:
+            total = self._sync_index(log_path, index_path)
+            start, stop = max(0, start), min(stop, total)
+            if stop <= start:
+                return []
+            with open(index_path, "rb") as index:
+                index.seek(start * self._OFFSET)
+                offset = int.from_bytes(index.read(self._OFFSET), "little")
+            with open(log_path, "rb") as log:
+                log.seek(offset)
+                return [json_codec.loads(log.readline()) for _ in range(stop - start)]
+
+class SQLiteBackend(StateBackend):
+    """
+    One SQLite database (WAL mode) shared by every process that points at STATE_DB, so
+    replicas on the same host or a shared volume can serve any user's next request.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or STATE_DB
+        self.local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS kv (namespace TEXT, key TEXT, value TEXT, expires REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS items (namespace TEXT, key TEXT, position INTEGER, item TEXT, "
+            "PRIMARY KEY (namespace, key, position))"
+        )
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.connection = connection
+        return connection
+
+    def get(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value, expires FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def put(self, namespace, key, value, ttl=None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)",
+            (namespace, key, value, time.time() + ttl if ttl else None)
+        )
+
+    def delete(self, namespace, key):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+            connection.execute("DELETE FROM items WHERE namespace = ? AND key = ?", (namespace, key))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def append(self, namespace, key, item):
+        connection = self._connection()
+        # IMMEDIATE takes the write lock up front, so concurrent appenders get distinct positions
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            position = connection.execute(
+                "SELECT COALESCE(MAX(position) + 1, 0) FROM items WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()[0]
+            connection.execute(
+                "INSERT INTO items VALUES (?, ?, ?, ?)", (namespace, key, position, json_codec.dumps_str(item))
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return position
+
+    def length(self, namespace, key):
+        return self._connection().execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM items WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()[0]
+
+    def range(self, namespace, key, start, stop):
+        rows = self._connection().execute(
+            "SELECT item FROM items WHERE namespace = ? AND key = ? AND position >= ? AND position < ? ORDER BY position",
+            (namespace, key, start, stop)
+        ).fetchall()
+        return [json_codec.loads(row[0]) for row in rows]
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Returns the process-wide backend chosen by STATE_BACKEND, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if STATE_BACKEND == "file":
+                _backend = FileBackend()
+            elif STATE_BACKEND == "sqlite":
+                _backend = SQLiteBackend()
+            elif ":" in STATE_BACKEND:
+                module_name, class_name = STATE_BACKEND.split(":", 1)
+                backend_class = getattr(importlib.import_module(module_name), class_name)
+                if not (isinstance(backend_class, type) and issubclass(backend_class, StateBackend)):
+                    raise Exception(f"STATE_BACKEND '{STATE_BACKEND}' must be a subclass of state_backend.StateBackend")
+                _backend = backend_class()
+            else:
+                raise Exception(f"Unknown STATE_BACKEND '{STATE_BACKEND}'; use file, sqlite or module:Class")
+        return _backend
+
+def is_shared():
+    """True when other processes may change the state behind this one's back."""
+    return STATE_BACKEND != "file"
@@ -1,9 +1,19 @@
 import streamlit as st
 from langchain.agents import create_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.tools import tool
+from tool_executor import agent_config, ordered_tools_middleware
+import response_cache
+import prefetch
+import graph_client
+import outbox
+import planner
+import model_router
+import prompt_cache
+import turn_profiler
+import chat_history
+import change_notifications
 import os
-from typing import List, Dict
+import time
+import uuid
 
 # Check if running in demo mode (credentials in secrets)
 try:
@@ -24,26 +34,16 @@ else:
 # Import calendar tools with error handling - v3
 try:
     import sys
-    if 'calendar_tools' in sys.modules:
-        del sys.modules['calendar_tools']
-    from calendar_tools import (
-        create_calendar_event,
-        get_all_events,
-        find_event_by_subject,
-        update_calendar_event,
-        delete_calendar_event,
-        delete_multiple_events,
-        add_attendees_to_event,
-        remove_attendees_from_event,
-        update_event_location,
-    )
+    for module in ('calendar_tools', 'agent_tools'):
+        if module in sys.modules:
+            del sys.modules[module]
+    from agent_tools import TOOLS, SYSTEM_PROMPT
 except Exception as e:
     st.error(f"Failed to import calendar tools: {e}")
     st.info("Please refresh the page to try again.")
     st.stop()
 import os
 from dotenv import load_dotenv
-from typing import List, Dict
 
 load_dotenv()
 
@@ -86,55 +86,21 @@ def initialize_agent():
     if not os.getenv("CLIENT_ID"):
         raise Exception("Client ID is required")
     
-    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
+    # Tool selection runs on FAST_MODEL; answers from large results and unsure replies on STRONG_MODEL
+    fast, strong = model_router.models()
     
-    @tool
-    def create_event(subject: str, start_time: str, end_time: str, attendees: List[str] = None, body: str = ""):
-        """Creates a calendar event. Parameters: subject (event title), start_time (ISO format like '2025-09-01T14:00:00'), end_time (ISO format), attendees (optional list of emails), body (optional description)."""
-        return create_calendar_event(subject, start_time, end_time, attendees, body)
-
-    @tool
-    def get_events(time_window: Dict[str, str]):
-        """Gets ALL events in a time period. Use when user asks 'what events do I have today/this week/etc'. Parameter: time_window dict with 'start' and 'end' in ISO format. Example: {'start': '2025-01-23T00:00:00', 'end': '2025-01-23T23:59:59'}"""
-        return get_all_events(time_window)
-
-    @tool
-    def find_event(subject: str, time_window: Dict[str, str]):
-        """Finds events by subject/title. Use when user mentions a specific event name. Parameters: subject (event title to search), time_window (dict with 'start' and 'end' in ISO format)."""
-        return find_event_by_subject(subject, time_window)
-
-    @tool
-    def update_event(event_id: str, new_start_time: str = None, new_end_time: str = None, new_subject: str = None, new_body: str = None, new_location: str = None):
-        """Updates event details. Parameters: event_id (required), new_start_time (optional ISO format), new_end_time (optional), new_subject (optional), new_body (optional), new_location (optional)."""
-        return update_calendar_event(event_id, new_start_time, new_end_time, new_subject, new_body, new_location)
-
-    @tool
-    def add_attendees(event_id: str, attendee_emails: List[str]):
-        """Adds attendees to an existing event. Parameters: event_id (from find_event), attendee_emails (list of email addresses)."""
-        return add_attendees_to_event(event_id, attendee_emails)
-
-    @tool
-    def remove_attendees(event_id: str, attendee_emails: List[str]):
-        """Removes attendees from an existing event. Parameters: event_id (from find_event), attendee_emails (list of email addresses to remove)."""
-        return remove_attendees_from_event(event_id, attendee_emails)
-
-    @tool
-    def set_location(event_id: str, location: str):
-        """Sets or updates the location of an event. Parameters: event_id (from find_event), location (location name/address)."""
-        return update_event_location(event_id, location)
-
-    @tool
-    def delete_event(event_id: str):
-        """Deletes a single event. Parameter: event_id (from find_event result)."""
-        return delete_calendar_event(event_id)
-
-    @tool
-    def delete_multiple(event_ids_json: str):
-        """Deletes multiple events at once. Parameter: event_ids_json (JSON string array of event IDs from find_event result). Example: '["id1", "id2"]'"""
-        return delete_multiple_events(event_ids_json)
-
-    tools = [create_event, get_events, find_event, update_event, delete_event, delete_multiple, add_attendees, remove_attendees, set_location]
-    return create_agent(llm, tools)
+    agent = create_agent(
+        strong, TOOLS, system_prompt=SYSTEM_PROMPT,
+        middleware=[
+            model_router.model_router_middleware(fast, strong),
+            prompt_cache.prompt_cache_middleware(),
+            outbox.outbox_middleware(),
+            graph_client.breaker_middleware(),
+            ordered_tools_middleware()
+        ]
+    )
+    # Compound requests are planned in one model call and run locally (PLANNER_MODE)
+    return planner.PlanningAgent(fast, TOOLS, agent, SYSTEM_PROMPT, replan_llm=strong)
 
 # Streamlit UI
 st.set_page_config(page_title="AI Calendar Agent" + (" - Demo" if demo_mode else ""), page_icon="📅", layout="wide")
@@ -158,22 +124,60 @@ if not credentials_ready:
     st.code('"Reschedule the client call to 4 PM"')
     st.stop()
 
-# Initialize session state
-if "messages" not in st.session_state:
+# A browser session starts as the account that last signed in here (REMEMBER_ACCOUNT), else with a
+# random id that only lives in server-side session state; signing in switches it to the Microsoft
+# account (see graph_api_auth._bind_account)
+if "user_key" not in st.session_state:
+    st.session_state.user_key = graph_api_auth.remembered_account() or uuid.uuid4().hex
+if "sid" in st.query_params:
+    # Links from older versions carried the session id; it is never accepted from the URL
+    del st.query_params["sid"]
+graph_api_auth.set_current_user(st.session_state.user_key)
+
+# Opt-in profiling of this rerun (PROFILE_TURNS=true or ?profile=1); profiles go to PROFILE_DIR
+profile_requested = st.query_params.get("profile") == "1"
+turn_profiler.start_rerun(profile_requested, st.session_state.user_key)
+
+# Initialize session state; the conversation is restored from disk, most recent messages only,
+# and reloaded when sign-in switches the session to an account
+if st.session_state.get("messages_user") != st.session_state.user_key:
+    st.session_state.messages_user = st.session_state.user_key
+    st.session_state.messages = chat_history.tail()
+    st.session_state.history_start = chat_history.count() - len(st.session_state.messages)
+    st.session_state.render_count = chat_history.CHAT_RENDER_WINDOW
+
+def add_message(role, content):
+    st.session_state.messages.append({"role": role, "content": content})
+    chat_history.append(role, content)
+
+def clear_messages():
+    chat_history.clear()
     st.session_state.messages = []
+    st.session_state.history_start = 0
 
 # Force fresh agent creation every time
 if credentials_ready:
     with st.spinner("Initializing AI agent..."):
         try:
-            st.session_state.agent = initialize_agent()
+            with turn_profiler.profile("initialize_agent", profile_requested):
+                st.session_state.agent = initialize_agent()
             st.success("✅ Agent initialized successfully!")
         except Exception as e:
             st.error(f"Failed to initialize agent: {str(e)}")
             st.stop()
 
-# Display chat messages
-for message in st.session_state.messages:
+# Display chat messages; only the last render_count are drawn so reruns stay cheap
+hidden = st.session_state.history_start + len(st.session_state.messages) - st.session_state.render_count
+if hidden > 0 and st.button(f"⬆️ Show earlier messages ({hidden} more)"):
+    wanted = st.session_state.render_count + chat_history.CHAT_RENDER_WINDOW
+    missing = min(wanted - len(st.session_state.messages), st.session_state.history_start)
+    if missing > 0:
+        start = st.session_state.history_start - missing
+        st.session_state.messages[:0] = chat_history.read(start, st.session_state.history_start)
+        st.session_state.history_start = start
+    st.session_state.render_count = wanted
+    st.rerun()
+for message in st.session_state.messages[-st.session_state.render_count:]:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
@@ -200,10 +204,11 @@ if credentials_ready:
                 if st.button("🚪 Logout", type="secondary"):
                     from graph_api_auth import logout
                     logout(os.environ["CLIENT_ID"])
-                    if 'messages' in st.session_state:
-                        st.session_state.messages = []
+                    clear_messages()
                     if 'agent' in st.session_state:
                         del st.session_state.agent
+                    # The next sign-in starts from a fresh session, not the signed-out account
+                    st.session_state.user_key = uuid.uuid4().hex
                     st.success("Logged out successfully!")
                     st.rerun()
             authenticated = True
@@ -317,7 +322,7 @@ if credentials_ready:
     prompt = st.chat_input("Type your calendar request...")
     if prompt:
         # Add user message
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        add_message("user", prompt)
         with st.chat_message("user"):
             st.markdown(prompt)
 
@@ -331,7 +336,7 @@ if credentials_ready:
                         get_access_token(os.environ["CLIENT_ID"], os.environ["TENANT_ID"])
                     except Exception as auth_error:
                         st.error(f"Authentication required: {str(auth_error)}")
-                        st.session_state.messages.append({"role": "assistant", "content": "Please sign in above and try again."})
+                        add_message("assistant", "Please sign in above and try again.")
                         st.stop()
                     
                     # Use agent for all requests
@@ -339,17 +344,35 @@ if credentials_ready:
                         st.error("Agent not initialized. Please refresh the page.")
                         st.stop()
                     
-                    # Build conversation history for context
-                    conversation = [(msg["role"], msg["content"]) for msg in st.session_state.messages]
-                    response = st.session_state.agent.invoke({"messages": conversation})
-                    ai_response = response["messages"][-1].content
+                    # Repeated read-only questions are answered from the cache while the calendar is unchanged
+                    round_trips = None
+                    # The prompt was just added; the messages before it decide what a follow-up means
+                    history = [(msg["role"], msg["content"]) for msg in st.session_state.messages[:-1]]
+                    ai_response = response_cache.get_answer(prompt, history)
+                    if ai_response is None:
+                        version = response_cache.snapshot_version()
+                        started = time.time()
+                        # Build conversation history for context
+                        conversation = [(msg["role"], msg["content"]) for msg in st.session_state.messages]
+                        # Changes to the same event within this turn are merged into one update
+                        outbox.begin_turn()
+                        try:
+                            with turn_profiler.profile("turn", profile_requested):
+                                response = st.session_state.agent.invoke({"messages": conversation}, config=agent_config())
+                        finally:
+                            outbox.end_turn()
+                        ai_response = response["messages"][-1].content
+                        round_trips = f"🔁 {response['llm_calls']} LLM round trip(s) ({response['mode']})"
+                        response_cache.put_answer(prompt, ai_response, time.time() - started, version, history)
                     
                     st.markdown(ai_response)
-                    st.session_state.messages.append({"role": "assistant", "content": ai_response})
+                    if round_trips:
+                        st.caption(round_trips)
+                    add_message("assistant", ai_response)
                 except Exception as e:
                     error_msg = f"Error processing request: {str(e)}"
                     st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                    add_message("assistant", error_msg)
 
 # Sidebar with examples
 with st.sidebar:
@@ -368,14 +391,57 @@ with st.sidebar:
         
         for example in examples:
             if st.button(example, key=example, use_container_width=True):
-                st.session_state.messages.append({"role": "user", "content": example})
+                add_message("user", example)
                 st.rerun()
         
         st.markdown("---")
         if st.button("🗑️ Clear Chat", use_container_width=True):
-            st.session_state.messages = []
+            clear_messages()
             st.rerun()
         
+        st.markdown("---")
+        cache_stats = response_cache.stats()
+        st.caption(
+            f"⚡ Cache: {cache_stats['answer_hit_rate']:.0%} answer hits, "
+            f"{cache_stats['tool_hit_rate']:.0%} lookup hits, "
+            f"{cache_stats['answer_seconds_saved'] + cache_stats['tool_seconds_saved']:.1f}s saved"
+        )
+        prefetch_stats = prefetch.stats()
+        st.caption(
+            f"🔥 Prefetch: {prefetch_stats['hit_rate']:.0%} hits, "
+            f"{prefetch_stats['fetches']} fetches in {prefetch_stats['fetch_seconds']:.1f}s"
+        )
+        graph_stats = graph_client.stats()
+        st.caption(
+            f"🛰️ Graph: {graph_stats['hedged']} slow reads hedged ({graph_stats['hedge_wins']} won), "
+            f"{graph_stats['timeouts']} timeouts" + (" — temporarily unavailable" if graph_stats['breaker_open'] else "")
+        )
+        if change_notifications.NOTIFICATIONS_ENABLED:
+            notification_stats = change_notifications.stats()
+            st.caption(
+                f"🔔 Change notifications: {notification_stats['subscriptions']} subscription(s), "
+                f"{notification_stats['notifications']} received, {notification_stats['subscribe_errors']} subscribe errors"
+            )
+        planner_stats = planner.stats()
+        st.caption(
+            f"🧭 LLM round trips per request: {planner_stats['planner']['round_trips']:.1f} planned "
+            f"({planner_stats['planner']['requests']}), {planner_stats['agent']['round_trips']:.1f} agent ({planner_stats['agent']['requests']})"
+        )
+        model_stats = model_router.stats()
+        st.caption(
+            "⚡ Models: " + ", ".join(
+                f"{tier} {model_stats[tier]['calls']} calls ({model_stats[tier]['avg_seconds']:.1f}s avg, {model_stats[tier]['input_tokens']} tokens in)"
+                for tier in model_router.TIERS
+            ) + f"; {sum(model_stats['escalations'].values())} escalated"
+        )
+        prompt_stats = prompt_cache.stats()
+        st.caption(
+            f"🧠 Prompt prefix: {prompt_stats['cached']} of {prompt_stats['calls']} model calls served from cache, "
+            f"{prompt_stats['trimmed']} trimmed"
+        )
+        
         st.markdown("---")
         st.markdown("### 🔒 Privacy")
-        st.caption("Your calendar data is accessed securely via Microsoft OAuth. No data is stored.")
\ No newline at end of file
+        st.caption("Your calendar data is accessed securely via Microsoft OAuth. Only this chat's history is kept, until you clear it or log out.")
+
+turn_profiler.finish_rerun()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# State files (token caches, chat logs) of the modules under test go to a scratch directory
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="calendar-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,102 @@
+import json
+import pytest
+import calendar_tools
+
+def event(event_id, subject, start, end, attendees=()):
+    return {
+        "id": event_id,
+        "subject": subject,
+        "start": {"dateTime": f"{start}.0000000"},
+        "end": {"dateTime": f"{end}.0000000"},
+        "attendees": [{"emailAddress": {"address": address, "name": address.split("@")[0]}} for address in attendees],
+    }
+
+class Response:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+
+@pytest.fixture
+def graph(monkeypatch):
+    state = {"events": [], "windows": [], "batches": [], "replies": []}
+
+    def calendar_view(time_window, access_token, calendar=None):
+        state["windows"].append((time_window, calendar))
+        return state["events"]
+
+    def post(url, data=None, **kwargs):
+        batch = json.loads(data)
+        state["batches"].append(batch)
+        reply = state["replies"].pop(0) if state["replies"] else None
+        if isinstance(reply, Exception):
+            raise reply
+        statuses = reply or {}
+        return Response(200, {"responses": [
+            {"id": request["id"], "status": statuses.get(request["id"], 200),
+             "body": {"error": {"message": "Event is locked"}} if request["id"] in statuses else None}
+            for request in batch["requests"]
+        ]})
+
+    monkeypatch.setattr(calendar_tools, "_calendar_view", calendar_view)
+    monkeypatch.setattr(calendar_tools, "get_access_token", lambda: "token")
+    monkeypatch.setattr(calendar_tools.graph_client, "post", post)
+    return state
+
+def test_filters_select_by_subject_and_attendee(graph):
+    graph["events"].extend([
+        event("a", "Standup", "2025-01-24T09:00:00", "2025-01-24T09:15:00", ["ann@example.com"]),
+        event("b", "Design review", "2025-01-24T10:00:00", "2025-01-24T11:00:00", ["bob@example.com"]),
+        dict(event("c", "Standup", "2025-01-24T12:00:00", "2025-01-24T12:15:00"), isCancelled=True),
+    ])
+    window = {"start": "2025-01-24T00:00:00", "end": "2025-01-25T00:00:00"}
+    assert [item["event_id"] for item in calendar_tools.plan_reschedule(window, 30, subject_filter="standup")] == ["a"]
+    assert [item["event_id"] for item in calendar_tools.plan_reschedule(window, 30, attendee_filter="bob")] == ["b"]
+
+def test_day_mapping_uses_the_users_local_day(graph):
+    # Friday 2025-01-24 20:00 in Los Angeles is Saturday 04:00 UTC
+    graph["events"].append(event("a", "Late call", "2025-01-25T04:00:00", "2025-01-25T05:00:00"))
+    plan = calendar_tools.plan_reschedule(
+        {"start": "2025-01-24T00:00:00", "end": "2025-01-25T00:00:00"},
+        day_mapping={"2025-01-24": "2025-01-27"}, timezone="America/Los_Angeles", calendar="team@example.com",
+    )
+    assert graph["windows"] == [({"start": "2025-01-24T08:00:00", "end": "2025-01-25T08:00:00"}, "team@example.com")]
+    assert plan[0]["new_start"] == "2025-01-28T04:00:00" and plan[0]["new_end"] == "2025-01-28T05:00:00"
+    assert plan[0]["local_new_start"] == "2025-01-27 20:00"
+
+def test_move_across_dst_keeps_the_local_time(graph):
+    # Friday 2025-03-07 09:00 in Berlin (UTC+1) to Monday 2025-03-31, after the switch to UTC+2
+    graph["events"].append(event("a", "Standup", "2025-03-07T08:00:00", "2025-03-07T08:15:00"))
+    plan = calendar_tools.plan_reschedule(
+        {"start": "2025-03-07T00:00:00", "end": "2025-03-08T00:00:00"}, target_date="2025-03-31", timezone="Europe/Berlin"
+    )
+    assert plan[0]["new_start"] == "2025-03-31T07:00:00" and plan[0]["new_end"] == "2025-03-31T07:15:00"
+
+def test_dry_run_sends_nothing(graph):
+    graph["events"].append(event("a", "Standup", "2025-01-24T09:00:00", "2025-01-24T09:15:00"))
+    result = calendar_tools.bulk_reschedule_events(
+        {"start": "2025-01-24T00:00:00", "end": "2025-01-25T00:00:00"}, offset_minutes=30, dry_run=True
+    )
+    assert "dry run, nothing changed" in result and "2025-01-24 09:00 → 2025-01-24 09:30" in result
+    assert graph["batches"] == []
+
+def test_failed_batch_items_are_reported_and_the_rest_applied(graph, monkeypatch):
+    monkeypatch.setattr(calendar_tools, "GRAPH_BATCH_SIZE", 2)
+    graph["events"].extend(
+        event(f"e{i}", f"Meeting {i}", f"2025-01-24T1{i}:00:00", f"2025-01-24T1{i}:30:00") for i in range(4)
+    )
+    graph["replies"].extend([{"1": 423}, Exception("Graph $batch timed out")])
+    result = calendar_tools.bulk_reschedule_events(
+        {"start": "2025-01-24T00:00:00", "end": "2025-01-25T00:00:00"}, offset_minutes=60, calendar="room@example.com"
+    )
+    assert result.startswith("✅ Rescheduled 1 of 4 event(s).")
+    assert "❌ Meeting 1 (e1): Event is locked" in result
+    assert "❌ Meeting 2 (e2): Graph $batch timed out" in result and "❌ Meeting 3 (e3)" in result
+    urls = sorted(request["url"] for batch in graph["batches"] for request in batch["requests"])
+    assert urls == [f"/users/room@example.com/events/e{i}" for i in range(4)]
+
+def test_unknown_timezone_is_a_message(graph):
+    result = calendar_tools.bulk_reschedule_events(
+        {"start": "2025-01-24T00:00:00", "end": "2025-01-25T00:00:00"}, offset_minutes=30, timezone="Mars/Olympus"
+    )
+    assert result.startswith("Unknown time zone 'Mars/Olympus'")
@@ -0,0 +1,67 @@
+import itertools
+import threading
+import time
+import pytest
+import calendar_tools
+
+def page(calendar, *hours):
+    return [{"id": f"{calendar}-{hour}", "start": {"dateTime": f"2025-01-23T{hour:02d}:00:00"}} for hour in hours]
+
+@pytest.fixture
+def calendars(monkeypatch):
+    """calendar -> list of pages, an Exception to raise after them, or an endless page generator."""
+    sources, finished = {}, []
+
+    def iter_pages(calendar, headers, params):
+        try:
+            source = sources[calendar]
+            for item in source() if callable(source) else source:
+                if isinstance(item, Exception):
+                    raise item
+                # Slower calendars still page while earlier events are yielded
+                time.sleep(0.01)
+                yield item
+        finally:
+            finished.append(calendar)
+
+    monkeypatch.setattr(calendar_tools, "get_access_token", lambda: "token")
+    monkeypatch.setattr(calendar_tools, "_calendar_view_request", lambda time_window, access_token, calendar: (calendar, None, None))
+    monkeypatch.setattr(calendar_tools, "_iter_pages", iter_pages)
+    return sources, finished
+
+WINDOW = {"start": "2025-01-23T00:00:00", "end": "2025-01-24T00:00:00"}
+
+def test_calendars_are_merged_in_start_order(calendars):
+    sources, _ = calendars
+    sources[""] = [page("", 8, 11), page("", 15)]
+    sources["team"] = [page("team", 9), page("team", 10, 16)]
+    sources["ceo@example.com"] = []
+    events = list(calendar_tools.iter_events_across_calendars(WINDOW, ["", "team", "ceo@example.com"]))
+    assert [event["id"] for event in events] == ["-8", "team-9", "team-10", "-11", "-15", "team-16"]
+    assert [event["_calendar"] for event in events] == ["", "team", "team", "", "", "team"]
+
+def test_failing_calendar_is_reported_and_the_others_still_listed(calendars):
+    sources, _ = calendars
+    sources[""] = [page("", 8), page("", 12)]
+    sources["team"] = [page("team", 9), Exception("Failed to get events: access denied")]
+    errors = {}
+    events = list(calendar_tools.iter_events_across_calendars(WINDOW, ["", "team"], errors))
+    assert [event["id"] for event in events] == ["-8", "team-9", "-12"]
+    assert errors == {"team": "Failed to get events: access denied"}
+
+def test_producers_stop_when_the_consumer_stops_early(calendars, monkeypatch):
+    sources, finished = calendars
+    monkeypatch.setattr(calendar_tools, "CALENDAR_STREAM_PAGES", 1)
+    endless = lambda calendar: lambda: (page(calendar, hour % 24) for hour in itertools.count())
+    sources[""] = endless("")
+    sources["team"] = endless("team")
+    events = calendar_tools.iter_events_across_calendars(WINDOW, ["", "team"])
+    next(events)
+    events.close()
+
+    streams = lambda: [thread for thread in threading.enumerate() if thread.name == "calendar-stream"]
+    deadline = time.time() + 2
+    while streams() and time.time() < deadline:
+        time.sleep(0.01)
+    assert not streams()
+    assert sorted(finished) == ["", "team"]
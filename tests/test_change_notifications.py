@@ -0,0 +1,154 @@
+import time
+import urllib.error
+import urllib.request
+import pytest
+import json_codec
+import change_notifications
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+def post(server, path, payload=None):
+    port = server.server_address[1]
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}",
+        data=json_codec.dumps(payload) if payload is not None else b"",
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+@pytest.fixture
+def receiver(monkeypatch):
+    changed, resubscribed = [], []
+    monkeypatch.setattr(change_notifications, "mark_changed", lambda user_key, event_id=None: changed.append((user_key, event_id)))
+    monkeypatch.setattr(change_notifications, "subscribe", lambda *args: resubscribed.append(args))
+    with change_notifications._lock:
+        change_notifications._subscriptions["sub-1"] = {
+            "user_key": "account:alice", "client_id": "client", "tenant_id": "tenant",
+            "client_state": "secret-state", "expires": time.time() + 3600
+        }
+        change_notifications._by_user["account:alice"] = "sub-1"
+    server = change_notifications.start_receiver(host="127.0.0.1", port=0)
+    yield server, changed, resubscribed
+    change_notifications._forget("sub-1")
+
+def notification(client_state="secret-state", **fields):
+    return {"value": [{"subscriptionId": "sub-1", "clientState": client_state, **fields}]}
+
+def test_validation_token_is_echoed(receiver):
+    server, changed, _ = receiver
+    status, body = post(server, "/?validationToken=Validation%3A+token+123")
+    assert status == 200
+    assert body == b"Validation: token 123"
+    assert changed == []
+
+def test_valid_notification_marks_the_event_changed(receiver):
+    server, changed, _ = receiver
+    status, _ = post(server, "/", notification(changeType="updated", resourceData={"id": "E3"}))
+    assert status == 202
+    wait_for(lambda: changed)
+    assert changed == [("account:alice", "E3")]
+
+def test_wrong_client_state_is_rejected(receiver):
+    server, changed, _ = receiver
+    rejected = change_notifications.stats()["rejected"]
+    status, _ = post(server, "/", notification(client_state="forged", resourceData={"id": "E3"}))
+    assert status == 202
+    wait_for(lambda: change_notifications.stats()["rejected"] == rejected + 1)
+    assert changed == []
+
+def test_malformed_payload_is_a_bad_request(receiver):
+    server, changed, _ = receiver
+    port = server.server_address[1]
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/", data=b"{not json", method="POST")
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=5)
+    assert error.value.code == 400
+    assert changed == []
+
+def test_missed_lifecycle_event_invalidates_everything(receiver):
+    server, changed, _ = receiver
+    status, _ = post(server, "/", notification(lifecycleEvent="missed"))
+    assert status == 202
+    wait_for(lambda: changed)
+    assert changed == [("account:alice", None)]
+
+def test_subscription_removed_resubscribes(receiver):
+    server, changed, resubscribed = receiver
+    status, _ = post(server, "/", notification(lifecycleEvent="subscriptionRemoved"))
+    assert status == 202
+    wait_for(lambda: resubscribed)
+    assert changed == [("account:alice", None)]
+    assert resubscribed == [("client", "tenant", "account:alice")]
+    assert "sub-1" not in change_notifications._subscriptions
+
+def test_failed_subscribe_backs_off_per_user(monkeypatch):
+    attempts = []
+
+    def failing_subscribe(client_id, tenant_id, user_key):
+        attempts.append(user_key)
+        raise Exception("Failed to subscribe to calendar changes: validation timed out")
+
+    monkeypatch.setattr(change_notifications, "NOTIFICATIONS_ENABLED", True)
+    monkeypatch.setattr(change_notifications, "NOTIFICATION_URL", "https://example.com/hook")
+    monkeypatch.setattr(change_notifications, "start_receiver", lambda: None)
+    monkeypatch.setattr(change_notifications, "subscribe", failing_subscribe)
+    monkeypatch.setattr(change_notifications, "SUBSCRIBE_RETRY", 60)
+    monkeypatch.setattr(change_notifications, "_retry_after", {})
+
+    def attempt(user_key):
+        change_notifications._subscribe_after_sign_in("client", "tenant", user_key)
+        wait_for(lambda: user_key not in change_notifications._subscribing)
+
+    attempt("account:bob")
+    for _ in range(5):
+        attempt("account:bob")
+    assert attempts == ["account:bob"]
+    failures, retry_at = change_notifications._retry_after["account:bob"]
+    assert failures == 1 and 55 < retry_at - time.time() <= 60
+
+    # Another user is not held back by Bob's failures
+    attempt("account:carol")
+    assert attempts == ["account:bob", "account:carol"]
+
+    # Once the wait is over the next attempt is made, and the wait doubles when it fails again
+    change_notifications._retry_after["account:bob"] = (1, time.time() - 1)
+    attempt("account:bob")
+    failures, retry_at = change_notifications._retry_after["account:bob"]
+    assert attempts[-1] == "account:bob" and failures == 2 and 115 < retry_at - time.time() <= 120
+
+@pytest.fixture
+def subscribed(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(change_notifications, "get_cached_token", lambda client_id, tenant_id, user_key: f"token-{user_key}")
+    monkeypatch.setattr(change_notifications.graph_client, "delete", lambda url, **kwargs: deleted.append(url.rsplit("/", 1)[1]))
+    with change_notifications._lock:
+        for user_key, subscription_id in (("account:dave", "sub-dave"), ("account:erin", "sub-erin")):
+            change_notifications._subscriptions[subscription_id] = {
+                "user_key": user_key, "client_id": "client", "tenant_id": "tenant",
+                "client_state": "state", "expires": time.time() + 3600
+            }
+            change_notifications._by_user[user_key] = subscription_id
+    yield deleted
+    for subscription_id in ("sub-dave", "sub-erin"):
+        change_notifications._forget(subscription_id)
+
+def test_logout_deletes_the_users_subscription(subscribed):
+    import graph_api_auth
+    graph_api_auth.logout("client", "account:dave")
+    assert subscribed == ["sub-dave"]
+    assert "account:dave" not in change_notifications._by_user and "account:erin" in change_notifications._by_user
+
+def test_shutdown_deletes_every_subscription(subscribed):
+    change_notifications._unsubscribe_all()
+    assert sorted(subscribed) == ["sub-dave", "sub-erin"]
+    assert change_notifications.stats()["subscriptions"] == 0
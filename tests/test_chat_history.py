@@ -0,0 +1,42 @@
+import pytest
+import chat_history
+import state_backend
+
+@pytest.fixture(params=["file", "sqlite"])
+def backend(request, monkeypatch, tmp_path):
+    monkeypatch.setattr(chat_history, "CHAT_HISTORY_ENABLED", True)
+    if request.param == "file":
+        monkeypatch.setattr(state_backend, "_backend", state_backend.FileBackend(str(tmp_path)))
+    else:
+        monkeypatch.setattr(state_backend, "_backend", state_backend.SQLiteBackend(str(tmp_path / "state.db")))
+
+def say(user_key, *contents):
+    for content in contents:
+        chat_history.append("user", content, user_key=user_key)
+
+def test_tail_and_earlier_pages(backend, monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_RENDER_WINDOW", 3)
+    say("chat-ann", *(f"message {i}" for i in range(8)))
+    assert chat_history.count("chat-ann") == 8
+    assert [m["content"] for m in chat_history.tail(user_key="chat-ann")] == ["message 5", "message 6", "message 7"]
+    assert [m["content"] for m in chat_history.read(2, 5, user_key="chat-ann")] == ["message 2", "message 3", "message 4"]
+    # Paging back past the start stops at the first message
+    assert [m["content"] for m in chat_history.read(-2, 2, user_key="chat-ann")] == ["message 0", "message 1"]
+    assert chat_history.read(5, 5, user_key="chat-ann") == []
+
+def test_conversations_are_per_user_and_cleared_alone(backend):
+    say("chat-ann", "Book the review")
+    say("chat-bob", "Cancel my 1:1", "Thanks")
+    chat_history.clear("chat-bob")
+    assert chat_history.count("chat-bob") == 0 and chat_history.tail(user_key="chat-bob") == []
+    assert chat_history.tail(user_key="chat-ann") == [{"role": "user", "content": "Book the review"}]
+
+def test_messages_round_trip_unchanged(backend):
+    content = "Réunion « équipe » 📅\nline two\twith \"quotes\""
+    chat_history.append("assistant", content, user_key="chat-ann")
+    assert chat_history.tail(1, user_key="chat-ann") == [{"role": "assistant", "content": content}]
+
+def test_disabled_history_keeps_nothing(backend, monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_HISTORY_ENABLED", False)
+    say("chat-ann", "Book the review")
+    assert chat_history.count("chat-ann") == 0 and chat_history.tail(user_key="chat-ann") == []
@@ -0,0 +1,72 @@
+import pytest
+import event_handles
+import state_backend
+import calendar_tools
+from graph_api_auth import set_current_user
+
+@pytest.fixture(autouse=True)
+def fresh_user(request):
+    set_current_user(f"test:{request.node.name}")
+
+def listing(*subjects, calendar=None):
+    events = [
+        {"id": f"id-{subject}", "subject": subject, "start": {"dateTime": "2025-01-23T09:00:00"}}
+        for subject in subjects
+    ]
+    if calendar:
+        for event in events:
+            event["_calendar"] = calendar
+    return events
+
+def test_handles_resolve_to_the_calendar_they_were_listed_from():
+    event_handles.remember(listing("Standup"))
+    handles = event_handles.remember(listing("Board review"), calendar="ceo@example.com")
+    event_handles.remember(listing("Offsite", calendar="team-calendar-id"))
+
+    assert event_handles.resolve("E1") == ("id-Standup", None)
+    assert event_handles.resolve(handles["id-Board review"]) == ("id-Board review", "ceo@example.com")
+    assert event_handles.resolve("id-Board review") == ("id-Board review", "ceo@example.com")
+    assert event_handles.resolve("offsite") == ("id-Offsite", "team-calendar-id")
+    assert event_handles.resolve("E9") is None
+
+def test_mutations_use_the_stored_calendar_unless_one_is_given():
+    event_handles.remember(listing("Board review"), calendar="ceo@example.com")
+
+    @calendar_tools._resolves_event
+    def update(event_id, calendar=None):
+        return event_id, calendar
+
+    assert update("E1") == ("id-Board review", "ceo@example.com")
+    assert update("Board review") == ("id-Board review", "ceo@example.com")
+    assert update("E1", calendar="other@example.com") == ("id-Board review", "other@example.com")
+
+def test_ambiguous_subject_lists_the_handles():
+    event_handles.remember(listing("Sync with design", "Sync with sales"))
+    with pytest.raises(event_handles.AmbiguousReference, match="E1 'Sync with design'.*E2 'Sync with sales'"):
+        event_handles.resolve("sync")
+
+def test_ambiguous_reference_is_the_mutation_result(monkeypatch):
+    event_handles.remember(listing("Sync with design", "Sync with sales"))
+    # Neither is in the upcoming window Graph is asked about
+    monkeypatch.setattr(calendar_tools, "get_access_token", lambda: "token")
+    monkeypatch.setattr(calendar_tools, "_calendar_view", lambda time_window, access_token, calendar=None: [])
+
+    @calendar_tools._resolves_event
+    def update(event_id, calendar=None):
+        raise AssertionError("must not run")
+
+    assert update("sync").startswith("'sync' matches several events: E1 'Sync with design'")
+    assert update("sync").endswith("Nothing was changed.")
+
+def test_handles_resolve_on_another_replica(monkeypatch, tmp_path):
+    monkeypatch.setattr(state_backend, "STATE_BACKEND", "sqlite")
+    monkeypatch.setattr(state_backend, "STATE_DB", str(tmp_path / "state.db"))
+    monkeypatch.setattr(state_backend, "_backend", None)
+    handles = event_handles.remember(listing("Board review"), calendar="ceo@example.com")
+
+    # A second process opens its own connection to the same database
+    monkeypatch.setattr(state_backend, "_backend", state_backend.SQLiteBackend())
+    assert event_handles.resolve(handles["id-Board review"]) == ("id-Board review", "ceo@example.com")
+    event_handles.forget("id-Board review")
+    monkeypatch.setattr(state_backend, "_backend", state_backend.SQLiteBackend())
+    assert event_handles.resolve(handles["id-Board review"]) is None
@@ -0,0 +1,78 @@
+import threading
+import pytest
+import graph_api_auth
+from state_backend import get_backend
+
+CLIENT = "client-test"
+
+def account_cache(home_account_id):
+    """A serialized MSAL cache holding one account."""
+    key = f"{home_account_id}-login.microsoftonline.com-{home_account_id.split('.')[1]}"
+    return (
+        '{"Account": {"%s": {"home_account_id": "%s", "environment": "login.microsoftonline.com", '
+        '"realm": "%s", "local_account_id": "%s", "username": "%s@example.com", "authority_type": "MSSTS"}}}'
+        % (key, home_account_id, home_account_id.split(".")[1], home_account_id.split(".")[0], home_account_id.split(".")[0])
+    )
+
+def accounts(user_key):
+    cache = graph_api_auth._load_cache(CLIENT, user_key)
+    return [account["home_account_id"] for account in cache.search(cache.CredentialType.ACCOUNT)]
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(graph_api_auth, "_token_caches", type(graph_api_auth._token_caches)())
+    monkeypatch.setattr(graph_api_auth, "CLIENT_ID", CLIENT)
+    monkeypatch.setattr(graph_api_auth, "_default_user_key", None)
+    yield
+    get_backend().delete("last_account", CLIENT[:8])
+
+def test_users_never_see_each_others_tokens():
+    get_backend().put("token_cache", graph_api_auth._cache_key(CLIENT, "account:ann.tenant"), account_cache("ann.tenant"))
+    assert accounts("account:ann.tenant") == ["ann.tenant"]
+    assert accounts("account:bob.tenant") == []
+    assert graph_api_auth._load_cache(CLIENT, "account:ann.tenant") is not graph_api_auth._load_cache(CLIENT, "account:bob.tenant")
+
+def test_least_recently_used_cache_is_evicted_and_written_out(monkeypatch):
+    monkeypatch.setattr(graph_api_auth, "TOKEN_CACHE_MAX_ENTRIES", 2)
+    first = graph_api_auth._load_cache(CLIENT, "lru-1")
+    first.deserialize(account_cache("one.tenant"))
+    first.has_state_changed = True
+    graph_api_auth._load_cache(CLIENT, "lru-2")
+    graph_api_auth._load_cache(CLIENT, "lru-1")
+    graph_api_auth._load_cache(CLIENT, "lru-3")
+
+    assert [user for _, user in graph_api_auth._token_caches] == ["lru-1", "lru-3"]
+    graph_api_auth._load_cache(CLIENT, "lru-2")
+    assert [user for _, user in graph_api_auth._token_caches] == ["lru-3", "lru-2"]
+    # lru-1 left memory with unsaved changes, so they were written to the backend first
+    assert accounts("lru-1") == ["one.tenant"]
+
+def test_idle_caches_expire_from_memory():
+    graph_api_auth._load_cache(CLIENT, "idle")
+    graph_api_auth._token_caches[(CLIENT, "idle")][1] -= graph_api_auth.TOKEN_CACHE_TTL + 1
+    graph_api_auth._load_cache(CLIENT, "active")
+    assert (CLIENT, "idle") not in graph_api_auth._token_caches
+
+def test_new_runs_start_as_the_account_that_signed_in_last():
+    cache = graph_api_auth._load_cache(CLIENT, "session-1")
+    cache.deserialize(account_cache("ann.tenant"))
+    graph_api_auth._bind_account(CLIENT, "session-1", "ann.tenant")
+    graph_api_auth._save_cache(CLIENT, "account:ann.tenant")
+    assert graph_api_auth.remembered_account() == "account:ann.tenant"
+
+    # A thread with no session or bound user, like a CLI run
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(graph_api_auth.get_current_user()))
+    thread.start()
+    thread.join()
+    assert seen == ["account:ann.tenant"]
+
+    graph_api_auth.logout(CLIENT, "account:ann.tenant")
+    assert graph_api_auth.remembered_account() is None
+
+def test_remembering_can_be_turned_off(monkeypatch):
+    get_backend().put("token_cache", graph_api_auth._cache_key(CLIENT, "account:ann.tenant"), account_cache("ann.tenant"))
+    get_backend().put("last_account", CLIENT[:8], "account:ann.tenant")
+    assert graph_api_auth.remembered_account() == "account:ann.tenant"
+    monkeypatch.setattr(graph_api_auth, "REMEMBER_ACCOUNT", False)
+    assert graph_api_auth.remembered_account() is None
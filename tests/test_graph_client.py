@@ -0,0 +1,173 @@
+import time
+import contextvars
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from langchain.agents import create_agent
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+import graph_client
+from graph_api_auth import set_current_user
+from test_tool_executor import OneStepModel
+
+class ScriptedGraph(BaseHTTPRequestHandler):
+    """Answers each request with the next (delay, status, headers) step of the server's script."""
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits += 1
+            hit = self.server.hits
+            delay, status, headers = self.server.script.popleft() if self.server.script else (0, 200, {})
+        time.sleep(delay)
+        body = f"reply {hit}".encode("utf-8")
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on this attempt (timeout or a hedge that won)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def graph(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedGraph)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = 0
+    server.script = deque()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/me/events"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    set_current_user("test:graph")
+    monkeypatch.setattr(graph_client, "_breakers", {})
+    monkeypatch.setattr(graph_client, "_latencies", deque(maxlen=200))
+    monkeypatch.setattr(graph_client, "_stats", dict.fromkeys(graph_client._stats, 0))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_hedge_fires_after_p95_and_faster_reply_wins(graph, monkeypatch):
+    monkeypatch.setattr(graph_client, "GRAPH_HEDGE_MIN_DELAY", 0.05)
+    graph_client._latencies.extend([0.05] * graph_client.GRAPH_HEDGE_MIN_SAMPLES)
+    graph.script.extend([(2, 200, {}), (0, 200, {})])
+
+    started = time.time()
+    response = graph_client.get(graph.url)
+    assert time.time() - started < 1
+    assert response.text == "reply 2"
+    stats = graph_client.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+def test_no_hedge_before_enough_samples(graph, monkeypatch):
+    graph.script.append((0.3, 200, {}))
+    assert graph_client.get(graph.url).text == "reply 1"
+    assert graph.hits == 1 and graph_client.stats()["hedged"] == 0
+
+def test_read_timeout_is_a_clear_error(graph, monkeypatch):
+    monkeypatch.setattr(graph_client, "GRAPH_READ_TIMEOUT", 0.2)
+    graph.script.append((1, 200, {}))
+    with pytest.raises(Exception, match=r"did not respond in time \(GET http://127\.0\.0\.1:\d+/me/events\)"):
+        graph_client.get(graph.url + "?$top=10", hedge=False)
+    assert graph_client.stats()["timeouts"] == 1
+
+def test_breaker_opens_after_consecutive_failures(graph, monkeypatch):
+    monkeypatch.setattr(graph_client, "GRAPH_BREAKER_FAILURES", 3)
+    graph.script.extend([(0, 503, {})] * 3)
+    for _ in range(3):
+        assert graph_client.get(graph.url).status_code == 503
+    with pytest.raises(graph_client.GraphUnavailable, match="3 failed calls in a row"):
+        graph_client.get(graph.url)
+    assert graph.hits == 3
+    assert graph_client.stats()["breaker_open"] and graph_client.stats()["rejected"] == 1
+
+def test_single_probe_closes_breaker_after_cooldown(graph, monkeypatch):
+    monkeypatch.setattr(graph_client, "GRAPH_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(graph_client, "GRAPH_BREAKER_COOLDOWN", 0.2)
+    graph.script.extend([(0, 503, {}), (0, 503, {}), (0.5, 200, {})])
+    for _ in range(2):
+        graph_client.get(graph.url)
+    with pytest.raises(graph_client.GraphUnavailable):
+        graph_client.get(graph.url)
+
+    time.sleep(0.25)
+    probe = {}
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(lambda: probe.update(response=graph_client.get(graph.url)),))
+    thread.start()
+    time.sleep(0.1)
+    # While the probe is out every other call still fails fast
+    with pytest.raises(graph_client.GraphUnavailable):
+        graph_client.get(graph.url)
+    thread.join()
+    assert probe["response"].status_code == 200
+    assert not graph_client.stats()["breaker_open"]
+    assert graph_client.get(graph.url).status_code == 200
+    assert graph.hits == 4
+
+def test_failed_probe_reopens_breaker(graph, monkeypatch):
+    monkeypatch.setattr(graph_client, "GRAPH_BREAKER_FAILURES", 1)
+    monkeypatch.setattr(graph_client, "GRAPH_BREAKER_COOLDOWN", 0.1)
+    graph.script.extend([(0, 503, {}), (0, 503, {})])
+    graph_client.get(graph.url)
+    time.sleep(0.15)
+    assert graph_client.get(graph.url).status_code == 503
+    with pytest.raises(graph_client.GraphUnavailable):
+        graph_client.get(graph.url)
+
+def test_throttling_honours_retry_after_and_does_not_open_breaker(graph, monkeypatch):
+    monkeypatch.setattr(graph_client, "GRAPH_BREAKER_FAILURES", 2)
+    graph.script.extend([(0, 429, {"Retry-After": "0.2"}), (0, 200, {})])
+    started = time.time()
+    response = graph_client.get(graph.url)
+    assert response.status_code == 200 and time.time() - started >= 0.2
+    assert graph_client.stats()["throttled"] == 1
+
+    # A long Retry-After is handed back to the caller, and repeated 429s leave the breaker closed
+    graph.script.extend([(0, 429, {"Retry-After": "120"})] * 3)
+    for _ in range(3):
+        assert graph_client.get(graph.url).status_code == 429
+    assert not graph_client.stats()["breaker_open"]
+    assert graph_client.get(graph.url).status_code == 200
+
+def test_breaker_is_per_user(graph, monkeypatch):
+    monkeypatch.setattr(graph_client, "GRAPH_BREAKER_FAILURES", 1)
+    graph.script.append((0, 503, {}))
+    graph_client.get(graph.url)
+    with pytest.raises(graph_client.GraphUnavailable):
+        graph_client.get(graph.url)
+
+    set_current_user("test:graph-other")
+    assert graph_client.get(graph.url).status_code == 200
+    assert not graph_client.stats()["breaker_open"]
+    assert "test:graph-other" not in graph_client._breakers
+
+@tool
+def read_calendar(day: str):
+    """Reads a day."""
+    raise graph_client.GraphUnavailable("Microsoft Graph is not responding reliably right now.")
+
+@tool
+def read_notes(day: str):
+    """Reads notes."""
+    return f"notes for {day}"
+
+def test_open_breaker_is_a_tool_result_and_the_step_carries_on():
+    model = OneStepModel(replies=[
+        AIMessage(content="", tool_calls=[
+            {"name": "read_calendar", "args": {"day": "2025-01-06"}, "id": "call-1"},
+            {"name": "read_notes", "args": {"day": "2025-01-06"}, "id": "call-2"},
+        ]),
+        AIMessage(content="Graph is down."),
+    ])
+    agent = create_agent(model, [read_calendar, read_notes], middleware=[graph_client.breaker_middleware()])
+    messages = agent.invoke({"messages": [HumanMessage(content="What's on?")]})["messages"]
+    calendar, notes = messages[2], messages[3]
+    assert calendar.status == "error" and calendar.content.startswith("❌ Microsoft Graph is not responding")
+    assert notes.content == "notes for 2025-01-06"
+    assert messages[-1].content == "Graph is down."
@@ -0,0 +1,33 @@
+import importlib
+import pytest
+import json_codec
+
+EVENT = {"subject": "Réunion 📅", "attendees": [{"emailAddress": {"address": "ann@example.com"}}], "isOnline": True, "reminder": None}
+
+@pytest.fixture(params=["auto", "stdlib"])
+def codec(request, monkeypatch):
+    if request.param == "auto" and json_codec.orjson is None:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setenv("JSON_CODEC", request.param)
+    yield importlib.reload(json_codec)
+    monkeypatch.undo()
+    importlib.reload(json_codec)
+
+def test_chosen_codec(codec):
+    assert codec.NAME == ("orjson" if codec.JSON_CODEC == "auto" else "json")
+
+def test_dumps_is_compact_utf8_bytes(codec):
+    body = codec.dumps(EVENT)
+    assert isinstance(body, bytes)
+    assert body.decode("utf-8") == (
+        '{"subject":"Réunion 📅","attendees":[{"emailAddress":{"address":"ann@example.com"}}],"isOnline":true,"reminder":null}'
+    )
+    assert codec.dumps_str(EVENT) == body.decode("utf-8")
+
+def test_loads_takes_bytes_or_str(codec):
+    assert codec.loads(codec.dumps(EVENT)) == EVENT
+    assert codec.loads(codec.dumps_str(EVENT)) == EVENT
+
+def test_invalid_json_raises_value_error(codec):
+    with pytest.raises(ValueError):
+        codec.loads(b"{not json")
@@ -0,0 +1,64 @@
+import re
+import pytest
+import meeting_analytics
+import response_cache
+
+def event(start, end):
+    return {"start": {"dateTime": start}, "end": {"dateTime": end}, "organizer": {}, "attendees": []}
+
+@pytest.fixture
+def calendar(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", False)
+    queried = []
+    events = []
+
+    def load_table(time_window, calendar=None):
+        queried.append(time_window)
+        return meeting_analytics.EventTable.from_pages([events])
+
+    monkeypatch.setattr(meeting_analytics, "load_table", load_table)
+    return queried, events
+
+def focus(text):
+    return re.search(r"(\d+) block\(s\), ([\d.]+)h total, ([\d.]+)h per workday", text).groups()
+
+def test_local_window_counts_only_its_own_workdays(calendar):
+    queried, events = calendar
+    # Monday 10:00-11:00 Berlin (09:00 UTC); all times from calendarView are UTC
+    events.append(event("2025-01-06T09:00:00", "2025-01-06T10:00:00"))
+    text = meeting_analytics.analyze_meetings(
+        {"start": "2025-01-06T00:00:00", "end": "2025-01-08T00:00:00"}, ["focus"], timezone="Europe/Berlin"
+    )
+    # Monday 11:00-17:00 and all of Tuesday; the window ends at Wednesday 00:00 local
+    assert focus(text) == ("2", "14.0", "7.0")
+    assert queried == [{"start": "2025-01-05T23:00:00", "end": "2025-01-07T23:00:00"}]
+
+def test_bounds_with_an_offset_are_absolute(calendar):
+    queried, events = calendar
+    events.append(event("2025-07-07T07:00:00", "2025-07-07T08:00:00"))
+    meeting_analytics.analyze_meetings(
+        {"start": "2025-07-07T00:00:00Z", "end": "2025-07-08T00:00:00+02:00"}, ["focus"], timezone="Europe/Berlin"
+    )
+    assert queried == [{"start": "2025-07-07T00:00:00", "end": "2025-07-07T22:00:00"}]
+
+def test_workday_outside_the_window_hours_is_not_counted():
+    np = meeting_analytics.np
+    day = 86400 * 20094  # Monday 2025-01-06, local seconds
+    no_meetings = np.array([], dtype=np.int64)
+    # Window ends Tuesday 08:00, before the workday starts
+    gap_start, gap_end, workdays = meeting_analytics.focus_gaps(no_meetings, no_meetings, day, day + 86400 + 8 * 3600, 120)
+    assert workdays == 1
+    assert list(gap_end - gap_start) == [8 * 3600]
+
+def test_unknown_timezone_is_a_message(calendar):
+    queried, _ = calendar
+    text = meeting_analytics.analyze_meetings({"start": "2025-01-06T00:00:00", "end": "2025-01-08T00:00:00"}, timezone="Mars/Olympus")
+    assert text == "Unknown time zone 'Mars/Olympus'. Use an IANA name like 'Europe/Berlin'."
+    assert queried == []
+
+def test_queued_changes_are_sent_before_reading(calendar, monkeypatch):
+    queried, _ = calendar
+    order = []
+    monkeypatch.setattr(meeting_analytics.outbox, "flush_pending", lambda: order.append(("flush", len(queried))))
+    meeting_analytics.analyze_meetings({"start": "2025-01-06T00:00:00", "end": "2025-01-08T00:00:00"}, timezone="UTC")
+    assert order == [("flush", 0)] and len(queried) == 1
@@ -0,0 +1,130 @@
+from typing import Any, List
+import pytest
+from langchain.agents import create_agent
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+import model_router
+import planner
+
+# Tiers in the order they were called during the current test
+LOG = []
+
+@tool
+def get_events(day: str):
+    """Gets the events of a day. Parameters: day (YYYY-MM-DD)."""
+    if day == "busy":
+        return "\n".join(f"📅 Meeting {i}\n   Handle: E{i}\n   Start: 2025-01-23T{8 + i % 9:02d}:00:00" for i in range(60))
+    return "📅 Standup\n   Handle: E1\n   Start: 2025-01-23T09:00:00"
+
+class ScriptedModel(BaseChatModel):
+    """Answers with the next scripted reply and logs which tier was asked."""
+
+    tier: str
+    script: List[Any] = []
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        LOG.append(self.tier)
+        reply = self.script.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        reply.usage_metadata = {"input_tokens": 100, "output_tokens": 10, "total_tokens": 110}
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+def call_tool(day):
+    return AIMessage(content="", tool_calls=[{"name": "get_events", "args": {"day": day} if day else {}, "id": "call-1"}])
+
+def run_turn(fast_script, strong_script):
+    fast = ScriptedModel(tier="fast", script=list(fast_script))
+    strong = ScriptedModel(tier="strong", script=list(strong_script))
+    agent = create_agent(strong, [get_events], middleware=[model_router.model_router_middleware(fast, strong)])
+    result = agent.invoke({"messages": [HumanMessage(content="What's on my calendar?")]})
+    return result["messages"][-1].content
+
+@pytest.fixture(autouse=True)
+def routing(monkeypatch):
+    LOG.clear()
+    monkeypatch.setattr(model_router, "MODEL_ROUTING", True)
+    monkeypatch.setattr(model_router, "_stats", {tier: dict.fromkeys(("calls", "seconds", "input_tokens", "output_tokens"), 0) for tier in model_router.TIERS})
+    monkeypatch.setattr(model_router, "_escalations", {})
+
+def test_route_by_what_the_call_has_to_act_on():
+    request = [HumanMessage(content="What's on today?")]
+    assert model_router.route(request) == ("fast", "tool selection")
+    short = ToolMessage(content="📅 Standup", tool_call_id="call-1")
+    assert model_router.route(request + [call_tool("today"), short]) == ("fast", "follow-up")
+    long = ToolMessage(content="x" * model_router.ROUTER_SYNTHESIS_CHARS, tool_call_id="call-1")
+    assert model_router.route(request + [call_tool("today"), long]) == ("strong", "synthesis")
+    failed = ToolMessage(content="❌ Microsoft Graph is not responding", tool_call_id="call-1", status="error")
+    assert model_router.route(request + [call_tool("today"), failed]) == ("strong", "tool error")
+
+def test_low_confidence_reasons():
+    assert model_router.low_confidence(call_tool("2025-01-23"), [get_events]) is None
+    assert model_router.low_confidence(call_tool(None), [get_events]) == "missing arguments"
+    assert model_router.low_confidence(AIMessage(content="", tool_calls=[{"name": "nope", "args": {}, "id": "c"}]), [get_events]) == "unknown tool"
+    assert model_router.low_confidence(AIMessage(content="I'm not sure which calendar."), [get_events]) == "hedged answer"
+    assert model_router.low_confidence(AIMessage(content=""), [get_events]) == "empty reply"
+    unsure = AIMessage(content="You have a standup.", response_metadata={"finish_reason": "STOP", "avg_logprobs": -1.5})
+    assert model_router.low_confidence(unsure, [get_events]) == "low logprob"
+    cut_off = AIMessage(content="You have a", response_metadata={"finish_reason": "MAX_TOKENS"})
+    assert model_router.low_confidence(cut_off, [get_events]) == "unfinished reply"
+
+def test_new_request_stays_on_the_fast_model():
+    answer = run_turn([call_tool("2025-01-23"), AIMessage(content="You have a standup at 9.")], [])
+    assert LOG == ["fast", "fast"] and answer == "You have a standup at 9."
+
+def test_long_tool_results_go_to_the_strong_model():
+    answer = run_turn([call_tool("busy")], [AIMessage(content="60 meetings, mostly mornings.")])
+    assert LOG == ["fast", "strong"] and answer == "60 meetings, mostly mornings."
+
+def test_tool_call_without_required_arguments_escalates():
+    run_turn([call_tool(None), AIMessage(content="Done.")], [call_tool("2025-01-23")])
+    assert LOG == ["fast", "strong", "fast"]
+    assert model_router.stats()["escalations"] == {"missing arguments": 1}
+
+def test_hedged_answer_escalates():
+    answer = run_turn([AIMessage(content="I'm not sure which calendar you mean.")], [AIMessage(content="Your default calendar is empty today.")])
+    assert LOG == ["fast", "strong"] and answer == "Your default calendar is empty today."
+    assert model_router.stats()["escalations"] == {"hedged answer": 1}
+
+def test_fast_model_error_falls_back_to_strong():
+    answer = run_turn([Exception("429 quota exceeded")], [AIMessage(content="Nothing today.")])
+    assert LOG == ["fast", "strong"] and answer == "Nothing today."
+    assert model_router.stats()["escalations"] == {"fast model error": 1}
+
+def test_unreadable_fast_plan_is_redone_by_the_strong_model():
+    plan = planner.Plan(steps=[planner.PlanStep(id="s1", tool="get_events", arguments='{"day": "2025-01-23"}')])
+
+    def stub(tier, output):
+        class StubPlanner:
+            def with_structured_output(self, schema, include_raw=False):
+                return RunnableLambda(lambda messages: LOG.append(tier) or output)
+        return StubPlanner()
+
+    agent = planner.PlanningAgent(
+        stub("fast", {"raw": AIMessage(content="{not json"), "parsed": None, "parsing_error": "invalid JSON"}),
+        [get_events], None, mode="always",
+        replan_llm=stub("strong", {"raw": AIMessage(content=""), "parsed": plan, "parsing_error": None}),
+    )
+    answer, llm_calls = agent._plan_and_run([("user", "Find the standup and list tomorrow")])
+    assert LOG == ["fast", "strong"] and "Standup" in answer and llm_calls == 2
+    assert model_router.stats()["escalations"] == {"unreadable plan": 1}
+
+def test_calls_latency_and_tokens_are_recorded_per_tier():
+    run_turn([call_tool("busy")], [AIMessage(content="60 meetings, mostly mornings.")])
+    run_turn([Exception("429 quota exceeded")], [AIMessage(content="Nothing today.")])
+    stats = model_router.stats()
+    assert stats["fast"]["calls"] == 2 and stats["strong"]["calls"] == 2
+    # The failed fast call counts, but returned no tokens
+    assert stats["fast"]["input_tokens"] == 100 and stats["strong"]["input_tokens"] == 200
+    assert stats["strong"]["output_tokens"] == 20
+    assert stats["fast"]["avg_seconds"] == stats["fast"]["seconds"] / 2
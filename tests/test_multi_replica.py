@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+import msal
+import pytest
+import chat_history
+import graph_api_auth
+import state_backend
+
+CLIENT = "client-replicas"
+SESSION = "replica-session"
+ACCOUNT = "account:ann.tenant"
+
+# A cache as MSAL serializes it; nothing here talks to Microsoft
+SIGNED_IN = (
+    '{"Account": {"ann.tenant-login.microsoftonline.com-tenant": {"home_account_id": "ann.tenant", '
+    '"environment": "login.microsoftonline.com", "realm": "tenant", "local_account_id": "ann", '
+    '"username": "ann@example.com", "authority_type": "MSSTS"}}}'
+)
+
+class DeviceFlowApp:
+    """Stands in for msal.PublicClientApplication: hands out a device code, then signs Ann in."""
+
+    def __init__(self, client_id, authority=None, token_cache=None):
+        self.token_cache = token_cache
+
+    def get_accounts(self):
+        return []
+
+    def initiate_device_flow(self, scopes=None):
+        return {"user_code": "REPLICA1", "device_code": "device", "verification_uri": "https://microsoft.com/devicelogin",
+                "interval": 0, "expires_in": 900, "expires_at": time.time() + 900}
+
+    def acquire_token_by_device_flow(self, flow):
+        self.token_cache.deserialize(SIGNED_IN)
+        self.token_cache.has_state_changed = True
+        return {"access_token": "token", "id_token_claims": {"oid": "ann", "tid": "tenant"}}
+
+@pytest.fixture
+def replicas(monkeypatch, tmp_path):
+    """Switches between replicas that each have their own connection and token caches over one STATE_DB."""
+    monkeypatch.setattr(state_backend, "STATE_BACKEND", "sqlite")
+    monkeypatch.setattr(state_backend, "STATE_DB", str(tmp_path / "state.db"))
+    monkeypatch.setattr(graph_api_auth, "TOKEN_CACHE_REVALIDATE", 0)
+    monkeypatch.setattr(graph_api_auth, "CLIENT_ID", CLIENT)
+    monkeypatch.setattr(graph_api_auth, "_default_user_key", None)
+    monkeypatch.setattr(graph_api_auth.msal, "PublicClientApplication", DeviceFlowApp)
+    processes = {}
+
+    def on(name):
+        if name not in processes:
+            processes[name] = (state_backend.SQLiteBackend(), OrderedDict())
+        backend, caches = processes[name]
+        monkeypatch.setattr(state_backend, "_backend", backend)
+        monkeypatch.setattr(graph_api_auth, "_token_caches", caches)
+
+    yield on
+    graph_api_auth.set_current_user(None)
+
+def accounts(user_key):
+    cache = graph_api_auth._load_cache(CLIENT, user_key)
+    return [account["home_account_id"] for account in cache.search(cache.CredentialType.ACCOUNT)]
+
+def test_device_flow_started_on_one_replica_is_finished_on_another(replicas):
+    replicas("a")
+    graph_api_auth.set_current_user(SESSION)
+    with pytest.raises(Exception, match="Authentication failed"):
+        graph_api_auth.get_access_token()
+    assert graph_api_auth._load_pending(SESSION)["flow"]["user_code"] == "REPLICA1"
+
+    replicas("b")
+    graph_api_auth.set_current_user(SESSION)
+    assert graph_api_auth.get_access_token() == "token"
+    assert graph_api_auth.get_current_user() == ACCOUNT
+    assert graph_api_auth._load_pending(SESSION) is None
+
+    replicas("a")
+    assert accounts(ACCOUNT) == ["ann.tenant"]
+    assert graph_api_auth.remembered_account(CLIENT) == ACCOUNT
+
+def test_logout_on_one_replica_is_noticed_by_another(replicas):
+    replicas("b")
+    state_backend.get_backend().put("token_cache", graph_api_auth._cache_key(CLIENT, ACCOUNT), SIGNED_IN)
+    replicas("a")
+    assert accounts(ACCOUNT) == ["ann.tenant"]
+
+    replicas("b")
+    graph_api_auth.logout(CLIENT, ACCOUNT)
+    replicas("a")
+    # A still holds the cache in memory, and revalidates it against the backend
+    assert (CLIENT, ACCOUNT) in graph_api_auth._token_caches
+    assert accounts(ACCOUNT) == []
+
+def test_concurrent_chat_appends_keep_every_message_in_order(replicas):
+    replicas("a")
+    writers, per_writer = 4, 50
+
+    # Each thread opens its own connection, as a separate replica would
+    def write(writer):
+        for i in range(per_writer):
+            chat_history.append("user", f"{writer}:{i}", user_key=SESSION)
+
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    messages = chat_history.read(0, chat_history.count(SESSION), user_key=SESSION)
+    assert len(messages) == writers * per_writer
+    for writer in range(writers):
+        sent = [int(m["content"].split(":")[1]) for m in messages if m["content"].startswith(f"{writer}:")]
+        assert sent == list(range(per_writer))
@@ -0,0 +1,77 @@
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+import calendar_tools
+import outbox
+import tool_executor
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Records each PATCH the outbox sends, one at a time in staging order."""
+    patches = []
+
+    def apply(event_id, fields, add_attendees=None, remove_attendees=None, calendar=None):
+        if event_id == "broken":
+            raise Exception("Failed to update event: locked")
+        patches.append((event_id, fields, add_attendees, remove_attendees, calendar))
+
+    monkeypatch.setattr(calendar_tools, "_apply_event_changes", apply)
+    monkeypatch.setattr(tool_executor, "TOOL_MAX_WORKERS", 1)
+    monkeypatch.setattr(outbox, "COALESCE_WRITES", True)
+    yield patches
+    outbox._current_outbox.set(None)
+
+def test_changes_to_one_event_are_merged(sent):
+    pending = outbox.Outbox()
+    first = pending.stage("E1", add_attendees=["ann@example.com"])
+    second = pending.stage("E1", fields={"location": {"displayName": "Room 4"}}, add_attendees=["bob@example.com"])
+    flushed = pending.flush()
+
+    assert sent == [("E1", {"location": {"displayName": "Room 4"}}, ["ann@example.com", "bob@example.com"], [], None)]
+    assert flushed[first] == flushed[second] == "✅ Event updated successfully (attendees, location; 2 change(s) sent as one update)."
+
+def test_events_are_flushed_in_staging_order_and_failures_stay_per_event(sent):
+    pending = outbox.Outbox()
+    pending.stage("E2", fields={"subject": "Retro"}, calendar="team@example.com")
+    broken = pending.stage("broken", fields={"subject": "Planning"})
+    pending.stage("E1", fields={"subject": "Standup"})
+    flushed = pending.flush()
+
+    assert [event_id for event_id, *_ in sent] == ["E2", "E1"]
+    assert sent[0][4] == "team@example.com"
+    assert flushed[broken] == "❌ Failed to update event: locked"
+    assert pending.flush() == {}
+
+def test_discarded_changes_are_not_sent(sent):
+    pending = outbox.Outbox()
+    ticket = pending.stage("E1", fields={"subject": "Standup"})
+    pending.discard("E1", "Event was deleted, so this change was not sent.")
+    assert pending.flush() == {}
+    assert sent == []
+    assert pending.result(ticket) == "Event was deleted, so this change was not sent."
+
+def test_conflict_is_the_tool_result_and_earlier_changes_are_kept(sent):
+    pending = outbox.begin_turn()
+    queued = calendar_tools._stage_or_apply("E1", "Location change", fields={"location": {"displayName": "Room 4"}})
+    conflict = calendar_tools._stage_or_apply("E1", "Location change", fields={"location": {"displayName": "Room 9"}})
+    assert queued.startswith("⏳ Location change queued [outbox:1]")
+    assert conflict.startswith("❌ Conflicting changes to event E1: 'location' was already changed to")
+    outbox.end_turn()
+    assert sent == [("E1", {"location": {"displayName": "Room 4"}}, [], [], None)]
+    assert pending.result(1).startswith("✅ Event updated successfully")
+
+def test_middleware_rewrites_queued_results_with_the_outcome(sent):
+    pending = outbox.begin_turn()
+    ticket = pending.stage("E1", fields={"subject": "Standup"})
+    state = {"messages": [
+        AIMessage(content="", tool_calls=[{"name": "update_event", "args": {}, "id": "call-1"}]),
+        ToolMessage(content=outbox.queued_message(ticket, "Event update"), tool_call_id="call-1", name="update_event", id="msg-1"),
+        ToolMessage(content="Found 0 event(s).", tool_call_id="call-2", name="get_events", id="msg-2"),
+    ]}
+
+    update = outbox.outbox_middleware().before_model(state, None)
+    assert sent == [("E1", {"subject": "Standup"}, [], [], None)]
+    [message] = update["messages"]
+    assert (message.id, message.tool_call_id, message.name) == ("msg-1", "call-1", "update_event")
+    assert message.content == "✅ Event updated successfully (subject; 1 change(s) sent as one update)."
+    # The outcome is handed out once
+    assert outbox.outbox_middleware().before_model(state, None) is None
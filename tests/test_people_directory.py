@@ -0,0 +1,53 @@
+import time
+import pytest
+import people_directory
+import calendar_tools
+import prefetch
+from graph_api_auth import set_current_user
+
+@pytest.fixture(autouse=True)
+def directory(request, monkeypatch):
+    set_current_user(f"test:{request.node.name}")
+    monkeypatch.setattr(prefetch, "attendees", lambda: {})
+    directory = people_directory._directory()
+    directory.loaded_at = time.time()
+    directory.add("jon.smith@example.com", "Jon Smith", weight=5)
+    directory.add("jonathan.doe@example.com", "Jonathan Doe", weight=9)
+    directory.add("maria.garcia@example.com", "Maria Garcia")
+    directory.add("mary.jones@example.com", "Mary Jones")
+    return directory
+
+def test_full_name_and_whole_words_resolve():
+    assert people_directory.resolve("Jon Smith") == "jon.smith@example.com"
+    assert people_directory.resolve("jon") == "jon.smith@example.com"
+    assert people_directory.resolve("Garcia") == "maria.garcia@example.com"
+    assert people_directory.resolve("someone@example.com") == "someone@example.com"
+
+def test_word_prefix_is_only_a_candidate():
+    with pytest.raises(Exception, match="could be several people: Jonathan Doe .*Jon Smith"):
+        people_directory.resolve("J")
+    with pytest.raises(Exception, match="only partly matches Maria Garcia <maria.garcia@example.com>"):
+        people_directory.resolve("Mari")
+
+def test_typo_is_only_a_candidate():
+    with pytest.raises(Exception, match="only partly matches Maria Garcia"):
+        people_directory.resolve("Maria Garcai")
+
+def test_same_name_outside_the_top_matches_is_ambiguous(directory):
+    for i in range(5):
+        directory.add(f"jonas{i}@example.com", f"Jonas {i}", weight=20)
+    directory.add("jon.baker@example.com", "Jon Baker")
+    with pytest.raises(Exception, match="could be several people"):
+        people_directory.resolve("Jon")
+
+def test_unknown_name():
+    with pytest.raises(Exception, match="No email address known for 'Zed'"):
+        people_directory.resolve("Zed")
+
+def test_unresolved_names_are_the_tool_result(monkeypatch):
+    monkeypatch.setattr(calendar_tools, "get_access_token", lambda: pytest.fail("nothing may be sent"))
+    result = calendar_tools.create_calendar_event("Sync", "2025-01-06T09:00:00", "2025-01-06T09:30:00", ["Maria", "J", "Zed"])
+    assert result == (
+        "'J' could be several people: Jonathan Doe <jonathan.doe@example.com>, Jon Smith <jon.smith@example.com>, Mary Jones <mary.jones@example.com>. Please say which one. "
+        "No email address known for 'Zed'. Please give their email address. The event was not created."
+    )
@@ -0,0 +1,146 @@
+import json
+import threading
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+import planner
+
+calls = []
+# s2 and s3 only get past this when they run in the same wave
+same_wave = threading.Barrier(2, timeout=2)
+
+LISTING = "Found 1 event(s).\n\n📅 Standup\n   Handle: E3\n   Start: 2025-01-23T09:00:00\n   End: 2025-01-23T09:15:00\n"
+
+@tool
+def find_event(subject: str):
+    """Finds events by subject."""
+    calls.append(("find_event", subject))
+    if subject == "missing":
+        raise Exception("Failed to find event: HTTP 503")
+    if subject == "sync":
+        return LISTING + "\n📅 Sync\n   Handle: E4\n   Start: 2025-01-23T10:00:00\n   End: 2025-01-23T10:30:00\n"
+    return LISTING
+
+@tool
+def update_event(event_id: str, new_start_time: str = None, new_end_time: str = None):
+    """Updates an event."""
+    calls.append(("update_event", event_id, new_start_time, new_end_time))
+    return f"✅ Updated {event_id}."
+
+@tool
+def add_attendees(event_id: str, attendee_emails: list):
+    """Adds attendees."""
+    same_wave.wait()
+    calls.append(("add_attendees", event_id, attendee_emails))
+    return f"✅ Added attendees to {event_id}."
+
+@tool
+def move_event(event_id: str):
+    """Moves an event."""
+    same_wave.wait()
+    calls.append(("move_event", event_id))
+    return f"✅ Moved {event_id}."
+
+@tool
+def delete_events(event_ids: list):
+    """Deletes events."""
+    calls.append(("delete_events", event_ids))
+    return f"✅ Deleted {len(event_ids)} event(s)."
+
+TOOLS = [find_event, update_event, add_attendees, move_event, delete_events]
+
+class ScriptedPlanner:
+    """Stands in for a chat model's structured output; returns the next scripted plan and keeps the prompts."""
+
+    def __init__(self, *plans):
+        self.plans = list(plans)
+        self.prompts = []
+
+    def with_structured_output(self, schema, include_raw=False):
+        def answer(messages):
+            self.prompts.append(messages)
+            return {"raw": None, "parsed": self.plans.pop(0), "parsing_error": None}
+        return RunnableLambda(answer)
+
+class StubAgent:
+    def __init__(self):
+        self.invoked = 0
+
+    def invoke(self, input, config=None):
+        self.invoked += 1
+        return {"messages": list(input["messages"]) + [AIMessage(content="Handled by the agent.")]}
+
+def plan(*steps, **fields):
+    return planner.Plan(steps=[
+        planner.PlanStep(id=step_id, tool=name, arguments=json.dumps(arguments), depends_on=list(depends_on))
+        for step_id, name, arguments, *depends_on in steps
+    ], **fields)
+
+def run(model, request="Find the standup, add Sarah and move it", agent=None):
+    calls.clear()
+    planning = planner.PlanningAgent(model, TOOLS, agent or StubAgent(), mode="auto")
+    return planning.invoke({"messages": [HumanMessage(content=request)]})
+
+def test_looks_compound():
+    assert planner.looks_compound("Find the standup, add Sarah and move it to 3pm")
+    assert not planner.looks_compound("What's on my calendar today?")
+    assert not planner.looks_compound("Show me today, then show tomorrow")
+
+def test_simple_request_goes_to_the_agent():
+    agent = StubAgent()
+    model = ScriptedPlanner()
+    result = run(model, "What's on my calendar today?", agent)
+    assert result["mode"] == "agent" and result["llm_calls"] == 1
+    assert agent.invoked == 1 and model.prompts == []
+
+def test_steps_run_in_dependency_waves():
+    result = run(ScriptedPlanner(plan(
+        ("s1", "find_event", {"subject": "standup"}),
+        ("s2", "add_attendees", {"event_id": "{s1.event}", "attendee_emails": ["sarah@example.com"]}),
+        ("s3", "move_event", {"event_id": "{s1.event}"}),
+    )))
+    assert calls[0] == ("find_event", "standup")
+    assert sorted(calls[1:]) == [("add_attendees", "E3", ["sarah@example.com"]), ("move_event", "E3")]
+    assert result["mode"] == "planner" and result["llm_calls"] == 1
+    # The listing only fed the later steps, so the answer shows what they did
+    assert result["messages"][-1].content == "✅ Added attendees to E3.\n\n✅ Moved E3."
+
+def test_references_are_substituted():
+    run(ScriptedPlanner(plan(
+        ("s1", "find_event", {"subject": "standup"}),
+        ("s2", "find_event", {"subject": "sync"}),
+        ("s3", "update_event", {"event_id": "{s1.event}", "new_start_time": "{s1.start+30m}", "new_end_time": "{s1.end+1h}"}),
+        ("s4", "delete_events", {"event_ids": "{s2.events}"}),
+    )))
+    assert ("update_event", "E3", "2025-01-23T09:30:00", "2025-01-23T10:15:00") in calls
+    assert ("delete_events", ["E3", "E4"]) in calls
+
+def test_failed_step_is_replanned_by_the_strong_model():
+    model = ScriptedPlanner(
+        plan(("s1", "find_event", {"subject": "missing"}), ("s2", "move_event", {"event_id": "{s1.event}"})),
+        plan(("s3", "find_event", {"subject": "standup"}), ("s4", "update_event", {"event_id": "{s3.event}"})),
+    )
+    result = run(model)
+    replan = model.prompts[1][-1][1]
+    assert "s1 (find_event) failed: Failed to find event: HTTP 503" in replan
+    assert "Not run: s2 (move_event)" in replan and "number new steps from s3" in replan
+    assert calls[-1] == ("update_event", "E3", None, None)
+    assert result["llm_calls"] == 2 and result["messages"][-1].content == "✅ Updated E3."
+
+def test_ambiguous_reference_is_replanned():
+    model = ScriptedPlanner(
+        plan(("s1", "find_event", {"subject": "sync"}), ("s2", "update_event", {"event_id": "{s1.event}"})),
+        plan(question="Which one: the standup (E3) or the sync (E4)?"),
+    )
+    result = run(model)
+    assert "s2 (update_event) s1 found 2 events (E3, E4)" in model.prompts[1][-1][1]
+    assert result["messages"][-1].content.endswith("Which one: the standup (E3) or the sync (E4)?")
+    assert not [call for call in calls if call[0] == "update_event"]
+
+def test_replans_stop_at_the_cap(monkeypatch):
+    monkeypatch.setattr(planner, "PLANNER_MAX_REPLANS", 1)
+    failing = plan(("s1", "find_event", {"subject": "missing"}))
+    model = ScriptedPlanner(failing, failing, failing)
+    result = run(model)
+    assert len(model.prompts) == 2 and result["llm_calls"] == 2
+    assert result["messages"][-1].content == "❌ s1 (find_event) failed: Failed to find event: HTTP 503"
@@ -0,0 +1,102 @@
+import datetime
+import time
+import pytest
+import calendar_tools
+import graph_api_auth
+import prefetch
+import response_cache
+
+TODAY = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def at(days, hour):
+    return (TODAY + datetime.timedelta(days=days, hours=hour)).strftime("%Y-%m-%dT%H:%M:%S.0000000")
+
+def event(subject, days, hour, *attendees):
+    return {
+        "id": subject, "subject": subject,
+        "start": {"dateTime": at(days, hour)}, "end": {"dateTime": at(days, hour + 1)},
+        "attendees": [{"emailAddress": {"address": address, "name": address.split("@")[0].title()}} for address in attendees],
+    }
+
+def window(days_from, days_to):
+    return {"start": at(days_from, 0)[:19], "end": at(days_to, 0)[:19]}
+
+def wait_until(condition):
+    deadline = time.time() + 2
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """The events Graph returns for the warm window, and the users each fetch was made for."""
+    state = {"events": [], "fetched": [], "signed_in": True}
+
+    def calendar_view(time_window, access_token, calendar=None):
+        state["fetched"].append(graph_api_auth.get_current_user())
+        return list(state["events"])
+
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    monkeypatch.setattr(prefetch, "_windows", {})
+    monkeypatch.setattr(prefetch, "_stats", dict.fromkeys(prefetch._stats, 0))
+    monkeypatch.setattr(prefetch, "get_cached_token", lambda client_id, tenant_id, user_key: "token" if state["signed_in"] else None)
+    monkeypatch.setattr(calendar_tools, "_calendar_view", calendar_view)
+    yield state
+    for warm in prefetch._windows.values():
+        warm["last_used"] = 0
+        warm["refresh"].set()
+    graph_api_auth.set_current_user(None)
+
+def warm(user_key):
+    prefetch.start("client", "tenant", user_key)
+    wait_until(lambda: prefetch._windows[user_key]["snapshot"])
+    graph_api_auth.set_current_user(user_key)
+
+def test_warm_window_serves_lookups_and_attendees(calendar):
+    calendar["events"].extend([event("Standup", 1, 9, "ann@example.com"), event("Review", 3, 14, "ann@example.com", "bob@example.com")])
+    warm("prefetch-ann")
+    assert calendar["fetched"] == ["prefetch-ann"]
+
+    assert [e["subject"] for e in prefetch.lookup(window(1, 2))] == ["Standup"]
+    assert prefetch.attendees() == {"ann@example.com": {"name": "Ann", "meetings": 2}, "bob@example.com": {"name": "Bob", "meetings": 1}}
+    # Outside the prefetched days, reads go to Graph
+    assert prefetch.lookup(window(1, prefetch.PREFETCH_DAYS + 3)) is None
+    stats = prefetch.stats()
+    assert (stats["hits"], stats["misses"], stats["warm_users"]) == (1, 1, 1)
+
+def test_other_users_are_not_served_from_this_window(calendar):
+    calendar["events"].append(event("Standup", 1, 9))
+    warm("prefetch-ann")
+    graph_api_auth.set_current_user("prefetch-bob")
+    assert prefetch.lookup(window(1, 2)) is None and prefetch.attendees() == {}
+
+def test_change_drops_the_snapshot_and_refetches(calendar):
+    calendar["events"].append(event("Standup", 1, 9))
+    warm("prefetch-ann")
+    calendar["events"].append(event("Planning", 1, 13))
+    response_cache.mark_changed("prefetch-ann", "Planning")
+    wait_until(lambda: len(calendar["fetched"]) == 2 and prefetch._windows["prefetch-ann"]["snapshot"])
+    assert [e["subject"] for e in prefetch.lookup(window(1, 2))] == ["Standup", "Planning"]
+
+def test_stale_snapshot_is_not_served(calendar, monkeypatch):
+    warm("prefetch-ann")
+    monkeypatch.setattr(prefetch, "PREFETCH_MAX_STALENESS", 60)
+    prefetch._windows["prefetch-ann"]["snapshot"]["fetched_at"] -= 61
+    assert prefetch.lookup(window(1, 2)) is None
+
+def test_signed_out_user_gets_no_window(calendar):
+    calendar["signed_in"] = False
+    prefetch.start("client", "tenant", "prefetch-ann")
+    wait_until(lambda: prefetch.stats()["fetches"] == 1)
+    graph_api_auth.set_current_user("prefetch-ann")
+    assert prefetch.lookup(window(1, 2)) is None and calendar["fetched"] == []
+
+def test_least_recently_used_window_is_dropped_at_the_user_cap(calendar, monkeypatch):
+    monkeypatch.setattr(prefetch, "PREFETCH_MAX_USERS", 2)
+    warm("prefetch-ann")
+    warm("prefetch-bob")
+    # Ann reads again, so Bob's window is the least recently used
+    graph_api_auth.set_current_user("prefetch-ann")
+    prefetch.lookup(window(1, 2))
+    warm("prefetch-cat")
+    assert sorted(prefetch._windows) == ["prefetch-ann", "prefetch-cat"]
@@ -0,0 +1,95 @@
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Optional
+import pytest
+from langchain_core.tools import tool
+import model_router
+import prompt_cache
+
+@tool
+def get_events(day: str):
+    """Gets the events of a day. Parameters: day (YYYY-MM-DD)."""
+    return ""
+
+@dataclass
+class StubModel:
+    model: str
+    cached_content: Optional[str] = None
+
+    def model_copy(self, update):
+        return replace(self, **update)
+
+@dataclass
+class StubRequest:
+    model: Any
+    tools: Any
+    system_prompt: Optional[str]
+
+    def override(self, **changes):
+        return replace(self, **changes)
+
+class RecordingCache(prompt_cache.ContextCache):
+    def __init__(self):
+        self.made_for = []
+        super().__init__(create=self._create, extend=lambda name, ttl: None, delete=lambda name: None)
+
+    def _create(self, model, system_prompt, tool_declarations, ttl):
+        self.made_for.append(model)
+        return f"cachedContents/{model}"
+
+def call(middleware, model_name):
+    request = StubRequest(model=StubModel(model_name), tools=[get_events], system_prompt="You manage calendars.")
+    return middleware.wrap_model_call(request, lambda sent: sent)
+
+@pytest.fixture
+def tiers(monkeypatch):
+    monkeypatch.setattr(model_router, "MODEL_ROUTING", True)
+    monkeypatch.setattr(model_router, "FAST_MODEL", "gemini-fast")
+    monkeypatch.setattr(model_router, "STRONG_MODEL", "gemini-strong")
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_MODEL", "gemini-strong-001")
+
+def test_each_tier_is_served_by_a_cache_for_its_own_model(tiers):
+    cache = RecordingCache()
+    middleware = prompt_cache.prompt_cache_middleware(context_cache=cache, mode="auto")
+    fast = call(middleware, "gemini-fast")
+    strong = call(middleware, "gemini-strong")
+    call(middleware, "gemini-fast")
+
+    assert fast.model == StubModel("gemini-fast", "cachedContents/gemini-fast")
+    assert strong.model == StubModel("gemini-strong", "cachedContents/gemini-strong")
+    assert fast.tools == [] and fast.system_prompt is None
+    assert cache.made_for == ["gemini-fast", "gemini-strong"]
+
+def test_prompt_cache_model_applies_without_tiers(tiers, monkeypatch):
+    monkeypatch.setattr(model_router, "MODEL_ROUTING", False)
+    cache = RecordingCache()
+    sent = call(prompt_cache.prompt_cache_middleware(context_cache=cache, mode="auto"), "gemini-strong")
+    assert sent.model == StubModel("gemini-strong-001", "cachedContents/gemini-strong-001")
+
+def test_slow_create_holds_up_neither_other_models_nor_a_second_create():
+    creating, release = threading.Event(), threading.Event()
+    made = []
+
+    def create(model, system_prompt, tool_declarations, ttl):
+        made.append(model)
+        if model == "gemini-slow":
+            creating.set()
+            release.wait(5)
+        return f"cachedContents/{model}"
+
+    cache = prompt_cache.ContextCache(create=create, extend=lambda name, ttl: None, delete=lambda name: None)
+    names = []
+    slow = [threading.Thread(target=lambda: names.append(cache.name("gemini-slow", "You manage calendars.", []))) for _ in range(3)]
+    for thread in slow:
+        thread.start()
+    creating.wait(2)
+    # While the slow cache is being created, another model gets its own right away
+    started = time.time()
+    assert cache.name("gemini-fast", "You manage calendars.", []) == "cachedContents/gemini-fast"
+    assert time.time() - started < 1
+    release.set()
+    for thread in slow:
+        thread.join()
+    assert names == ["cachedContents/gemini-slow"] * 3
+    assert made.count("gemini-slow") == 1
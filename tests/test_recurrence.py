@@ -0,0 +1,183 @@
+import calendar
+import datetime
+from zoneinfo import ZoneInfo
+import pytest
+import recurrence
+
+UTC = datetime.timezone.utc
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+def calendar_view(master, window_start, window_end):
+    """
+    Stand-in for Graph's calendarView: walks the calendar one local day at a time and keeps
+    the days the pattern matches, then returns the instances overlapping the window the way
+    calendarView does with a UTC Prefer header.
+    """
+    pattern = master["recurrence"]["pattern"]
+    series_range = master["recurrence"]["range"]
+    tz = ZoneInfo(series_range["recurrenceTimeZone"])
+    first_start = datetime.datetime.fromisoformat(master["start"]["dateTime"]).replace(tzinfo=tz)
+    duration = datetime.datetime.fromisoformat(master["end"]["dateTime"]).replace(tzinfo=tz) - first_start
+    range_start = datetime.date.fromisoformat(series_range["startDate"])
+    interval = pattern.get("interval", 1)
+    weekdays = {DAYS.index(d) for d in pattern.get("daysOfWeek", [])}
+
+    def matches(day):
+        months = (day.year - range_start.year) * 12 + day.month - range_start.month
+        last_day = calendar.monthrange(day.year, day.month)[1]
+        kind = pattern["type"]
+        if kind == "daily":
+            return (day - range_start).days % interval == 0
+        if kind == "weekly":
+            first = DAYS.index(pattern.get("firstDayOfWeek", "sunday"))
+            week_of = lambda d: d - datetime.timedelta(days=(d.weekday() - first) % 7)
+            return day.weekday() in weekdays and (week_of(day) - week_of(range_start)).days // 7 % interval == 0
+        if kind == "absoluteMonthly":
+            return months % interval == 0 and day.day == min(pattern["dayOfMonth"], last_day)
+        if kind == "relativeMonthly":
+            same = [d for d in range(1, last_day + 1) if datetime.date(day.year, day.month, d).weekday() in weekdays]
+            position = {"first": 0, "second": 1, "third": 2, "fourth": 3, "last": -1}[pattern["index"]]
+            return months % interval == 0 and day.day == same[position]
+        if kind == "absoluteYearly":
+            return day.month == pattern["month"] and day.day == min(pattern["dayOfMonth"], last_day) \
+                and (day.year - range_start.year) % interval == 0
+        raise ValueError(kind)
+
+    instances, count, day = [], 0, range_start
+    while day <= window_end.astimezone(tz).date():
+        if series_range["type"] == "endDate" and day > datetime.date.fromisoformat(series_range["endDate"]):
+            break
+        if series_range["type"] == "numbered" and count >= series_range["numberOfOccurrences"]:
+            break
+        if matches(day):
+            count += 1
+            start = datetime.datetime.combine(day, first_start.time(), tzinfo=tz)
+            if start + duration > window_start and start < window_end:
+                instances.append((start.astimezone(UTC), (start + duration).astimezone(UTC)))
+        day += datetime.timedelta(days=1)
+    return instances
+
+def series(pattern, start, end, series_range, zone="W. Europe Standard Time", iana="Europe/Berlin"):
+    return {
+        "id": "M1",
+        "subject": "Series",
+        "type": "seriesMaster",
+        "start": {"dateTime": start, "timeZone": zone},
+        "end": {"dateTime": end, "timeZone": zone},
+        "recurrence": {"pattern": pattern, "range": {"recurrenceTimeZone": iana, **series_range}},
+    }
+
+def expanded(master, window_start, window_end):
+    instances = recurrence.expand_series(master, window_start, window_end)
+    for instance in instances:
+        assert instance["type"] == "occurrence"
+        assert instance["seriesMasterId"] == master["id"]
+        assert instance["start"]["timeZone"] == "UTC"
+        assert "recurrence" not in instance
+    return [
+        (recurrence.parse_datetime(i["start"]["dateTime"]), recurrence.parse_datetime(i["end"]["dateTime"]))
+        for i in instances
+    ]
+
+def window(start, end):
+    return datetime.datetime.fromisoformat(start).replace(tzinfo=UTC), datetime.datetime.fromisoformat(end).replace(tzinfo=UTC)
+
+CASES = {
+    "weekly across DST": (
+        series({"type": "weekly", "interval": 1, "daysOfWeek": ["monday", "thursday"], "firstDayOfWeek": "sunday"},
+               "2025-03-03T09:00:00", "2025-03-03T09:30:00", {"type": "noEnd", "startDate": "2025-03-03"}),
+        window("2025-03-01T00:00:00", "2025-04-15T00:00:00"),
+    ),
+    "biweekly": (
+        series({"type": "weekly", "interval": 2, "daysOfWeek": ["tuesday"], "firstDayOfWeek": "monday"},
+               "2025-01-07T14:00:00", "2025-01-07T15:00:00", {"type": "noEnd", "startDate": "2025-01-07"}),
+        window("2025-01-01T00:00:00", "2025-04-01T00:00:00"),
+    ),
+    "relativeMonthly last friday": (
+        series({"type": "relativeMonthly", "interval": 1, "daysOfWeek": ["friday"], "index": "last"},
+               "2025-01-31T16:00:00", "2025-01-31T17:00:00", {"type": "noEnd", "startDate": "2025-01-31"}),
+        window("2025-01-01T00:00:00", "2025-12-31T00:00:00"),
+    ),
+    "absoluteMonthly day 31": (
+        series({"type": "absoluteMonthly", "interval": 1, "dayOfMonth": 31},
+               "2025-01-31T10:00:00", "2025-01-31T11:00:00", {"type": "noEnd", "startDate": "2025-01-31"}),
+        window("2025-01-01T00:00:00", "2026-01-01T00:00:00"),
+    ),
+    "numbered range": (
+        series({"type": "daily", "interval": 3},
+               "2025-05-01T08:00:00", "2025-05-01T08:15:00", {"type": "numbered", "startDate": "2025-05-01", "numberOfOccurrences": 5}),
+        window("2025-04-01T00:00:00", "2025-07-01T00:00:00"),
+    ),
+    "endDate range": (
+        series({"type": "weekly", "interval": 1, "daysOfWeek": ["wednesday"], "firstDayOfWeek": "sunday"},
+               "2025-06-04T12:00:00", "2025-06-04T13:00:00", {"type": "endDate", "startDate": "2025-06-04", "endDate": "2025-06-25"}),
+        window("2025-06-01T00:00:00", "2025-08-01T00:00:00"),
+    ),
+    "yearly Feb 29": (
+        series({"type": "absoluteYearly", "interval": 1, "dayOfMonth": 29, "month": 2},
+               "2024-02-29T09:00:00", "2024-02-29T10:00:00", {"type": "noEnd", "startDate": "2024-02-29"}),
+        window("2024-01-01T00:00:00", "2029-01-01T00:00:00"),
+    ),
+    "new york series across DST": (
+        series({"type": "daily", "interval": 1},
+               "2025-11-01T23:30:00", "2025-11-02T00:30:00", {"type": "numbered", "startDate": "2025-11-01", "numberOfOccurrences": 4},
+               zone="Eastern Standard Time", iana="America/New_York"),
+        window("2025-10-30T00:00:00", "2025-11-10T00:00:00"),
+    ),
+}
+
+@pytest.mark.parametrize("name", CASES)
+def test_matches_calendar_view(name):
+    master, (start, end) = CASES[name]
+    reference = calendar_view(master, start, end)
+    assert reference
+    assert expanded(master, start, end) == reference
+
+def test_weekly_keeps_local_time_across_dst():
+    master, (start, end) = CASES["weekly across DST"]
+    hours = {s.date().isoformat(): s.hour for s, _ in expanded(master, start, end)}
+    # Berlin moves to summer time on 2025-03-30: 09:00 local is 08:00 UTC before, 07:00 after
+    assert hours["2025-03-27"] == 8
+    assert hours["2025-03-31"] == 7
+
+def test_relative_monthly_last():
+    master, (start, end) = CASES["relativeMonthly last friday"]
+    days = [s.date().isoformat() for s, _ in expanded(master, start, end)]
+    assert days[:3] == ["2025-01-31", "2025-02-28", "2025-03-28"]
+    assert "2025-05-30" in days and len(days) == 12
+
+def test_absolute_monthly_day_31_uses_last_day_of_short_months():
+    master, (start, end) = CASES["absoluteMonthly day 31"]
+    days = [s.date().isoformat() for s, _ in expanded(master, start, end)]
+    assert len(days) == 12
+    assert days[1] == "2025-02-28" and days[3] == "2025-04-30"
+
+def test_numbered_and_end_date_ranges_stop():
+    master, (start, end) = CASES["numbered range"]
+    assert [s.day for s, _ in expanded(master, start, end)] == [1, 4, 7, 10, 13]
+    master, (start, end) = CASES["endDate range"]
+    assert [s.day for s, _ in expanded(master, start, end)] == [4, 11, 18, 25]
+
+def test_yearly_feb_29():
+    master, (start, end) = CASES["yearly Feb 29"]
+    days = [s.date().isoformat() for s, _ in expanded(master, start, end)]
+    assert days == ["2024-02-29", "2025-02-28", "2026-02-28", "2027-02-28", "2028-02-29"]
+
+def test_window_clips_occurrences():
+    master, _ = CASES["weekly across DST"]
+    start, end = window("2025-03-10T08:15:00", "2025-03-13T08:00:00")
+    # The Monday instance (08:00-08:30 UTC) overlaps the start; Thursday's starts at the end and is left out
+    assert [s.day for s, _ in expanded(master, start, end)] == [10]
+
+def test_expand_window_merges_single_events_and_sorts():
+    master, _ = CASES["weekly across DST"]
+    single = {
+        "id": "S1", "type": "singleInstance",
+        "start": {"dateTime": "2025-03-04T12:00:00.0000000", "timeZone": "UTC"},
+        "end": {"dateTime": "2025-03-04T13:00:00.0000000", "timeZone": "UTC"},
+    }
+    outside = dict(single, id="S2", start={"dateTime": "2025-05-01T12:00:00", "timeZone": "UTC"},
+                   end={"dateTime": "2025-05-01T13:00:00", "timeZone": "UTC"})
+    start, end = window("2025-03-03T00:00:00", "2025-03-08T00:00:00")
+    events = recurrence.expand_window([outside, master, single], start, end)
+    assert [e["id"] or e["seriesMasterId"] for e in events] == ["M1", "S1", "M1"]
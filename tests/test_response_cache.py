@@ -0,0 +1,62 @@
+import pytest
+import response_cache
+import calendar_tools
+import event_handles
+from graph_api_auth import set_current_user
+from state_backend import get_backend
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
+def test_follow_up_is_keyed_on_the_previous_turns():
+    version = response_cache.snapshot_version()
+    monday = [("user", "What's on Monday?"), ("assistant", "Standup at 9.")]
+    friday = [("user", "What's on Friday?"), ("assistant", "Nothing.")]
+    response_cache.put_answer("what about the afternoon?", "Design review at 2.", 1.0, version, monday)
+
+    assert response_cache.get_answer("What about the afternoon?", monday) == "Design review at 2."
+    assert response_cache.get_answer("what about the afternoon?", friday) is None
+    assert response_cache.get_answer("what about the afternoon?") is None
+
+def test_only_recent_messages_count(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_CONTEXT", 2)
+    version = response_cache.snapshot_version()
+    recent = [("user", "Show today"), ("assistant", "Two meetings.")]
+    response_cache.put_answer("list them", "Standup, 1:1.", 1.0, version, [("user", "hi"), ("assistant", "Hello!")] + recent)
+    assert response_cache.get_answer("list them", [("user", "earlier"), ("assistant", "...")] + recent) == "Standup, 1:1."
+
+def test_change_requests_and_stale_versions_are_not_cached():
+    version = response_cache.snapshot_version()
+    response_cache.put_answer("cancel the standup", "Cancelled.", 1.0, version)
+    assert response_cache.get_answer("cancel the standup") is None
+    response_cache.mark_changed()
+    response_cache.put_answer("what's on today?", "Standup.", 1.0, version)
+    assert response_cache.get_answer("what's on today?") is None
+
+def test_self_contained_prompt_hits_later_in_the_chat():
+    version = response_cache.snapshot_version()
+    response_cache.put_answer("What's on today?", "Standup at 9.", 1.0, version, [("user", "hi"), ("assistant", "Hello!")])
+    later = [("user", "What's on Friday?"), ("assistant", "Nothing.")]
+    assert response_cache.get_answer("what's on today", later) == "Standup at 9."
+
+def test_cached_listing_still_registers_its_handles(monkeypatch, request):
+    set_current_user(f"test:{request.node.name}")
+    calls = []
+
+    def calendar_view(time_window, access_token, calendar=None):
+        calls.append(time_window)
+        return [{"id": "id-standup", "subject": "Standup", "start": {"dateTime": "2025-01-23T09:00:00"}, "end": {"dateTime": "2025-01-23T09:15:00"}}]
+
+    monkeypatch.setattr(calendar_tools, "get_access_token", lambda: "token")
+    monkeypatch.setattr(calendar_tools, "_calendar_view", calendar_view)
+    window = {"start": "2030-01-23T00:00:00", "end": "2030-01-24T00:00:00"}
+    first = calendar_tools.get_all_events(window, True, "team@example.com")
+
+    # The handles are gone, e.g. expired, while the cached events are still fresh
+    get_backend().delete("handles", event_handles._key())
+    assert calendar_tools.get_all_events(window, True, "team@example.com") == first
+    assert len(calls) == 1
+    assert event_handles.resolve("E1") == ("id-standup", "team@example.com")
@@ -0,0 +1,43 @@
+import pytest
+import state_backend
+
+class Incomplete(state_backend.StateBackend):
+    """Forgot append, length and range."""
+
+    def get(self, namespace, key):
+        return None
+
+    def put(self, namespace, key, value, ttl=None):
+        pass
+
+    def delete(self, namespace, key):
+        pass
+
+class NotABackend:
+    pass
+
+@pytest.fixture
+def plugged(monkeypatch):
+    def plug(name):
+        monkeypatch.setattr(state_backend, "STATE_BACKEND", f"{__name__}:{name}")
+        monkeypatch.setattr(state_backend, "_backend", None)
+        return state_backend.get_backend()
+    return plug
+
+def test_missing_method_fails_when_created(plugged):
+    with pytest.raises(TypeError, match="append"):
+        plugged("Incomplete")
+
+def test_class_must_subclass_state_backend(plugged):
+    with pytest.raises(Exception, match="must be a subclass of state_backend.StateBackend"):
+        plugged("NotABackend")
+
+def test_file_backend_round_trip(tmp_path):
+    backend = state_backend.FileBackend(str(tmp_path))
+    backend.put("chat", "user1", "hello")
+    assert backend.get("chat", "user1") == "hello"
+    assert [backend.append("chat", "log", {"n": n}) for n in range(3)] == [0, 1, 2]
+    assert backend.length("chat", "log") == 3
+    assert backend.range("chat", "log", 1, 3) == [{"n": 1}, {"n": 2}]
+    backend.delete("chat", "log")
+    assert backend.length("chat", "log") == 0
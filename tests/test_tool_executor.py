@@ -0,0 +1,100 @@
+import time
+import threading
+from typing import Any, List
+from langchain.agents import create_agent
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+import tool_executor
+
+log = []
+
+@tool_executor.serialized("event_id")
+def _mutate(event_id, action):
+    log.append(f"{action} {event_id} start")
+    time.sleep(0.05)
+    log.append(f"{action} {event_id} end")
+    return f"{action}d"
+
+def update_event(event_id, setup_seconds=0.0):
+    # Stands in for the work a tool does before it reaches the serialized write, e.g. resolving a handle
+    time.sleep(setup_seconds)
+    return _mutate(event_id, "update")
+
+def delete_event(event_id, setup_seconds=0.0):
+    time.sleep(setup_seconds)
+    return _mutate(event_id, "delete")
+
+def test_same_key_calls_run_in_emission_order():
+    log.clear()
+    results = tool_executor.run_parallel([
+        (update_event, ("E3", 0.2), {}),
+        (delete_event, ("E3",), {}),
+    ])
+    assert results == ["updated", "deleted"]
+    assert log == ["update E3 start", "update E3 end", "delete E3 start", "delete E3 end"]
+
+def test_other_keys_do_not_wait():
+    log.clear()
+    started = time.time()
+    tool_executor.run_parallel([
+        (update_event, ("E1",), {}),
+        (update_event, ("E2",), {}),
+        (delete_event, ("E3",), {}),
+    ])
+    assert time.time() - started < 0.14
+    assert log.index("delete E3 start") < log.index("update E1 end")
+
+def test_queues_are_cleaned_up():
+    tool_executor.run_parallel([(update_event, ("E7",), {}), (delete_event, ("E7",), {})])
+    assert ("event_id", "E7") not in tool_executor._serial_queues
+
+def test_waiting_calls_keep_arrival_order():
+    log.clear()
+    threads = []
+    for action in ("first", "second", "third"):
+        threads.append(threading.Thread(target=_mutate, args=("E9", action)))
+        threads[-1].start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert [entry for entry in log if entry.endswith("start")] == ["first E9 start", "second E9 start", "third E9 start"]
+
+@tool
+def update(event_id: str):
+    """Updates an event."""
+    return update_event(event_id, 0.2)
+
+@tool
+def delete(event_id: str):
+    """Deletes an event."""
+    return delete_event(event_id)
+
+class OneStepModel(BaseChatModel):
+    """Emits "update E3" and "delete E3" in one step, then answers."""
+
+    replies: List[Any] = []
+
+    @property
+    def _llm_type(self):
+        return "one-step"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self.replies.pop(0))])
+
+def test_agent_step_runs_same_event_calls_in_emission_order():
+    log.clear()
+    model = OneStepModel(replies=[
+        AIMessage(content="", tool_calls=[
+            {"name": "update", "args": {"event_id": "E3"}, "id": "call-1"},
+            {"name": "delete", "args": {"event_id": "E3"}, "id": "call-2"},
+        ]),
+        AIMessage(content="Done."),
+    ])
+    agent = create_agent(model, [update, delete], middleware=[tool_executor.ordered_tools_middleware()])
+    agent.invoke({"messages": [HumanMessage(content="Update then delete E3")]}, config={"max_concurrency": 4})
+    assert log == ["update E3 start", "update E3 end", "delete E3 start", "delete E3 end"]
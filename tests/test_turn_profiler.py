@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+import pytest
+import turn_profiler
+
+@pytest.fixture
+def profiles(monkeypatch, tmp_path):
+    monkeypatch.setattr(turn_profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(turn_profiler, "PROFILE_MODE", "sampling")
+    monkeypatch.setattr(turn_profiler, "PROFILE_SAMPLE_INTERVAL", 0.001)
+    return tmp_path
+
+def wait_on_graph():
+    time.sleep(0.05)
+
+def written(directory, suffix):
+    [name] = [name for name in os.listdir(directory) if name.endswith(suffix)]
+    return name, (directory / name).read_text()
+
+def test_sampler_records_stacks_and_sections(profiles):
+    with turn_profiler.profile("turn", requested=True, session="secret-session-key"):
+        wait_on_graph()
+        with turn_profiler.profile("tool"):
+            wait_on_graph()
+
+    name, collapsed = written(profiles, ".collapsed")
+    assert name.endswith("_turn+tool.collapsed")
+    assert "wait_on_graph (test_turn_profiler.py:" in collapsed
+    _, summary = written(profiles, ".txt")
+    assert summary.startswith("turn started") and "   tool: 0.0" in summary
+    # Only a digest of the session key is written
+    assert "secret-session-key" not in summary and "(session " in summary
+
+def test_sampling_ends_when_the_profiled_thread_exits(profiles):
+    started = []
+    thread = threading.Thread(target=lambda: started.append(turn_profiler.start_rerun(requested=True)) or wait_on_graph())
+    thread.start()
+    thread.join()
+    started[0].sampler.join(2)
+    assert not started[0].sampler.is_alive()
+    assert written(profiles, ".collapsed")[0].endswith("_rerun.collapsed")
+
+def test_nothing_is_profiled_unless_enabled(profiles, monkeypatch):
+    monkeypatch.setattr(turn_profiler, "PROFILE_TURNS", False)
+    with turn_profiler.profile("turn") as profile:
+        assert profile is None
+    assert os.listdir(profiles) == []
+
+def make_profiles(directory, *stamps):
+    for stamp in stamps:
+        for suffix in (".collapsed", ".txt"):
+            (directory / f"{stamp}_turn{suffix}").write_text("")
+
+def test_retention_keeps_the_newest_profiles(profiles, monkeypatch):
+    monkeypatch.setattr(turn_profiler, "PROFILE_KEEP", 2)
+    make_profiles(profiles, "20250123-090000-000001", "20250123-090000-000003", "20250123-090000-000002")
+    turn_profiler._enforce_retention()
+    # Both files of a profile go together
+    assert sorted(os.listdir(profiles)) == [
+        "20250123-090000-000002_turn.collapsed", "20250123-090000-000002_turn.txt",
+        "20250123-090000-000003_turn.collapsed", "20250123-090000-000003_turn.txt",
+    ]
+
+def test_keep_zero_keeps_every_profile(profiles, monkeypatch):
+    monkeypatch.setattr(turn_profiler, "PROFILE_KEEP", 0)
+    make_profiles(profiles, "20250123-090000-000001", "20250123-090000-000002")
+    turn_profiler._enforce_retention()
+    assert len(os.listdir(profiles)) == 4
@@ -0,0 +1,174 @@
+import os
+import inspect
+import threading
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PARALLEL_TOOLS = os.getenv("PARALLEL_TOOLS", "true").lower() == "true"
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "4"))
+
+# (arg name, value) -> {"next": next ticket, "serving": ticket allowed to run}
+_serial_queues = {}
+_serial_changed = threading.Condition()
+# Where the running call stands among the calls emitted together with it, if it was emitted in a batch
+_position = contextvars.ContextVar("tool_call_position", default=None)
+
+class _Batch:
+    """
+    Calls emitted together (one model step's tool calls, one plan wave). A call is checked
+    in once it holds its place in a serialized queue or has finished, so calls on the same
+    key queue up in emission order even when their threads start out of order.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.checked_in = set()
+        self.changed = threading.Condition()
+
+    def wait_for_earlier(self, index):
+        with self.changed:
+            self.changed.wait_for(lambda: all(i in self.checked_in for i in range(index)))
+
+    def check_in(self, index):
+        with self.changed:
+            self.checked_in.add(index)
+            self.changed.notify_all()
+        return len(self.checked_in) == self.size
+
+def _run_at(batch, index, func, *args, **kwargs):
+    token = _position.set((batch, index))
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _position.reset(token)
+        batch.check_in(index)
+
+def _take_ticket(key):
+    position = _position.get()
+    if position is not None:
+        position[0].wait_for_earlier(position[1])
+    with _serial_changed:
+        queue = _serial_queues.setdefault(key, {"next": 0, "serving": 0})
+        ticket = queue["next"]
+        queue["next"] += 1
+    if position is not None:
+        position[0].check_in(position[1])
+    return queue, ticket
+
+def _acquire(key):
+    queue, ticket = _take_ticket(key)
+    with _serial_changed:
+        _serial_changed.wait_for(lambda: queue["serving"] == ticket)
+
+def _release(key):
+    with _serial_changed:
+        queue = _serial_queues[key]
+        queue["serving"] += 1
+        if queue["serving"] == queue["next"]:
+            del _serial_queues[key]
+        _serial_changed.notify_all()
+
+def serialized(key_arg):
+    """
+    Marks a function whose calls must never overlap for the same value of key_arg.
+    All functions marked with the same key_arg share one first-in, first-out queue per
+    value, so e.g. "update E3" and "delete E3" emitted in one step run in that order while
+    other events proceed.
+    """
+    def decorator(func):
+        position = list(inspect.signature(func).parameters).index(key_arg)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if key_arg in kwargs:
+                value = kwargs[key_arg]
+            elif len(args) > position:
+                value = args[position]
+            else:
+                value = None
+            if value is None:
+                return func(*args, **kwargs)
+            key = (key_arg, value)
+            _acquire(key)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _release(key)
+        return wrapper
+    return decorator
+
+def run_parallel(calls, max_workers=None, return_exceptions=False):
+    """
+    Runs (func, args, kwargs) calls on a bounded thread pool and returns their results
+    in call order. Each call sees the caller's context (current user, turn state).
+    """
+    calls = list(calls)
+    if not calls:
+        return []
+    workers = max(1, min(max_workers or TOOL_MAX_WORKERS, len(calls)))
+
+    def run(call):
+        func, args, kwargs = call
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if return_exceptions:
+                return e
+            raise
+
+    if workers == 1:
+        return [run(call) for call in calls]
+    batch = _Batch(len(calls))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, _run_at, batch, index, run, call)
+            for index, call in enumerate(calls)
+        ]
+        return [future.result() for future in futures]
+
+def ordered_tools_middleware():
+    """
+    Agent middleware that tells serialized functions where each tool call stands among the
+    calls of its model step, so calls on the same event run in the order they were emitted.
+    """
+    from langchain.agents.middleware import AgentMiddleware
+
+    batches = {}
+    batches_lock = threading.Lock()
+
+    def position(request):
+        call_id = request.tool_call.get("id")
+        messages = request.state.get("messages", []) if isinstance(request.state, dict) else getattr(request.state, "messages", [])
+        for message in reversed(messages):
+            ids = [call.get("id") for call in getattr(message, "tool_calls", None) or []]
+            if call_id in ids:
+                key = tuple(ids)
+                with batches_lock:
+                    batch = batches.setdefault(key, _Batch(len(ids)))
+                return key, batch, ids.index(call_id)
+        return None
+
+    class OrderedToolsMiddleware(AgentMiddleware):
+        def wrap_tool_call(self, request, handler):
+            found = position(request) if request.tool_call.get("id") else None
+            if found is None:
+                return handler(request)
+            key, batch, index = found
+            token = _position.set((batch, index))
+            try:
+                return handler(request)
+            finally:
+                _position.reset(token)
+                if batch.check_in(index):
+                    with batches_lock:
+                        batches.pop(key, None)
+
+    return OrderedToolsMiddleware()
+
+def agent_config():
+    """Run config for agent.invoke; tool calls emitted in one step run up to TOOL_MAX_WORKERS at a time."""
+    return {"max_concurrency": TOOL_MAX_WORKERS if PARALLEL_TOOLS else 1}
@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import hashlib
+import pstats
+import cProfile
+import datetime
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_TURNS = os.getenv("PROFILE_TURNS", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Profiles (all files of one rerun count as one) kept before the oldest are deleted; 0 keeps all
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# "sampling" is cheap enough for production; "deterministic" adds a cProfile of the script thread
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+# cProfile hooks the whole interpreter on Python 3.12+, so only one can run at a time
+_deterministic_lock = threading.Lock()
+_retention_lock = threading.Lock()
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+class TurnProfile:
+    """
+    Samples every thread's stack while a rerun or turn runs and writes a collapsed-stack
+    file (for flamegraph.pl or speedscope) plus a text summary when it stops. Sampling ends
+    on its own when the profiled thread exits, e.g. after st.stop() or st.rerun().
+    """
+
+    def __init__(self, label, session=None):
+        self.label = label
+        # Only a digest goes into the files; the session key itself identifies whose tokens to use
+        self.session = hashlib.sha256(session.encode("utf-8")).hexdigest()[:12] if session else None
+        self.thread = threading.current_thread()
+        self.started = time.perf_counter()
+        self.started_at = datetime.datetime.now()
+        self.sections = []
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.written = False
+        self.deterministic = None
+        if PROFILE_MODE == "deterministic" and _deterministic_lock.acquire(blocking=False):
+            try:
+                self.deterministic = cProfile.Profile()
+                self.deterministic.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) owns the hook
+                self.deterministic = None
+                _deterministic_lock.release()
+        self.sampler = threading.Thread(target=self._sample, name="turn-profiler", daemon=True)
+        self.sampler.start()
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(PROFILE_SAMPLE_INTERVAL):
+            if not self.thread.is_alive():
+                break
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+        self._write()
+
+    def section(self, label, seconds):
+        self.sections.append((label, time.perf_counter() - self.started - seconds, seconds))
+
+    def stop(self):
+        if self.deterministic is not None:
+            self.deterministic.disable()
+        self.stopped.set()
+        self.sampler.join()
+
+    def _write(self):
+        if self.written:
+            return
+        self.written = True
+        elapsed = time.perf_counter() - self.started
+        if self.deterministic is not None:
+            self.deterministic.disable()
+            _deterministic_lock.release()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            label = "+".join([self.label] + sorted({label for label, _, _ in self.sections}))
+            base = os.path.join(PROFILE_DIR, f"{self.started_at:%Y%m%d-%H%M%S-%f}_{label}")
+            with open(base + ".collapsed", "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(base + ".txt", "w") as f:
+                f.write(self._summary(elapsed))
+                if self.deterministic is not None:
+                    self.deterministic.dump_stats(base + ".prof")
+                    stats = pstats.Stats(self.deterministic, stream=f)
+                    f.write("\nDeterministic profile of the script thread (top 30 by cumulative time):\n")
+                    stats.sort_stats("cumulative").print_stats(30)
+            _enforce_retention()
+        except Exception:
+            pass
+
+    def _summary(self, elapsed):
+        lines = [
+            f"{self.label} started {self.started_at:%Y-%m-%d %H:%M:%S}" + (f" (session {self.session})" if self.session else ""),
+            f"Wall time: {elapsed:.3f}s, {self.samples} samples every {PROFILE_SAMPLE_INTERVAL * 1000:.0f}ms",
+        ]
+        for label, offset, seconds in self.sections:
+            lines.append(f"   {label}: {seconds:.3f}s (from +{offset:.3f}s)")
+        # Inclusive time per function summed over threads, estimated from sample counts
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            for frame in set(stack.split(";")[1:]):
+                inclusive[frame] += count
+        lines.append("\nFunctions on the most samples (inclusive thread-seconds):")
+        for frame, count in inclusive.most_common(25):
+            lines.append(f"   {count * PROFILE_SAMPLE_INTERVAL:8.3f}s  {frame}")
+        return "\n".join(lines) + "\n"
+
+def _enforce_retention():
+    """Deletes the oldest profiles beyond PROFILE_KEEP."""
+    if PROFILE_KEEP <= 0:
+        return
+    with _retention_lock:
+        profiles = {}
+        for name in os.listdir(PROFILE_DIR):
+            profiles.setdefault(name.split("_", 1)[0], []).append(name)
+        for stamp in sorted(profiles)[:-PROFILE_KEEP]:
+            for name in profiles[stamp]:
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, name))
+                except OSError:
+                    pass
+
+def enabled(requested=False):
+    """True when PROFILE_TURNS is set or the page asked for it (?profile=1)."""
+    return PROFILE_TURNS or requested
+
+def start_rerun(requested=False, session=None):
+    """
+    Starts profiling the current script run when enabled. It is finished by finish_rerun()
+    at the end of the script, or when the script thread ends early (st.stop/st.rerun).
+    """
+    # A rerun that restarted mid-script (st.rerun) reuses the thread; close the old profile first
+    finish_rerun()
+    if not enabled(requested):
+        return None
+    profile = TurnProfile("rerun", session)
+    _current_profile.set(profile)
+    return profile
+
+def finish_rerun():
+    profile = _current_profile.get()
+    _current_profile.set(None)
+    if profile is not None:
+        profile.stop()
+
+@contextmanager
+def profile(label, requested=False, session=None):
+    """
+    Profiles a block (e.g. an agent turn). Inside a profiled rerun it is recorded as a
+    timed section of that profile instead of a profile of its own.
+    """
+    outer = _current_profile.get()
+    started = time.perf_counter()
+    if outer is not None:
+        try:
+            yield outer
+        finally:
+            outer.section(label, time.perf_counter() - started)
+        return
+    if not enabled(requested):
+        yield None
+        return
+    own = TurnProfile(label, session)
+    token = _current_profile.set(own)
+    try:
+        yield own
+    finally:
+        _current_profile.reset(token)
+        own.stop()